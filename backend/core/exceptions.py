@@ -1,3 +1,5 @@
+import re
+from typing import Optional
 from urllib.parse import urlparse
 
 
@@ -22,6 +24,27 @@ class ServiceQuotaExhaustedError(Exception):
     """
 
 
+class AlreadyArchivedError(Exception):
+    """The tweet, or another tweet with the same video, is already archived.
+
+    Not a failure: the user is pointed at the existing entry instead of paying
+    for a second analysis of it.
+    """
+
+    detail = "This video is already in the archive."
+
+    def __init__(self, video: dict):
+        self.video = video
+        super().__init__(f"Already archived as {video.get('id')}")
+
+
+class InvalidWindowError(ValueError):
+    """The requested analysis window lies outside the video.
+
+    Only knowable once the video's duration is, after the request was accepted.
+    """
+
+
 ALLOWED_DOMAINS = [
     "twitter.com",
     "x.com", 
@@ -39,3 +62,22 @@ def validate_video_url(url: str) -> bool:
         )
     except Exception:
         return False
+
+
+# /<user>/status/<id>, optionally followed by /video/1, /photo/1 and so on,
+# plus the /i/status/<id> and /i/web/status/<id> forms the apps share.
+_STATUS_PATH = re.compile(r"^/(?:i/web|[^/]+)/status(?:es)?/(\d+)")
+
+
+def extract_tweet_id(url: str) -> Optional[str]:
+    """The status ID a tweet URL points at, or None.
+
+    The same tweet arrives as x.com, twitter.com or mobile.twitter.com, with
+    or without the author's handle and ?s=20-style tracking parameters; the ID
+    is the only part that is always the same.
+    """
+    if not validate_video_url(url):
+        return None
+
+    match = _STATUS_PATH.match(urlparse(url).path)
+    return match.group(1) if match else None
@@ -1,4 +1,10 @@
+import asyncio
+import functools
+import itertools
 import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
 import google.generativeai as genai
 from dotenv import load_dotenv
 from core.logger import get_logger
@@ -10,6 +16,7 @@ load_dotenv()
 _configured = False
 
 EMBEDDING_MODEL = "models/gemini-embedding-001"
+EMBEDDING_DIMENSIONS = 768
 GENERATION_MODEL = "gemini-2.5-flash"
 
 GENERATION_CONFIG = {
@@ -48,3 +55,163 @@ def get_generation_model():
         model_name=GENERATION_MODEL,
         generation_config=GENERATION_CONFIG,
     )
+
+
+# The SDK has no async Files API, so uploads, status checks and deletes are
+# blocking HTTP calls. They run on an executor of their own: a 100 MB upload
+# must neither freeze the event loop nor starve the default executor that
+# downloads share. Generation and embedding use the SDK's async client. Both
+# kinds go through clients the SDK creates once per process, so connections
+# are reused across calls.
+GEMINI_POOL_SIZE = int(os.getenv("GEMINI_POOL_SIZE", "8"))
+
+# Upper bounds on calls in flight, per kind. Uploads are the heaviest on
+# bandwidth; generations are the ones Google rate-limits per minute.
+GEMINI_MAX_UPLOADS = int(os.getenv("GEMINI_MAX_UPLOADS", "2"))
+GEMINI_MAX_GENERATIONS = int(os.getenv("GEMINI_MAX_GENERATIONS", "4"))
+GEMINI_MAX_EMBEDDINGS = int(os.getenv("GEMINI_MAX_EMBEDDINGS", "8"))
+
+_executor = ThreadPoolExecutor(max_workers=GEMINI_POOL_SIZE, thread_name_prefix="gemini")
+
+_upload_slots = asyncio.Semaphore(GEMINI_MAX_UPLOADS)
+_generation_slots = asyncio.Semaphore(GEMINI_MAX_GENERATIONS)
+_embedding_slots = asyncio.Semaphore(GEMINI_MAX_EMBEDDINGS)
+
+
+async def _run_blocking(fn, *args, **kwargs):
+    _ensure_configured()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+
+
+async def upload_file(path: str):
+    async with _upload_slots:
+        return await _run_blocking(genai.upload_file, path=path)
+
+
+async def get_file(name: str):
+    return await _run_blocking(genai.get_file, name)
+
+
+async def delete_file(name: str) -> None:
+    await _run_blocking(genai.delete_file, name)
+
+
+# Uploaded files stay PROCESSING for a few seconds before they can be used.
+# One poller checks all of them for every analysis waiting at once: polling
+# fast at first, since short clips are ready almost immediately, then backing
+# off, and starting fast again whenever a new file joins. With several files
+# pending, one list call (a page of the newest files) replaces a get per file.
+FILE_POLL_MIN_SECONDS = 0.25
+FILE_POLL_MAX_SECONDS = 2.0
+FILE_POLL_BACKOFF = 1.5
+FILE_POLL_BATCH_THRESHOLD = 3
+FILE_LIST_PAGE_SIZE = 100
+
+
+def _list_recent_files(page_size: int) -> list:
+    # The SDK pages lazily; stopping at one page keeps this to one request.
+    return list(itertools.islice(genai.list_files(page_size=page_size), page_size))
+
+
+class FilePoller:
+
+    def __init__(self):
+        self._waiters: dict[str, list[asyncio.Future]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._joined: Optional[asyncio.Event] = None
+        self.requests = 0
+
+    async def wait(self, file, timeout: float):
+        """The file once it has left PROCESSING. Raises asyncio.TimeoutError
+        after `timeout` seconds."""
+        if file.state.name != "PROCESSING":
+            return file
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(file.name, []).append(waiter)
+        self._start()
+
+        try:
+            return await asyncio.wait_for(waiter, timeout)
+        finally:
+            waiters = self._waiters.get(file.name, [])
+            if waiter in waiters:
+                waiters.remove(waiter)
+                if not waiters:
+                    del self._waiters[file.name]
+
+    def _start(self) -> None:
+        if self._task is None or self._task.done():
+            self._joined = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+        else:
+            self._joined.set()
+
+    async def _run(self) -> None:
+        delay = FILE_POLL_MIN_SECONDS
+
+        while self._waiters:
+            try:
+                await asyncio.wait_for(self._joined.wait(), delay)
+                self._joined.clear()
+                delay = FILE_POLL_MIN_SECONDS
+            except asyncio.TimeoutError:
+                delay = min(delay * FILE_POLL_BACKOFF, FILE_POLL_MAX_SECONDS)
+
+            try:
+                files = await self._refresh(list(self._waiters))
+            except Exception as e:
+                logger.warning(f"Could not refresh file states: {e}")
+                continue
+
+            for file in files:
+                if file.state.name == "PROCESSING":
+                    continue
+                for waiter in self._waiters.pop(file.name, []):
+                    if not waiter.done():
+                        waiter.set_result(file)
+
+    async def _refresh(self, names: list[str]) -> list:
+        found = {}
+
+        if len(names) >= FILE_POLL_BATCH_THRESHOLD:
+            self.requests += 1
+            listed = await _run_blocking(_list_recent_files, FILE_LIST_PAGE_SIZE)
+            found = {file.name: file for file in listed if file.name in names}
+
+        # Not on the first page (or too few to list): one get each.
+        missing = [name for name in names if name not in found]
+        self.requests += len(missing)
+        for file in await asyncio.gather(*(get_file(name) for name in missing), return_exceptions=True):
+            if isinstance(file, Exception):
+                logger.warning(f"Could not get a file's state: {file}")
+            else:
+                found[file.name] = file
+
+        logger.debug(f"Refreshed {len(found)}/{len(names)} pending files")
+        return list(found.values())
+
+
+file_poller = FilePoller()
+
+
+async def wait_until_processed(file, timeout: float):
+    return await file_poller.wait(file, timeout)
+
+
+async def generate_content(model, contents, timeout: float):
+    """`timeout` starts once a slot is free: time spent queueing behind other
+    generations is not the model being slow."""
+    async with _generation_slots:
+        return await asyncio.wait_for(model.generate_content_async(contents), timeout=timeout)
+
+
+async def embed_content(**kwargs) -> dict:
+    _ensure_configured()
+    async with _embedding_slots:
+        return await genai.embed_content_async(**kwargs)
+
+
+def close() -> None:
+    _executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,35 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class SingleFlight:
+    """Collapses concurrent calls that share a key into one.
+
+    The first caller starts the work; everyone who arrives with the same key
+    while it is running awaits that same result, or that same exception. The
+    key is forgotten as soon as the work finishes, so this never caches: it
+    only deduplicates what is already in the air.
+    """
+
+    def __init__(self):
+        self._calls: dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        call = self._calls.get(key)
+
+        if call is None:
+            call = asyncio.ensure_future(fn())
+            self._calls[key] = call
+
+            def forget(done: asyncio.Future) -> None:
+                if self._calls.get(key) is done:
+                    del self._calls[key]
+
+            call.add_done_callback(forget)
+
+        # Shielded so that one caller giving up (a client disconnecting) does
+        # not cancel the work everyone else is waiting on.
+        return await asyncio.shield(call)
+
+    def __len__(self) -> int:
+        return len(self._calls)
@@ -1,5 +1,10 @@
+import asyncio
 import os
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
 from supabase import create_client, Client
+from supabase.lib.client_options import SyncClientOptions
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,4 +15,43 @@ key: str = os.environ.get("SUPABASE_SERVICE_KEY") or os.environ.get("SUPABASE_KE
 if not url or not key:
     raise ValueError("Supabase credentials not found in .env file")
 
-supabase: Client = create_client(url, key)
\ No newline at end of file
+# Every database call runs on this pool and nowhere else. Sharing the default
+# executor meant a burst of downloads or embedding calls could leave a search
+# queued behind them, and an unbounded number of threads could open an
+# unbounded number of connections. One thread per pooled connection keeps both
+# sides in step: a thread never waits on the pool, and a slow RPC holds exactly
+# one of each.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "16"))
+DB_TIMEOUT_SECONDS = float(os.getenv("DB_TIMEOUT_SECONDS", "15"))
+DB_KEEPALIVE_SECONDS = float(os.getenv("DB_KEEPALIVE_SECONDS", "60"))
+
+_http = httpx.Client(
+    http2=True,
+    follow_redirects=True,
+    timeout=DB_TIMEOUT_SECONDS,
+    limits=httpx.Limits(
+        max_connections=DB_POOL_SIZE,
+        max_keepalive_connections=DB_POOL_SIZE,
+        keepalive_expiry=DB_KEEPALIVE_SECONDS,
+    ),
+)
+
+_executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="db")
+
+supabase: Client = create_client(url, key, options=SyncClientOptions(httpx_client=_http))
+
+
+async def run_in_db_pool(fn, *args):
+    """Run blocking database work off the event loop, on the database pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, fn, *args)
+
+
+async def execute(query):
+    """Execute a built PostgREST query (table or rpc) without blocking the loop."""
+    return await run_in_db_pool(query.execute)
+
+
+def close() -> None:
+    _executor.shutdown(wait=False, cancel_futures=True)
+    _http.close()
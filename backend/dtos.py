@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Literal, Optional
+from typing import Dict, List, Literal, Optional
 
 MAX_TITULO_CHARS = 200
 MAX_DESCRICAO_CHARS = 5000
@@ -7,6 +7,7 @@ MAX_PESSOAS = 20
 MAX_PESSOA_DESCRICAO_CHARS = 500
 MAX_ELEMENTOS_CENARIO = 50
 MAX_TRANSCRICAO_CHARS = 5000
+MAX_BATCH_SEARCHES = 25
 
 
 class Pessoa(BaseModel):
@@ -49,6 +50,10 @@ class VideoMetadataDTO(BaseModel):
 
 SearchMode = Literal["hybrid", "semantic", "text"]
 
+# How the video reaches Gemini: the whole file, or a few keyframes (plus the
+# audio track) sent inline, which is much cheaper for visually static clips.
+AnalysisMode = Literal["video", "keyframes"]
+
 
 class SearchRequest(BaseModel):
     query: str = Field(
@@ -62,6 +67,15 @@ class SearchRequest(BaseModel):
     mode: SearchMode = Field("hybrid", description="hybrid = vector + full-text fused via RRF; semantic = vector only; text = full-text only",)
 
 
+class SearchBatchRequest(BaseModel):
+    searches: List[SearchRequest] = Field(
+        ...,
+        min_length=1,
+        max_length=MAX_BATCH_SEARCHES,
+        description="Searches to run; results come back in the same order",
+    )
+
+
 class QuotaStatus(BaseModel):
     used: int
     limit: int
@@ -89,6 +103,29 @@ class DailyPoint(BaseModel):
     tokens: int
 
 
+class ModeCost(BaseModel):
+    mode: str
+    analyses: int
+    avg_tokens: int
+
+
+class DownloadPoolReport(BaseModel):
+    workers: int
+    queued: int
+    running: int
+    by_host: Dict[str, int]
+
+
+class TempStorageReport(BaseModel):
+    budget_bytes: int
+    reserved_bytes: int
+    leases: int
+    tracked_files: int
+    waiting: int
+    swept_files: int
+    swept_bytes: int
+
+
 class AdminStatsReport(BaseModel):
     range_days: int
     analyses: int
@@ -107,6 +144,11 @@ class AdminStatsReport(BaseModel):
     analyses_today: int
     daily_limit: int
     projected_tokens_at_limit: int
+    cost_by_mode: List[ModeCost] = []
+    # Live, this process only: what the download pool and the temp storage
+    # budget are doing right now.
+    downloads: Optional[DownloadPoolReport] = None
+    temp_storage: Optional[TempStorageReport] = None
     per_user: List["UserUsageRow"]
 
 
@@ -135,3 +177,32 @@ class SearchResult(BaseModel):
     text_rank: float = Field(0.0, description="ts_rank_cd score, 0.0 if no text match")
     score: float = Field(0.0, description="Fused RRF score used for ordering")
 
+
+
+class SearchStreamEvent(BaseModel):
+    """One NDJSON line of /search/stream. A `partial` event is superseded by
+    whatever event follows it; `final` and `error` end the stream."""
+    phase: Literal["partial", "final", "error"]
+    results: List[SearchResult] = Field(default_factory=list)
+    detail: Optional[str] = None
+
+
+class SearchPage(BaseModel):
+    results: List[SearchResult]
+    next_cursor: Optional[str] = Field(None, description="Opaque; null on the last page")
+    total: int = Field(..., description="Results in the whole ranking, across every page")
+
+
+class AnalysisJobError(BaseModel):
+    status_code: int
+    detail: str
+    video: Optional[dict] = Field(None, description="The archived video, when status_code is 409")
+
+
+class AnalysisJob(BaseModel):
+    """An analysis running in the background. `job_id` is null when the result
+    was already known and nothing had to be queued."""
+    job_id: Optional[str] = None
+    status: Literal["queued", "running", "succeeded", "failed"]
+    result: Optional[VideoMetadataDTO] = None
+    error: Optional[AnalysisJobError] = None
@@ -1,12 +1,22 @@
+import asyncio
 import os
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from core.logger import configure_logging, get_logger
 from core.limiter import limiter
+from core.exceptions import AlreadyArchivedError
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 from routers import health_router, videos_router, search_router, me_router
+from services.text_index import load_text_index
+from services.vector_index import load_vector_index
+import db
+from core import gemini
+from services import download_pool
+from services.temp_storage import TEMP_ORPHAN_AGE_SECONDS, temp_storage
+from services.gemini_files import uploaded_files
 
 configure_logging()
 logger = get_logger("main")
@@ -14,8 +24,19 @@ logger = get_logger("main")
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Pop Search API starting up...")
+    temp_storage.sweep(TEMP_ORPHAN_AGE_SECONDS)
+    await load_vector_index()
+    await load_text_index()
+    reaper = asyncio.create_task(uploaded_files.run_reaper())
+    sweeper = asyncio.create_task(temp_storage.run_sweeper())
     yield
     logger.info("Pop Search API shutting down...")
+    reaper.cancel()
+    sweeper.cancel()
+    await uploaded_files.reap(everything=True)
+    db.close()
+    gemini.close()
+    download_pool.close()
 
 app = FastAPI(
     title="Pop Search API",
@@ -36,6 +57,12 @@ app.add_middleware(
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
+
+@app.exception_handler(AlreadyArchivedError)
+async def already_archived_handler(request: Request, exc: AlreadyArchivedError):
+    return JSONResponse(status_code=409, content={"detail": exc.detail, "video": exc.video})
+
+
 app.include_router(health_router)
 app.include_router(videos_router)
 app.include_router(search_router)
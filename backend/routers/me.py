@@ -1,12 +1,12 @@
-import asyncio
-
 from fastapi import APIRouter, HTTPException, Request
 
 from core.auth import CurrentUser
 from core.limiter import limiter
 from core.logger import get_logger
-from db import supabase
+from db import execute, supabase
 from dtos import AdminStatsReport, MyVideo, ProjectUsageReport, QuotaStatus, UserUsageRow
+from services import download_pool
+from services.temp_storage import temp_storage
 from services.usage import (
     get_admin_stats,
     get_all_usage,
@@ -110,6 +110,8 @@ async def read_admin_stats(request: Request, days: int = 30, user_id: str = Curr
                 )
                 for row in per_user
             ],
+            downloads=download_pool.stats().__dict__,
+            temp_storage=temp_storage.stats().__dict__,
         )
     except Exception as e:
         logger.exception(f"Failed to build admin stats: {e}")
@@ -122,19 +124,14 @@ async def read_admin_stats(request: Request, days: int = 30, user_id: str = Curr
 @router.get("/videos", response_model=list[MyVideo])
 @limiter.limit("30/minute")
 async def list_my_videos(request: Request, user_id: str = CurrentUser):
-    def query():
-        return (
+    try:
+        response = await execute(
             supabase.table("videos")
             .select("id, titulo_video, descricao_completa, url_original, created_at")
             .eq("user_id", user_id)
             .order("created_at", desc=True)
             .limit(MAX_VIDEOS)
-            .execute()
         )
-
-    try:
-        loop = asyncio.get_event_loop()
-        response = await loop.run_in_executor(None, query)
         return response.data or []
     except Exception as e:
         logger.exception(f"Failed to list videos for {user_id}: {e}")
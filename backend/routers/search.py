@@ -1,51 +1,212 @@
 import asyncio
+import base64
+import binascii
+import os
+import secrets
+from typing import Optional
 from fastapi import APIRouter, HTTPException, Request
-from services.embedding import embed_query
-from dtos import SearchRequest, SearchResult
-from db import supabase
+from fastapi.responses import StreamingResponse
+from services.archive import generation
+from services.embedding import embed_queries, embed_query, encode_vector, normalize_query
+from services.text_index import text_index
+from services.vector_index import vector_index
+from dtos import SearchBatchRequest, SearchPage, SearchRequest, SearchResult, SearchStreamEvent
+from db import execute, supabase
+from core.cache import TTLCache
+from core.singleflight import SingleFlight
 from core.logger import get_logger
 from core.limiter import limiter
+from core.gemini import EMBEDDING_DIMENSIONS
 
 logger = get_logger("routers.search")
 
 router = APIRouter(tags=["Search"])
 
-EMBEDDING_DIMENSIONS = 768
 ZERO_VECTOR = [0.0] * EMBEDDING_DIMENSIONS
 
+# Results are keyed by the archive generation, so a save in this process makes
+# every earlier entry unreachable at once. The TTL covers what the generation
+# cannot see: rows written by another process or straight into the database.
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "500"))
+RESULT_CACHE_TTL_SECONDS = int(os.getenv("RESULT_CACHE_TTL_SECONDS", "60"))
+
+result_cache = TTLCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL_SECONDS)
+
+# A paged search ranks once, as deep as match_videos' candidate pools go, and
+# keeps that ranking here; every later page is a slice of it, with no embedding
+# and no RPC. The TTL is how long a reader has to ask for the next page.
+PAGINATION_DEPTH = 200
+PAGINATION_SESSIONS = int(os.getenv("PAGINATION_SESSIONS", "1000"))
+PAGINATION_TTL_SECONDS = int(os.getenv("PAGINATION_TTL_SECONDS", "600"))
+
+ranking_cache = TTLCache(PAGINATION_SESSIONS, PAGINATION_TTL_SECONDS)
+
+# Two-stage vector search in match_videos: "binary" or "matryoshka" builds a
+# shortlist from a compact index and reranks it exactly; "none" walks the full
+# index. Only sent when set, so a database whose match_videos predates the
+# parameter keeps working with the default. The compact index a prefilter reads
+# is opt-in in schema.sql and must be created before it is selected.
+VECTOR_PREFILTERS = ("none", "binary", "matryoshka")
+VECTOR_PREFILTER = os.getenv("VECTOR_PREFILTER", "none").lower()
+VECTOR_RERANK_FACTOR = int(os.getenv("VECTOR_RERANK_FACTOR", "4"))
+
+if VECTOR_PREFILTER not in VECTOR_PREFILTERS:
+    logger.warning(f"Unknown VECTOR_PREFILTER '{VECTOR_PREFILTER}'; using 'none'")
+    VECTOR_PREFILTER = "none"
+
+# Only enforced while the local text index can stand in: without a fallback,
+# giving up on a slow RPC would just turn a slow answer into no answer.
+SEARCH_RPC_TIMEOUT_SECONDS = float(os.getenv("SEARCH_RPC_TIMEOUT_SECONDS", "5"))
+
+
+def _result_cache_key(search_request: SearchRequest) -> tuple:
+    return (
+        generation(),
+        normalize_query(search_request.query),
+        search_request.mode,
+        search_request.threshold,
+        search_request.limit,
+    )
+
+
+async def _search_vector_index(search_request: SearchRequest, query_vector: list[float]) -> list[dict]:
+    """The semantic branch answered in-process. Postgres is only asked for the
+    columns a result displays, by primary key."""
+    await vector_index.refresh_if_stale()
+    hits = vector_index.search(query_vector, search_request.threshold, search_request.limit)
+
+    if not hits:
+        return []
+
+    response = await execute(
+        supabase.table("videos")
+        .select("id, titulo_video, descricao_completa, url_original")
+        .in_("id", [hit.id for hit in hits])
+    )
+    rows = {row["id"]: row for row in (response.data or [])}
+
+    return [
+        {**rows[hit.id], "similarity": hit.similarity, "text_rank": 0.0, "score": hit.score}
+        for hit in hits
+        if hit.id in rows
+    ]
+
+
+async def _search_text_index(search_request: SearchRequest) -> list[dict]:
+    await text_index.refresh_if_stale()
+    return text_index.search(search_request.query, search_request.limit)
+
+
+async def _match_videos(rpc_params: dict, mode: str) -> list[dict]:
+    query = supabase.rpc("match_videos", rpc_params)
+
+    if text_index.ready and mode != "semantic":
+        response = await asyncio.wait_for(execute(query), timeout=SEARCH_RPC_TIMEOUT_SECONDS)
+    else:
+        response = await execute(query)
+
+    return response.data or []
+
+
+# A shared search link arrives as a burst of identical requests within the same
+# second. These make the burst cost one upstream call instead of one per
+# request: searches are keyed like the result cache, embeddings by the
+# normalised query, so a hybrid and a semantic search for the same words still
+# share the Gemini call.
+searches_in_flight = SingleFlight()
+embeddings_in_flight = SingleFlight()
+
+
+async def _embed_query(text: str) -> list[float]:
+    return await embeddings_in_flight.do(normalize_query(text), lambda: embed_query(text))
+
+
+async def _search(
+    search_request: SearchRequest,
+    cache_key: tuple,
+    query_vector: Optional[list[float]] = None,
+) -> list[dict]:
+    return await searches_in_flight.do(
+        cache_key,
+        lambda: _run_search(search_request, cache_key, query_vector),
+    )
+
+
+async def _run_search(
+    search_request: SearchRequest,
+    cache_key: tuple,
+    query_vector: Optional[list[float]] = None,
+) -> list[dict]:
+    """Everything after the result cache. `query_vector` is passed in when the
+    caller already embedded the query, as the batch endpoint does."""
+    if search_request.mode == "text" and text_index.ready:
+        results = await _search_text_index(search_request)
+        result_cache.set(cache_key, results)
+
+        logger.info(f"Search returned {len(results)} results from the text index")
+        return results
+
+    if search_request.mode == "text":
+        query_vector = ZERO_VECTOR
+        logger.debug("Text mode: skipping embedding generation")
+    elif query_vector is None:
+        query_vector = await _embed_query(search_request.query)
+
+    if search_request.mode == "semantic" and vector_index.ready:
+        results = await _search_vector_index(search_request, query_vector)
+        result_cache.set(cache_key, results)
+
+        logger.info(f"Search returned {len(results)} results from the vector index")
+        return results
+
+    rpc_params = {
+        "query_embedding": encode_vector(query_vector),
+        "match_threshold": search_request.threshold,
+        "match_count": search_request.limit,
+        "query_text": search_request.query,
+        "search_mode": search_request.mode,
+    }
+
+    if VECTOR_PREFILTER != "none":
+        rpc_params["vector_prefilter"] = VECTOR_PREFILTER
+        rpc_params["rerank_factor"] = VECTOR_RERANK_FACTOR
+
+    logger.debug(f"Executing RPC match_videos with query: {search_request.query}")
+
+    try:
+        # No post-filtering here on purpose. match_threshold applies to the
+        # vector branch inside the RPC; re-applying it in Python would discard
+        # every full-text match and collapse the hybrid search back into a
+        # vector-only one. The RPC already honours match_count exactly.
+        results = await _match_videos(rpc_params, search_request.mode)
+    except Exception as e:
+        # A semantic search has no lexical half to fall back on.
+        if not text_index.ready or search_request.mode == "semantic":
+            raise
+
+        logger.warning(f"match_videos failed or timed out ({type(e).__name__}); answering from the text index")
+        # Deliberately not cached: the next request should try Postgres again.
+        return await _search_text_index(search_request)
+
+    result_cache.set(cache_key, results)
+
+    logger.info(f"Search returned {len(results)} results")
+    return results
+
+
 @router.post("/search", response_model=list[SearchResult])
 @limiter.limit("20/minute")
 async def search_videos(request: Request, search_request: SearchRequest):
     logger.info(f"Search requested: '{search_request.query}' (mode: {search_request.mode})")
 
+    cache_key = _result_cache_key(search_request)
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        logger.info(f"Search served from cache ({len(cached)} results)")
+        return cached
+
     try:
-        if search_request.mode == "text":
-            query_vector = ZERO_VECTOR
-            logger.debug("Text mode: skipping embedding generation")
-        else:
-            loop = asyncio.get_event_loop()
-            query_vector = await loop.run_in_executor(None, embed_query, search_request.query)
-        
-        rpc_params = {
-            "query_embedding": query_vector,
-            "match_threshold": search_request.threshold,
-            "match_count": search_request.limit,
-            "query_text": search_request.query,
-            "search_mode": search_request.mode,
-        }
-
-        logger.debug(f"Executing RPC match_videos with query: {search_request.query}")
-
-        response = supabase.rpc("match_videos", rpc_params).execute()
-
-        # No post-filtering here on purpose. match_threshold applies to the vector
-        # branch inside the RPC; re-applying it in Python would discard every
-        # full-text match and collapse the hybrid search back into a vector-only
-        # one. The RPC already honours match_count exactly.
-        results = response.data or []
-
-        logger.info(f"Search returned {len(results)} results")
-        return results
+        return await _search(search_request, cache_key)
 
     except Exception as e:
         logger.exception(f"Search failed: {e}")
@@ -53,3 +214,161 @@ async def search_videos(request: Request, search_request: SearchRequest):
             status_code=500, 
             detail="An internal error occurred during search. Please try again."
         )
+
+
+@router.post("/search/batch", response_model=list[list[SearchResult]])
+@limiter.limit("5/minute")
+async def search_videos_batch(request: Request, batch: SearchBatchRequest):
+    """Many searches for the price of one rate-limit slot and one embedding
+    call. Results come back in request order."""
+    searches = batch.searches
+    logger.info(f"Batch search requested: {len(searches)} searches")
+
+    cache_keys = [_result_cache_key(search) for search in searches]
+    cached = [result_cache.get(key) for key in cache_keys]
+
+    try:
+        to_embed = [
+            search.query
+            for search, hit in zip(searches, cached)
+            if hit is None and search.mode != "text"
+        ]
+
+        vectors = {}
+        if to_embed:
+            embedded = await embed_queries(to_embed)
+            vectors = {normalize_query(text): vector for text, vector in zip(to_embed, embedded)}
+
+        async def resolve(search: SearchRequest, cache_key: tuple, hit: Optional[list[dict]]):
+            if hit is not None:
+                return hit
+            return await _search(search, cache_key, vectors.get(normalize_query(search.query)))
+
+        return await asyncio.gather(*(
+            resolve(search, key, hit) for search, key, hit in zip(searches, cache_keys, cached)
+        ))
+
+    except Exception as e:
+        logger.exception(f"Batch search failed: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail="An internal error occurred during search. Please try again."
+        )
+
+
+def _event(phase: str, results: Optional[list[dict]] = None, detail: Optional[str] = None) -> str:
+    return SearchStreamEvent(phase=phase, results=results or [], detail=detail).model_dump_json() + "\n"
+
+
+@router.post("/search/stream")
+@limiter.limit("20/minute")
+async def stream_search(request: Request, search_request: SearchRequest):
+    """/search as NDJSON. A hybrid search first sends its full-text hits, which
+    need no embedding, and then the fused ranking that replaces them once the
+    vector branch lands. Every other case sends a single `final` event."""
+    logger.info(f"Streaming search requested: '{search_request.query}' (mode: {search_request.mode})")
+
+    cache_key = _result_cache_key(search_request)
+
+    async def events():
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            yield _event("final", cached)
+            return
+
+        if search_request.mode != "hybrid":
+            try:
+                yield _event("final", await _search(search_request, cache_key))
+            except Exception as e:
+                logger.exception(f"Streaming search failed: {e}")
+                yield _event("error", detail="An internal error occurred during search. Please try again.")
+            return
+
+        # Started first so that Gemini works while the text branch runs.
+        embedding = asyncio.ensure_future(_embed_query(search_request.query))
+
+        try:
+            text_request = search_request.model_copy(update={"mode": "text"})
+            try:
+                yield _event("partial", await _search(text_request, _result_cache_key(text_request)))
+            except Exception as e:
+                # The fused ranking may still arrive; the partial is only a preview.
+                logger.warning(f"Text preview failed, waiting for the fused ranking: {e}")
+
+            query_vector = await embedding
+            yield _event("final", await _search(search_request, cache_key, query_vector))
+
+        except Exception as e:
+            logger.exception(f"Streaming search failed: {e}")
+            yield _event("error", detail="An internal error occurred during search. Please try again.")
+
+        finally:
+            embedding.cancel()
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+def _encode_cursor(session: str, offset: int) -> str:
+    return base64.urlsafe_b64encode(f"{session}:{offset}".encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[str, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        session, _, offset = base64.urlsafe_b64decode(padded).decode().partition(":")
+        return session, int(offset)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+
+def _page(session: str, entry: tuple[list[dict], int], offset: int) -> SearchPage:
+    ranking, page_size = entry
+    end = offset + page_size
+
+    return SearchPage(
+        results=ranking[offset:end],
+        next_cursor=_encode_cursor(session, end) if end < len(ranking) else None,
+        total=len(ranking),
+    )
+
+
+@router.post("/search/page", response_model=SearchPage)
+@limiter.limit("20/minute")
+async def search_first_page(request: Request, search_request: SearchRequest):
+    """/search with a cursor. `limit` is the page size; the ranking behind the
+    pages goes PAGINATION_DEPTH deep."""
+    logger.info(f"Paged search requested: '{search_request.query}' (mode: {search_request.mode})")
+
+    # Deeper candidate pools can credit a row with a branch it missed at the
+    # shallower depth, so page one may order slightly differently from /search.
+    # It is the more complete of the two rankings.
+    deep_request = search_request.model_copy(update={"limit": PAGINATION_DEPTH})
+    cache_key = _result_cache_key(deep_request)
+
+    try:
+        ranking = result_cache.get(cache_key)
+        if ranking is None:
+            ranking = await _search(deep_request, cache_key)
+    except Exception as e:
+        logger.exception(f"Paged search failed: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail="An internal error occurred during search. Please try again."
+        )
+
+    session = secrets.token_urlsafe(12)
+    entry = (ranking, search_request.limit)
+    ranking_cache.set(session, entry)
+    return _page(session, entry, 0)
+
+
+@router.get("/search/page", response_model=SearchPage)
+@limiter.limit("60/minute")
+async def search_next_page(request: Request, cursor: str):
+    session, offset = _decode_cursor(cursor)
+
+    entry = ranking_cache.get(session)
+    if entry is None or offset < 0:
+        raise HTTPException(status_code=410, detail="This search has expired. Run it again.")
+
+    return _page(session, entry, offset)
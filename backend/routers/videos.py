@@ -1,15 +1,28 @@
-import os
 import asyncio
-from fastapi import APIRouter, HTTPException, Request
-from pydantic import BaseModel, field_validator
-from services.embedding import create_embedding
-from services.ai import analyze_video_content, TokenUsage
-from services.downloader import download_video
-from dtos import VideoMetadataDTO
-from db import supabase
+from dataclasses import replace
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field, field_validator, model_validator
+from services.embedding import create_embedding, encode_vector
+from services.ai import analyze_keyframes, analyze_video_content, TokenUsage
+from services.analysis_cache import get_cached_analysis, store_analysis
+from services.archive import bump_generation, find_video_by_tweet_id
+from services.downloader import MAX_FILESIZE_MB, VideoFingerprint, download_video, fingerprint_video
+from services.download_pool import run_download
+from services.fingerprints import find_same_content, record_fingerprint
+from services.jobs import Job, JobQueueFullError, analysis_jobs
+from services.gemini_files import uploaded_files
+from services.media import ShrinkResult, extract_keyframes, prepare_upload, wants_audio_only
+from services.temp_storage import MB, TempStorageFullError, file_size, temp_storage
+from dtos import AnalysisJob, AnalysisJobError, AnalysisMode, VideoMetadataDTO
+from db import execute, supabase
 from core.logger import get_logger
 from core.limiter import limiter
 from core.exceptions import (
+    extract_tweet_id,
+    AlreadyArchivedError,
+    InvalidWindowError,
     validate_video_url,
     ALLOWED_DOMAINS,
     ContentBlockedError,
@@ -23,11 +36,20 @@ logger = get_logger("routers.videos")
 
 router = APIRouter(prefix="/videos", tags=["Videos"])
 
+# Long-polling cap for GET /videos/jobs/{job_id}: short enough to stay under
+# common proxy idle timeouts, long enough that a poller rarely asks twice.
+MAX_JOB_WAIT_SECONDS = 25
+
 
 class VideoAnalysisRequest(BaseModel):
     url: str
     analyze_scenes: bool = True
     analyze_audio: bool = True
+    mode: AnalysisMode = "video"
+    # The part of the video to analyse, in seconds. Whatever is asked for, the
+    # downloader stops MAX_CLIP_SECONDS after the start.
+    start_seconds: float = Field(0, ge=0)
+    end_seconds: Optional[float] = Field(None, gt=0)
     
     @field_validator('url')
     @classmethod
@@ -36,13 +58,159 @@ class VideoAnalysisRequest(BaseModel):
             raise ValueError(f"URL must be from {' or '.join(ALLOWED_DOMAINS)}")
         return v
 
+    @model_validator(mode="after")
+    def validate_window(self):
+        if self.end_seconds is not None and self.end_seconds <= self.start_seconds:
+            raise ValueError("end_seconds must be after start_seconds")
+        return self
 
-@router.post("/analyze")
-@limiter.limit("5/minute")
-async def analyze_from_url(request: Request, body: VideoAnalysisRequest, user_id: str = CurrentUser):
-    logger.info(f"Analysis requested by {user_id} for URL: {body.url} (Scenes: {body.analyze_scenes}, Audio: {body.analyze_audio})")
+    @property
+    def has_window(self) -> bool:
+        return self.start_seconds > 0 or self.end_seconds is not None
+
+
+async def _find_existing(tweet_id: Optional[str]) -> Optional[dict]:
+    """The archived video for the same tweet, if any. Best effort: if the
+    lookup fails the analysis goes ahead, and the save-time unique constraint
+    still stops a duplicate from being stored."""
+    if not tweet_id:
+        return None
+
+    try:
+        return await find_video_by_tweet_id(tweet_id)
+    except Exception as e:
+        logger.warning(f"Duplicate check failed for tweet {tweet_id}: {e}")
+        return None
+
+
+async def _cached_analysis(tweet_id: Optional[str], body: VideoAnalysisRequest) -> Optional[dict]:
+    """A previous analysis of the same tweet with the same flags, revalidated
+    against the current DTO. Any problem is just a miss. Custom windows are
+    never cached: the result describes only part of the video."""
+    if not tweet_id or body.has_window:
+        return None
+
+    try:
+        cached = await get_cached_analysis(tweet_id, body.analyze_scenes, body.analyze_audio)
+        if cached is None:
+            return None
+
+        return VideoMetadataDTO(**{**cached, "url_original": body.url}).model_dump()
+    except Exception as e:
+        logger.warning(f"Analysis cache lookup failed for tweet {tweet_id}: {e}")
+        return None
+
+
+async def _reuse_by_content(
+    fingerprint: Optional[VideoFingerprint],
+    tweet_id: Optional[str],
+    body: VideoAnalysisRequest,
+) -> Optional[dict]:
+    """The same checks as before the download, but for the tweet whose video
+    has the same content: reposts never share a URL with the original."""
+    if fingerprint is None:
+        return None
+
+    try:
+        source = await find_same_content(fingerprint)
+    except Exception as e:
+        logger.warning(f"Fingerprint lookup failed: {e}")
+        return None
+
+    if not source or source == tweet_id:
+        return None
+
+    existing = await _find_existing(source)
+    if existing:
+        logger.info(f"Same content as archived video {existing['id']}; skipping analysis")
+        raise AlreadyArchivedError(existing)
 
+    cached = await _cached_analysis(source, body)
+    if cached:
+        logger.info(f"Same content as tweet {source}; reusing its analysis")
+    return cached
+
+
+async def _remember_analysis(
+    tweet_id: Optional[str],
+    body: VideoAnalysisRequest,
+    result: dict,
+    fingerprint: Optional[VideoFingerprint],
+    cache: bool = True,
+) -> None:
+    if not tweet_id:
+        return
+
+    # The user already has their result; a failure here only means the next
+    # request for the same video pays for it again.
+    if cache and not body.has_window:
+        try:
+            await store_analysis(tweet_id, body.analyze_scenes, body.analyze_audio, result)
+        except Exception as e:
+            logger.warning(f"Could not cache the analysis of tweet {tweet_id}: {e}")
+
+    if fingerprint is None:
+        return
+
+    try:
+        await record_fingerprint(fingerprint, tweet_id)
+    except Exception as e:
+        logger.warning(f"Could not record the fingerprint of tweet {tweet_id}: {e}")
+
+
+def _upload_keys(
+    fingerprint: Optional[VideoFingerprint], upload: ShrinkResult, keep_audio: bool
+) -> list[str]:
+    """Names for what is about to be uploaded, most specific first, so a file
+    already on Gemini can stand in for it. A muted video can be replaced by
+    the same video with sound (the prompt says to ignore it), but an audio
+    track is never replaced by a video, which would cost far more tokens."""
+    if fingerprint is None:
+        return []
+
+    if upload.audio_only:
+        return [f"{fingerprint.sha256}:audio"]
+    if keep_audio:
+        return [f"{fingerprint.sha256}:video"]
+    return [f"{fingerprint.sha256}:video-muted", f"{fingerprint.sha256}:video"]
+
+
+def _already_uploaded(
+    fingerprint: Optional[VideoFingerprint], video_path: str, body: VideoAnalysisRequest
+) -> Optional[ShrinkResult]:
+    """Stands in for prepare_upload when Gemini already holds a file for this
+    content, so the transcode is not paid for an upload that will not happen."""
+    candidate = ShrinkResult(
+        video_path, video_path, 0, 0,
+        audio_only=wants_audio_only(body.analyze_scenes, body.analyze_audio),
+    )
+    if uploaded_files.has(_upload_keys(fingerprint, candidate, body.analyze_audio)):
+        return candidate
+    return None
+
+
+async def _admit(body: VideoAnalysisRequest, user_id: str, tweet_id: Optional[str]) -> Optional[dict]:
+    """Everything settled before an analysis is queued. Returns the result when
+    it is already known; raises when the analysis must not run."""
+    # Before the quota checks too: a duplicate costs nothing, so a user at
+    # their limit is better told where the video already is.
+    existing = await _find_existing(tweet_id)
+    if existing:
+        logger.info(f"Tweet already archived as {existing['id']}; skipping analysis")
+        raise AlreadyArchivedError(existing)
+
+    # Same reasoning: a cached result spends no tokens, so it is not charged
+    # and is served even to a user whose quota has run out.
+    cached = await _cached_analysis(tweet_id, body)
+    if cached:
+        logger.info(f"Analysis of tweet {tweet_id} served from cache")
+        return cached
+
+    # Jobs still in flight are recorded only when they finish, so they are
+    # counted here as already spent; otherwise a burst of submissions could
+    # all pass the check and overrun the quota together.
     quota = await get_quota(user_id)
+    quota = replace(quota, used=quota.used + analysis_jobs.unfinished(user_id))
     if quota.is_exhausted:
         logger.info(f"Quota exhausted for {user_id}: {quota.used}/{quota.limit}")
         raise HTTPException(
@@ -53,6 +221,7 @@ async def analyze_from_url(request: Request, body: VideoAnalysisRequest, user_id
     # Checked after the personal quota so a user at their own limit is told
     # that, which is the actionable message, rather than blaming the project.
     project = await get_project_usage()
+    project = replace(project, analyses_today=project.analyses_today + analysis_jobs.unfinished())
     if project.is_exhausted:
         logger.warning(f"Daily project limit reached: {project.analyses_today}/{project.daily_limit}")
         raise HTTPException(
@@ -60,22 +229,79 @@ async def analyze_from_url(request: Request, body: VideoAnalysisRequest, user_id
             detail="The archive has reached its analysis limit for today. Nothing was taken from your quota. Try again tomorrow.",
         )
 
-    video_path = None
+    return None
+
+
+def _submit(body: VideoAnalysisRequest, user_id: str, tweet_id: Optional[str]) -> Job:
+    try:
+        return analysis_jobs.submit(user_id, lambda: _run_analysis(body, user_id, tweet_id))
+    except JobQueueFullError:
+        logger.warning("Analysis queue is full; refusing a new job")
+        raise HTTPException(
+            status_code=503,
+            detail="Too many analyses are running right now. Nothing was taken from your quota. Try again in a few minutes.",
+        )
+
+
+async def _run_analysis(body: VideoAnalysisRequest, user_id: str, tweet_id: Optional[str]) -> dict:
+    """download -> upload -> generate, as a job. The accounting lives here too,
+    so an analysis is recorded when it finishes whether or not anyone is still
+    waiting for it."""
+    lease = None
     # Only set once the video reaches Gemini: a failed download costs no tokens
     # and must not consume the user's quota.
     charged = False
     succeeded = False
     failure_reason = None
     tokens = TokenUsage()
+    # What shrinking took off the upload; None when no video was uploaded.
+    bytes_saved = None
 
     try:
         loop = asyncio.get_event_loop()
-        video_path = await loop.run_in_executor(None, download_video, body.url)
-
-        charged = True
-        analysis_result = await analyze_video_content(
-            video_path, body.analyze_scenes, body.analyze_audio, tokens
+        # Room for the download and one file derived from it (shrunk video or
+        # audio track), neither larger than the download limit; trimmed to the
+        # real size once it is known.
+        lease = await temp_storage.reserve(2 * MAX_FILESIZE_MB * MB)
+        video_path = await run_download(
+            download_video, body.url, body.start_seconds, body.end_seconds
         )
+        lease.track(video_path)
+        await lease.fit(2 * file_size(video_path))
+
+        # Fingerprinted as downloaded, so reposts match whatever shrinking does.
+        fingerprint = await loop.run_in_executor(None, fingerprint_video, video_path)
+        reused = await _reuse_by_content(fingerprint, tweet_id, body)
+        if reused is not None:
+            return reused
+
+        keyframes = None
+        if body.mode == "keyframes":
+            keyframes = await loop.run_in_executor(
+                None, extract_keyframes, video_path, body.analyze_audio
+            )
+
+        if keyframes is not None:
+            charged = True
+            analysis_result = await analyze_keyframes(
+                keyframes.frames, keyframes.audio, body.analyze_scenes, body.analyze_audio, tokens
+            )
+        else:
+            upload = _already_uploaded(fingerprint, video_path, body)
+            if upload is None:
+                upload = await loop.run_in_executor(
+                    None, prepare_upload, video_path, body.analyze_scenes, body.analyze_audio
+                )
+                if upload.is_new_file:
+                    lease.track(upload.path)
+                bytes_saved = upload.bytes_saved
+
+            charged = True
+            analysis_result = await analyze_video_content(
+                upload.path, body.analyze_scenes, body.analyze_audio, tokens,
+                audio_only=upload.audio_only,
+                reuse_keys=_upload_keys(fingerprint, upload, body.analyze_audio),
+            )
 
         if not analysis_result:
             failure_reason = "no_result"
@@ -89,12 +315,19 @@ async def analyze_from_url(request: Request, body: VideoAnalysisRequest, user_id
         try:
             dto = VideoMetadataDTO(**analysis_result)
             succeeded = True
-            return dto.model_dump()
         except ValueError as e:
             logger.error(f"Validation error parsing AI output: {e}\nRaw output: {analysis_result}")
             failure_reason = "schema_validation"
             raise HTTPException(status_code=500, detail="Internal AI schema validation failed")
 
+        result = dto.model_dump()
+        # Keyframes see less than the whole video, so their result is not
+        # cached where a full analysis of the same tweet would be looked up.
+        await _remember_analysis(
+            tweet_id, body, result, fingerprint, cache=tokens.mode != "keyframes"
+        )
+        return result
+
     except AsyncTimeoutError:
         logger.error("Request timed out waiting for AI")
         failure_reason = "timeout"
@@ -120,8 +353,17 @@ async def analyze_from_url(request: Request, body: VideoAnalysisRequest, user_id
             detail="The AI declined to describe this video, usually because of its content. Nothing is wrong with the link."
         )
 
-    except HTTPException as he:
-        raise he
+    except InvalidWindowError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    except TempStorageFullError:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many videos are being processed right now. Nothing was taken from your quota. Try again in a few minutes.",
+        )
+
+    except (HTTPException, AlreadyArchivedError):
+        raise
 
     except Exception as e:
         logger.exception(f"Error processing video flow: {e}")
@@ -136,13 +378,88 @@ async def analyze_from_url(request: Request, body: VideoAnalysisRequest, user_id
             await record_event(
                 user_id, "analysis", succeeded, failure_reason,
                 tokens.prompt, tokens.output, tokens.total,
+                analysis_mode=tokens.mode,
+                bytes_saved=bytes_saved,
             )
 
-        if video_path and os.path.exists(video_path):
-            os.remove(video_path)
-            logger.debug(f"Cleaned up temp file: {video_path}")
+        if lease is not None:
+            await lease.release()
+
+
+def _job_view(job: Job) -> AnalysisJob:
+    error = None
+
+    if isinstance(job.error, AlreadyArchivedError):
+        error = AnalysisJobError(status_code=409, detail=job.error.detail, video=job.error.video)
+    elif isinstance(job.error, HTTPException):
+        error = AnalysisJobError(status_code=job.error.status_code, detail=job.error.detail)
+    elif job.error is not None:
+        error = AnalysisJobError(
+            status_code=500,
+            detail="An internal error occurred while processing the video. Please try again.",
+        )
+
+    return AnalysisJob(job_id=job.id, status=job.status, result=job.result, error=error)
+
+
+@router.post("/analyze")
+@limiter.limit("5/minute")
+async def analyze_from_url(request: Request, body: VideoAnalysisRequest, user_id: str = CurrentUser):
+    """Submit-and-wait over the job runner, for clients that want the result
+    in the response. Dropping the connection does not cancel the analysis."""
+    logger.info(f"Analysis requested by {user_id} for URL: {body.url} (Scenes: {body.analyze_scenes}, Audio: {body.analyze_audio}, Mode: {body.mode})")
+
+    tweet_id = extract_tweet_id(body.url)
+
+    cached = await _admit(body, user_id, tweet_id)
+    if cached:
+        return cached
+
+    job = await analysis_jobs.wait(_submit(body, user_id, tweet_id))
+    if job.error:
+        raise job.error
+    return job.result
+
+
+@router.post("/jobs", response_model=AnalysisJob, status_code=202)
+@limiter.limit("5/minute")
+async def submit_analysis_job(request: Request, body: VideoAnalysisRequest, user_id: str = CurrentUser):
+    """Queue an analysis and return at once. Poll GET /videos/jobs/{job_id}
+    for the outcome."""
+    logger.info(f"Analysis job requested by {user_id} for URL: {body.url} (Scenes: {body.analyze_scenes}, Audio: {body.analyze_audio}, Mode: {body.mode})")
+
+    tweet_id = extract_tweet_id(body.url)
+
+    cached = await _admit(body, user_id, tweet_id)
+    if cached:
+        return JSONResponse(
+            status_code=200,
+            content=AnalysisJob(status="succeeded", result=cached).model_dump(mode="json"),
+        )
+
+    return _job_view(_submit(body, user_id, tweet_id))
 
 
+@router.get("/jobs/{job_id}", response_model=AnalysisJob)
+@limiter.limit("60/minute")
+async def get_analysis_job(
+    request: Request,
+    job_id: str,
+    user_id: str = CurrentUser,
+    wait: float = Query(0, ge=0, le=MAX_JOB_WAIT_SECONDS, description="Seconds to hold the request open while the job runs"),
+):
+    job = analysis_jobs.get(job_id)
+
+    # Someone else's job is reported exactly like a missing one, so job IDs
+    # cannot be probed.
+    if job is None or job.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    if wait and not job.done:
+        await analysis_jobs.wait(job, wait)
+
+    return _job_view(job)
+
 @router.post("")
 @limiter.limit("10/minute")
 async def save_video(request: Request, metadata: VideoMetadataDTO, user_id: str = CurrentUser):
@@ -152,20 +469,21 @@ async def save_video(request: Request, metadata: VideoMetadataDTO, user_id: str
         raise HTTPException(status_code=400, detail="url_original is required for saving")
 
     try:
-        loop = asyncio.get_event_loop()
-        vector = await loop.run_in_executor(None, create_embedding, metadata)
+        vector = await create_embedding(metadata)
         
         db_payload = {
             "user_id": user_id,
             "titulo_video": metadata.titulo_sugerido,
             "descricao_completa": metadata.descricao_completa,
             "url_original": metadata.url_original,
+            "tweet_id": extract_tweet_id(metadata.url_original),
             "metadados_estruturados": metadata.metadados_estruturados.model_dump(),
-            "embedding": vector
+            "embedding": encode_vector(vector)
         }
         
         logger.info("Persisting to Supabase...")
-        data, count = supabase.table("videos").insert(db_payload).execute()
+        data, count = await execute(supabase.table("videos").insert(db_payload))
+        bump_generation()
         
         logger.info(f"Video saved successfully. ID: {data[1][0]['id']}")
 
@@ -65,6 +65,14 @@ create table usage_events (
   prompt_tokens int,
   output_tokens int,
   total_tokens int,
+  -- How the video was sent to Gemini ('video', 'audio' or 'keyframes'), so
+  -- the cost of each mode can be compared. On an existing database:
+  --   alter table usage_events add column analysis_mode text;
+  analysis_mode text,
+  -- Upload bytes the shrinking stage saved on this analysis (0 when it did not
+  -- help, null when no video was uploaded). On an existing database:
+  --   alter table usage_events add column bytes_saved bigint;
+  bytes_saved bigint,
   created_at timestamptz not null default now()
 );
 
@@ -76,6 +84,13 @@ create table videos (
   created_at timestamp with time zone default now(),
   user_id uuid references auth.users(id) on delete set null,
   url_original text unique not null,
+  -- The status ID from url_original. The same tweet arrives under many URLs
+  -- (x.com, twitter.com, mobile.twitter.com, ?s=20...), so this, not the URL,
+  -- is what identifies a duplicate. On an existing database:
+  --   alter table videos add column tweet_id text;
+  --   update videos set tweet_id = substring(url_original from '/status(?:es)?/(\d+)');
+  --   create unique index videos_tweet_id_idx on videos (tweet_id);
+  tweet_id text,
   titulo_video text,
   descricao_completa text,
   metadados_estruturados jsonb,
@@ -109,14 +124,130 @@ create table videos (
 );
 
 -- 6. HNSW index for fast vector search
-create index on videos using hnsw (embedding vector_cosine_ops);
+-- Named explicitly (it is the name Postgres would pick anyway) so that the
+-- half-precision migration at the end of this file can rebuild it.
+create index videos_embedding_idx on videos using hnsw (embedding vector_cosine_ops);
+
+-- Compact indexes for match_videos' two-stage search (vector_prefilter).
+-- Not created by default: VECTOR_PREFILTER is 'none' unless set, and every
+-- HNSW index costs memory and a write on each insert. Before setting
+-- VECTOR_PREFILTER on the backend, run (uncommented) only the statement for
+-- the prefilter you choose:
+--   binary:     one bit per dimension (its sign), compared by Hamming distance;
+--               32x smaller than the full index.
+--   matryoshka: the first 256 dimensions. gemini-embedding-001 is trained so
+--               that a prefix of the vector is itself a usable embedding.
+--
+-- create index videos_embedding_binary_idx on videos
+--   using hnsw ((binary_quantize(embedding)::bit(768)) bit_hamming_ops);
+--
+-- create index videos_embedding_256_idx on videos
+--   using hnsw ((subvector(embedding, 1, 256)::vector(256)) vector_cosine_ops);
 
 -- 7. GIN index for the full-text branch
 create index videos_fts_idx on videos using gin (fts);
 
 create index videos_user_id_idx on videos (user_id);
 
--- 8. Row Level Security
+-- Backs the duplicate check in /videos/analyze, which runs before any download.
+create unique index videos_tweet_id_idx on videos (tweet_id);
+
+-- 8. analysis cache
+--
+-- Validated analysis results, so that analysing the same tweet again (the
+-- same user coming back, or someone else) costs neither Gemini time nor quota.
+-- The key holds everything that changes the output: the tweet, what was asked
+-- for, and the model that answered. Rows expire after a TTL and the table is
+-- capped in size, both enforced by prune_analysis_cache after each write.
+create table analysis_cache (
+  tweet_id text not null,
+  analyze_scenes boolean not null,
+  analyze_audio boolean not null,
+  model text not null,
+  result jsonb not null,
+  created_at timestamptz not null default now(),
+  primary key (tweet_id, analyze_scenes, analyze_audio, model)
+);
+
+create index analysis_cache_created_at_idx on analysis_cache (created_at desc);
+
+create or replace function prune_analysis_cache(max_age_seconds int, max_rows int)
+returns int
+language plpgsql
+set search_path = public
+as $$
+declare
+  expired int;
+  evicted int;
+begin
+  delete from analysis_cache
+  where created_at < now() - make_interval(secs => max_age_seconds);
+  get diagnostics expired = row_count;
+
+  -- Oldest first once over the cap: an old entry has had its chance to be hit.
+  delete from analysis_cache
+  where ctid in (
+    select ctid from analysis_cache
+    order by created_at desc
+    offset greatest(max_rows, 0)
+  );
+  get diagnostics evicted = row_count;
+
+  return expired + evicted;
+end;
+$$;
+
+-- 9. content fingerprints
+--
+-- Which tweet a given video content was first analysed for, so a repost under
+-- another URL can reuse that analysis (or point at the archived video) instead
+-- of paying Gemini again. sha256 matches byte-identical files; frames holds
+-- one 64-bit dHash per sampled frame and matches re-encodes by Hamming
+-- distance, served by an HNSW index over pgvector's bit type.
+create table video_fingerprints (
+  sha256 text primary key,
+  frames bit(1024),
+  tweet_id text not null,
+  created_at timestamptz not null default now()
+);
+
+create index video_fingerprints_frames_idx on video_fingerprints
+  using hnsw (frames bit_hamming_ops);
+
+-- The tweet whose content is the same as the query, exactly or within
+-- max_distance differing bits, nearest first.
+create or replace function match_fingerprint(
+  query_sha256 text,
+  query_frames bit(1024),
+  max_distance int
+)
+returns table (tweet_id text, distance int)
+language sql
+stable
+set search_path = public, extensions
+as $$
+  select hits.tweet_id, hits.distance
+  from (
+    (
+      select f.tweet_id, 0 as distance
+      from video_fingerprints f
+      where f.sha256 = query_sha256
+    )
+    union all
+    (
+      select f.tweet_id, (f.frames <~> query_frames)::int as distance
+      from video_fingerprints f
+      where query_frames is not null and f.frames is not null
+      order by f.frames <~> query_frames
+      limit 1
+    )
+  ) hits
+  where hits.distance <= max_distance
+  order by hits.distance
+  limit 1;
+$$;
+
+-- 10. Row Level Security
 alter table profiles enable row level security;
 
 create policy "profiles: owner can read"
@@ -138,6 +269,11 @@ create policy "videos: public read"
 -- No write policy on purpose: it forces every insert through the backend,
 -- where the quota is enforced. Only service_role can write.
 
+-- No policy at all: these are only ever read and written by the backend.
+alter table analysis_cache enable row level security;
+
+alter table video_fingerprints enable row level security;
+
 
 -- Hybrid search: vector + full-text combined via Reciprocal Rank Fusion.
 --
@@ -153,6 +289,20 @@ create policy "videos: public read"
 --
 -- match_threshold applies to the vector branch ONLY. Applying it to full-text
 -- matches as well would collapse the hybrid search back into a vector-only one.
+--
+-- vector_prefilter:
+--   'none'       -> the vector branch walks the full 768-dim HNSW index (default)
+--   'binary'     -> two stages: a shortlist by Hamming distance over the binary
+--                   index, reranked by exact cosine distance
+--   'matryoshka' -> two stages: a shortlist by cosine over the first 256
+--                   dimensions, reranked by exact cosine distance
+-- Either way similarity is the exact cosine over the full embedding, so
+-- match_threshold means the same thing in every mode. The shortlist holds
+-- rerank_factor times as many rows as the vector branch keeps.
+--
+-- An HNSW scan returns at most hnsw.ef_search rows (40 unless configured), so
+-- raise it to at least the shortlist size, or enable hnsw.iterative_scan on
+-- pgvector 0.8+, or the shortlist comes back short.
 
 drop function if exists match_videos;
 
@@ -162,7 +312,9 @@ create or replace function match_videos (
   match_count int,
   query_text text,
   search_mode text default 'hybrid',
-  rrf_k int default 50
+  rrf_k int default 50,
+  vector_prefilter text default 'none',
+  rerank_factor int default 4
 )
 returns table (
   id uuid,
@@ -177,22 +329,70 @@ language sql
 stable
 set search_path = public, extensions
 as $$
-  with vector_hits as (
+  with settings as (
     select
-      v.id,
-      1 - (v.embedding <=> query_embedding) as similarity,
-      row_number() over (order by v.embedding <=> query_embedding) as rank
-    from videos v
-    where v.embedding is not null
-    -- Ordering directly on the <=> operator is what allows the HNSW index to
-    -- be used. Wrapping it in "1 - (...)" disables the index and forces a
-    -- sequential scan over every row.
-    order by v.embedding <=> query_embedding
-    limit case
-      when search_mode in ('hybrid', 'semantic')
-      then least(greatest(match_count, 1) * 4, 200)
-      else 0
-    end
+      case
+        when search_mode in ('hybrid', 'semantic')
+        then least(greatest(match_count, 1) * 4, 200)
+        else 0
+      end as vector_pool
+  ),
+  -- Stage one of the two-stage modes: candidates from a compact index. At
+  -- most one of these branches runs; the other is cut off by LIMIT 0.
+  shortlist as (
+    (
+      select v.id, v.embedding
+      from videos v
+      where v.embedding is not null
+      order by binary_quantize(v.embedding)::bit(768) <~> binary_quantize(query_embedding)
+      limit case
+        when vector_prefilter = 'binary'
+        then (select vector_pool from settings) * greatest(rerank_factor, 1)
+        else 0
+      end
+    )
+    union all
+    (
+      select v.id, v.embedding
+      from videos v
+      where v.embedding is not null
+      order by subvector(v.embedding, 1, 256)::vector(256) <=> subvector(query_embedding, 1, 256)::vector(256)
+      limit case
+        when vector_prefilter = 'matryoshka'
+        then (select vector_pool from settings) * greatest(rerank_factor, 1)
+        else 0
+      end
+    )
+  ),
+  vector_hits as (
+    select
+      hits.id,
+      1 - hits.distance as similarity,
+      row_number() over (order by hits.distance) as rank
+    from (
+      (
+        select v.id, v.embedding <=> query_embedding as distance
+        from videos v
+        where v.embedding is not null
+        -- Ordering directly on the <=> operator is what allows the HNSW index
+        -- to be used. Wrapping it in "1 - (...)" disables the index and
+        -- forces a sequential scan over every row.
+        order by v.embedding <=> query_embedding
+        limit case
+          when vector_prefilter not in ('binary', 'matryoshka')
+          then (select vector_pool from settings)
+          else 0
+        end
+      )
+      union all
+      (
+        -- Stage two: exact distances, computed over the shortlist only.
+        select s.id, s.embedding <=> query_embedding as distance
+        from shortlist s
+        order by distance
+        limit (select vector_pool from settings)
+      )
+    ) hits
   ),
   text_hits as (
     select
@@ -242,3 +442,164 @@ as $$
   order by f.fused_score desc, f.sim desc
   limit greatest(match_count, 1);
 $$;
+
+
+-- Optional: half-precision embeddings (pgvector 0.7+)
+--
+-- Stores videos.embedding as halfvec(768): two bytes per dimension instead of
+-- four, which halves the table's vector storage and, more importantly, the
+-- HNSW index that has to stay in memory for searches to be fast.
+-- gemini-embedding-001 vectors are unit length, well inside float16's range,
+-- and the precision lost does not move cosine rankings in any way that shows.
+--
+-- Not applied by default. To migrate an existing database, run the block
+-- below once (uncommented), then set EMBEDDING_STORAGE=halfvec on the backend
+-- so vectors are sent with the precision the column actually keeps. The RPC
+-- has to be recreated because its query_embedding parameter must match the
+-- column type for the HNSW indexes to be used; its body only changes in the
+-- type of the matryoshka prefix.
+--
+-- drop index if exists videos_embedding_idx;
+-- drop index if exists videos_embedding_binary_idx;
+-- drop index if exists videos_embedding_256_idx;
+--
+-- alter table videos
+--   alter column embedding type halfvec(768)
+--   using embedding::halfvec(768);
+--
+-- create index videos_embedding_idx on videos using hnsw (embedding halfvec_cosine_ops);
+--
+-- -- Only the compact index your VECTOR_PREFILTER uses, if any:
+-- create index videos_embedding_binary_idx on videos
+--   using hnsw ((binary_quantize(embedding)::bit(768)) bit_hamming_ops);
+--
+-- create index videos_embedding_256_idx on videos
+--   using hnsw ((subvector(embedding, 1, 256)::halfvec(256)) halfvec_cosine_ops);
+--
+-- drop function if exists match_videos;
+--
+-- create or replace function match_videos (
+--   query_embedding halfvec(768),
+--   match_threshold float,
+--   match_count int,
+--   query_text text,
+--   search_mode text default 'hybrid',
+--   rrf_k int default 50,
+--   vector_prefilter text default 'none',
+--   rerank_factor int default 4
+-- )
+-- returns table (
+--   id uuid,
+--   titulo_video text,
+--   descricao_completa text,
+--   url_original text,
+--   similarity float,
+--   text_rank float,
+--   score float
+-- )
+-- language sql
+-- stable
+-- set search_path = public, extensions
+-- as $$
+--   with settings as (
+--     select
+--       case
+--         when search_mode in ('hybrid', 'semantic')
+--         then least(greatest(match_count, 1) * 4, 200)
+--         else 0
+--       end as vector_pool
+--   ),
+--   shortlist as (
+--     (
+--       select v.id, v.embedding
+--       from videos v
+--       where v.embedding is not null
+--       order by binary_quantize(v.embedding)::bit(768) <~> binary_quantize(query_embedding)
+--       limit case
+--         when vector_prefilter = 'binary'
+--         then (select vector_pool from settings) * greatest(rerank_factor, 1)
+--         else 0
+--       end
+--     )
+--     union all
+--     (
+--       select v.id, v.embedding
+--       from videos v
+--       where v.embedding is not null
+--       order by subvector(v.embedding, 1, 256)::halfvec(256) <=> subvector(query_embedding, 1, 256)::halfvec(256)
+--       limit case
+--         when vector_prefilter = 'matryoshka'
+--         then (select vector_pool from settings) * greatest(rerank_factor, 1)
+--         else 0
+--       end
+--     )
+--   ),
+--   vector_hits as (
+--     select
+--       hits.id,
+--       1 - hits.distance as similarity,
+--       row_number() over (order by hits.distance) as rank
+--     from (
+--       (
+--         select v.id, v.embedding <=> query_embedding as distance
+--         from videos v
+--         where v.embedding is not null
+--         order by v.embedding <=> query_embedding
+--         limit case
+--           when vector_prefilter not in ('binary', 'matryoshka')
+--           then (select vector_pool from settings)
+--           else 0
+--         end
+--       )
+--       union all
+--       (
+--         select s.id, s.embedding <=> query_embedding as distance
+--         from shortlist s
+--         order by distance
+--         limit (select vector_pool from settings)
+--       )
+--     ) hits
+--   ),
+--   text_hits as (
+--     select
+--       v.id,
+--       ts_rank_cd(v.fts, websearch_to_tsquery('portuguese_unaccent', query_text)) as text_rank,
+--       row_number() over (
+--         order by ts_rank_cd(v.fts, websearch_to_tsquery('portuguese_unaccent', query_text)) desc
+--       ) as rank
+--     from videos v
+--     where v.fts @@ websearch_to_tsquery('portuguese_unaccent', query_text)
+--     limit case
+--       when search_mode in ('hybrid', 'text')
+--       then least(greatest(match_count, 1) * 4, 200)
+--       else 0
+--     end
+--   ),
+--   fused as (
+--     select
+--       coalesce(vh.id, th.id) as video_id,
+--       coalesce(vh.similarity, 0)::float as sim,
+--       coalesce(th.text_rank, 0)::float as trank,
+--       (
+--         coalesce(1.0 / (rrf_k + vh.rank), 0) +
+--         coalesce(1.0 / (rrf_k + th.rank), 0)
+--       )::float as fused_score,
+--       (vh.id is not null and vh.similarity >= match_threshold) as passes_vector,
+--       (th.id is not null) as passes_text
+--     from vector_hits vh
+--     full outer join text_hits th on th.id = vh.id
+--   )
+--   select
+--     v.id,
+--     v.titulo_video,
+--     v.descricao_completa,
+--     v.url_original,
+--     f.sim,
+--     f.trank,
+--     f.fused_score
+--   from fused f
+--   join videos v on v.id = f.video_id
+--   where f.passes_vector or f.passes_text
+--   order by f.fused_score desc, f.sim desc
+--   limit greatest(match_count, 1);
+-- $$;
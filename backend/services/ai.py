@@ -2,13 +2,20 @@ import json
 import asyncio
 import time
 from dataclasses import dataclass
-from typing import Optional
+from typing import Awaitable, Optional, Sequence
 
 from core.logger import get_logger
-from core.gemini import get_genai, get_generation_model
+from core.gemini import (
+    delete_file,
+    generate_content,
+    get_generation_model,
+    upload_file,
+    wait_until_processed,
+)
 from google.api_core.exceptions import ResourceExhausted
 
 from core.exceptions import ContentBlockedError, ServiceQuotaExhaustedError
+from services.gemini_files import uploaded_files
 from dtos import (
     MAX_DESCRICAO_CHARS,
     MAX_ELEMENTOS_CENARIO,
@@ -20,7 +27,6 @@ from dtos import (
 
 logger = get_logger("services.ai")
 
-genai = get_genai()
 model = get_generation_model()
 
 PROCESSING_TIMEOUT = 60
@@ -28,9 +34,17 @@ GENERATION_TIMEOUT = 150
 USABLE_FINISH_REASONS = {"STOP", "MAX_TOKENS"}
 
 
-def get_system_prompt(analyze_scenes: bool, analyze_audio: bool) -> str:
+def get_system_prompt(
+    analyze_scenes: bool,
+    analyze_audio: bool,
+    audio_only: bool = False,
+    keyframes: bool = False,
+) -> str:
+    """`audio_only` is for uploads that carry just the audio track: there is
+    nothing to see, so the prompt only asks about what is heard. `keyframes`
+    is for a set of stills standing in for the video."""
     prompt_parts = [
-        "Você é um especialista em análise de vídeos.",
+        "Você é um especialista em análise de áudio." if audio_only else "Você é um especialista em análise de vídeos.",
         "Sua tarefa é retornar EXATAMENTE um JSON na estrutura solicitada.",
         "- Seja descritivo e objetivo.",
         "- NÃO invente músicas ou artistas.",
@@ -46,7 +60,12 @@ def get_system_prompt(analyze_scenes: bool, analyze_audio: bool) -> str:
         prompt_parts.append(f"- transcricao: no máximo {MAX_TRANSCRICAO_CHARS} caracteres.")
 
     prompt_parts.append("\n## INSTRUÇÕES:")
-    prompt_parts.append("- Detalhe características físicas de PESSOAS e liste OBJETOS do cenário." if analyze_scenes else "- Ignore os detalhes das pessoas e objetos no cenário.")
+    if keyframes:
+        prompt_parts.append("- As imagens são quadros-chave do vídeo, em ordem, um por mudança de cena. Descreva o vídeo a partir delas.")
+    if audio_only:
+        prompt_parts.append("- O arquivo contém apenas o áudio de um vídeo. Baseie o título e a descrição no que é dito e ouvido.")
+    else:
+        prompt_parts.append("- Detalhe características físicas de PESSOAS e liste OBJETOS do cenário." if analyze_scenes else "- Ignore os detalhes das pessoas e objetos no cenário.")
     prompt_parts.append("- Transcreva as falas relevantes do áudio." if analyze_audio else "- Ignore o áudio do vídeo.")
 
     prompt_parts.append("\n## SCHEMA DO JSON DE SAÍDA:\n{")
@@ -73,6 +92,9 @@ class TokenUsage:
     prompt: int = 0
     output: int = 0
     total: int = 0
+    # What was actually sent: "video", "audio" or "keyframes". Recorded with
+    # the tokens so the cost of each mode can be compared.
+    mode: str = "video"
 
 
 def _log_token_usage(response, sink: Optional[TokenUsage] = None) -> None:
@@ -113,53 +135,23 @@ def _extract_json(response) -> dict:
     return json.loads(response.text)
 
 
-async def analyze_video_content(
-    video_path: str,
-    analyze_scenes: bool = False,
-    analyze_audio: bool = False,
-    usage: Optional[TokenUsage] = None,
-):
-    """`usage` is filled in place rather than returned, so the caller still gets
-    the cost when the analysis raises."""
-    video_file = None
+async def _generate(contents: list, usage: Optional[TokenUsage]) -> dict:
+    logger.info(f"Sending prompt (Timeout: {GENERATION_TIMEOUT}s)...")
 
-    try:
-        logger.info(f"Starting upload to Gemini: {video_path}")
-        
-        video_file = genai.upload_file(path=video_path)
-        logger.debug(f"File uploaded. URI: {video_file.uri}")
-        
-        start_time = time.time()
-        
-        while video_file.state.name == "PROCESSING":
-            elapsed = time.time() - start_time
-            if elapsed > PROCESSING_TIMEOUT:
-                logger.error(f"Timeout waiting for video processing ({elapsed:.1f}s)")
-                raise asyncio.TimeoutError("Video processing on Gemini took too long.")
-            
-            logger.debug(f"Video still processing... ({elapsed:.1f}s)")
-            
-            await asyncio.sleep(2) 
-            video_file = genai.get_file(video_file.name)
+    response = await generate_content(model, contents, timeout=GENERATION_TIMEOUT)
 
-        if video_file.state.name == "FAILED":
-            logger.error(f"Gemini processing failed state: {video_file.state.name}")
-            raise ValueError("Video processing failed by Gemini internal error.")
+    _log_token_usage(response, usage)
 
-        logger.info(f"Video active. Sending prompt (Timeout: {GENERATION_TIMEOUT}s)...")
+    result = _extract_json(response)
+    logger.info("Analysis received successfully")
+    return result
 
-        system_prompt = get_system_prompt(analyze_scenes, analyze_audio)
-        
-        response = await asyncio.wait_for(
-            model.generate_content_async([system_prompt, video_file]),
-            timeout=GENERATION_TIMEOUT
-        )
-    
-        _log_token_usage(response, usage)
 
-        result = _extract_json(response)
-        logger.info("Analysis received successfully")
-        return result
+async def _guarded(analysis: Awaitable[dict]) -> Optional[dict]:
+    """The error contract every analysis mode shares: quota, timeouts and
+    refusals are raised for the router to map, anything else is None."""
+    try:
+        return await analysis
 
     except ResourceExhausted as e:
         logger.error(f"Gemini quota exhausted for the project: {e}")
@@ -176,10 +168,118 @@ async def analyze_video_content(
         logger.exception("Unexpected error during video analysis")
         return None
 
+
+async def _upload_and_wait(path: str):
+    logger.info(f"Starting upload to Gemini: {path}")
+
+    video_file = await upload_file(path)
+    logger.debug(f"File uploaded. URI: {video_file.uri}")
+
+    try:
+        start_time = time.time()
+
+        try:
+            video_file = await wait_until_processed(video_file, PROCESSING_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.error(f"Timeout waiting for video processing ({time.time() - start_time:.1f}s)")
+            raise asyncio.TimeoutError("Video processing on Gemini took too long.")
+
+        logger.debug(f"Video left PROCESSING after {time.time() - start_time:.1f}s")
+
+        if video_file.state.name == "FAILED":
+            logger.error(f"Gemini processing failed state: {video_file.state.name}")
+            raise ValueError("Video processing failed by Gemini internal error.")
+
+        logger.info("Video active.")
+        return video_file
+
+    except BaseException:
+        await _delete(video_file)
+        raise
+
+
+async def _delete(video_file) -> None:
+    try:
+        await delete_file(video_file.name)
+        logger.debug(f"Deleted uploaded file from Gemini: {video_file.name}")
+    except Exception as e:
+        logger.warning(f"Failed to delete uploaded file from Gemini: {e}")
+
+
+async def _analyze_upload(
+    path: str, system_prompt: str, usage: Optional[TokenUsage], reuse_keys: Sequence[str]
+) -> dict:
+    reused = uploaded_files.acquire(reuse_keys)
+
+    if reused is not None:
+        key, video_file = reused
+        logger.info(f"Reusing uploaded file {video_file.name} for {path}")
+    else:
+        video_file = await _upload_and_wait(path)
+        key = reuse_keys[0] if reuse_keys and uploaded_files.add(reuse_keys[0], video_file) else None
+
+    rejected = False
+    try:
+        return await _generate([system_prompt, video_file], usage)
+    except (asyncio.TimeoutError, ContentBlockedError, ResourceExhausted):
+        # Slowness, the content and the project quota; none of them is the
+        # file's fault.
+        raise
+    except Exception:
+        # Possibly the file itself (gone, unreadable): handing it to the next
+        # attempt would fail that one too, and charge it again.
+        rejected = True
+        raise
     finally:
-        if video_file is not None:
-            try:
-                genai.delete_file(video_file.name)
-                logger.debug(f"Deleted uploaded file from Gemini: {video_file.name}")
-            except Exception as e:
-                logger.warning(f"Failed to delete uploaded file from Gemini: {e}")
+        # A tracked file stays on Gemini for the next attempt; the reaper
+        # deletes it later. An untracked one is deleted now, as before.
+        if key is None:
+            await _delete(video_file)
+        elif rejected:
+            uploaded_files.release(key)
+            await uploaded_files.discard(key, video_file)
+        else:
+            uploaded_files.release(key)
+
+
+async def analyze_video_content(
+    video_path: str,
+    analyze_scenes: bool = False,
+    analyze_audio: bool = False,
+    usage: Optional[TokenUsage] = None,
+    audio_only: bool = False,
+    reuse_keys: Sequence[str] = (),
+):
+    """`usage` is filled in place rather than returned, so the caller still gets
+    the cost when the analysis raises. `audio_only` means `video_path` is just
+    the audio track. `reuse_keys` name the content of `video_path`: a file
+    already uploaded under one of them is used instead of uploading again,
+    and a new upload is kept under the first."""
+    if usage is not None:
+        usage.mode = "audio" if audio_only else "video"
+
+    system_prompt = get_system_prompt(analyze_scenes, analyze_audio, audio_only=audio_only)
+    return await _guarded(_analyze_upload(video_path, system_prompt, usage, reuse_keys))
+
+
+async def analyze_keyframes(
+    frames: list[bytes],
+    audio: Optional[bytes] = None,
+    analyze_scenes: bool = False,
+    analyze_audio: bool = False,
+    usage: Optional[TokenUsage] = None,
+):
+    """Like analyze_video_content, but from JPEG stills (and the AAC track)
+    sent inline, so nothing is uploaded and there is no processing to wait
+    for."""
+    if usage is not None:
+        usage.mode = "keyframes"
+
+    system_prompt = get_system_prompt(
+        analyze_scenes, analyze_audio and audio is not None, keyframes=True
+    )
+    contents = [system_prompt] + [{"mime_type": "image/jpeg", "data": frame} for frame in frames]
+    if audio is not None:
+        contents.append({"mime_type": "audio/aac", "data": audio})
+
+    return await _guarded(_generate(contents, usage))
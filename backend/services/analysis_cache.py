@@ -0,0 +1,63 @@
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from core.gemini import GENERATION_MODEL
+from core.logger import get_logger
+from db import execute, run_in_db_pool, supabase
+
+logger = get_logger("services.analysis_cache")
+
+# A tweet's video does not change, so the TTL is there for the prompt and the
+# DTO limits, which do. Entries past it are never served and are deleted on
+# the next write, as is everything beyond the size cap. Set
+# ANALYSIS_CACHE_MAX_ENTRIES=0 to disable the cache.
+ANALYSIS_CACHE_TTL_SECONDS = int(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "5000"))
+
+
+def _key(tweet_id: str, analyze_scenes: bool, analyze_audio: bool) -> dict:
+    return {
+        "tweet_id": tweet_id,
+        "analyze_scenes": analyze_scenes,
+        "analyze_audio": analyze_audio,
+        "model": GENERATION_MODEL,
+    }
+
+
+def _fetch_cached_analysis(tweet_id: str, analyze_scenes: bool, analyze_audio: bool) -> Optional[dict]:
+    fresh_since = datetime.now(timezone.utc) - timedelta(seconds=ANALYSIS_CACHE_TTL_SECONDS)
+
+    query = supabase.table("analysis_cache").select("result")
+    for column, value in _key(tweet_id, analyze_scenes, analyze_audio).items():
+        query = query.eq(column, value)
+
+    response = query.gte("created_at", fresh_since.isoformat()).limit(1).execute()
+    return response.data[0]["result"] if response.data else None
+
+
+async def get_cached_analysis(tweet_id: str, analyze_scenes: bool, analyze_audio: bool) -> Optional[dict]:
+    if ANALYSIS_CACHE_MAX_ENTRIES <= 0:
+        return None
+
+    return await run_in_db_pool(_fetch_cached_analysis, tweet_id, analyze_scenes, analyze_audio)
+
+
+async def store_analysis(tweet_id: str, analyze_scenes: bool, analyze_audio: bool, result: dict) -> None:
+    if ANALYSIS_CACHE_MAX_ENTRIES <= 0:
+        return
+
+    row = {
+        **_key(tweet_id, analyze_scenes, analyze_audio),
+        "result": result,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    await execute(supabase.table("analysis_cache").upsert(row))
+
+    pruned = (await execute(supabase.rpc("prune_analysis_cache", {
+        "max_age_seconds": ANALYSIS_CACHE_TTL_SECONDS,
+        "max_rows": ANALYSIS_CACHE_MAX_ENTRIES,
+    }))).data
+
+    if pruned:
+        logger.debug(f"Pruned {pruned} analysis cache entries")
@@ -0,0 +1,173 @@
+import asyncio
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from core.logger import get_logger
+from db import run_in_db_pool, supabase
+
+logger = get_logger("services.archive")
+
+# Bumped every time this process writes to the videos table. Anything derived
+# from the archive (cached search results, for one) records the generation it
+# was built against and is simply never served once the number moves on, which
+# avoids having to find and purge every affected entry.
+#
+# Writes from another process are invisible here, so derived caches still need
+# a short TTL to bound how stale they can get.
+_generation = 0
+_lock = threading.Lock()
+
+
+def generation() -> int:
+    return _generation
+
+
+def bump_generation() -> int:
+    global _generation
+
+    with _lock:
+        _generation += 1
+        logger.debug(f"Archive generation is now {_generation}")
+        return _generation
+
+
+# Large enough that a cold start over the whole archive is a handful of round
+# trips, small enough that a single page never hits PostgREST's row cap.
+FETCH_PAGE_SIZE = 1000
+
+
+def fetch_videos_since(columns: str, watermark: Optional[str] = None) -> list[dict]:
+    """Every video created at or after `watermark`, oldest first.
+
+    Inclusive on purpose: two rows can share a timestamp and commit at
+    different moments, so callers that mirror the archive must tolerate seeing
+    a row twice rather than risk never seeing it at all.
+    """
+    rows: list[dict] = []
+    offset = 0
+
+    while True:
+        query = supabase.table("videos").select(columns)
+        if watermark:
+            query = query.gte("created_at", watermark)
+
+        page = (
+            query.order("created_at")
+            .order("id")
+            .range(offset, offset + FETCH_PAGE_SIZE - 1)
+            .execute()
+        ).data or []
+
+        rows.extend(page)
+        if len(page) < FETCH_PAGE_SIZE:
+            return rows
+
+        offset += FETCH_PAGE_SIZE
+
+
+def _fetch_video_by_tweet_id(tweet_id: str) -> Optional[dict]:
+    response = (
+        supabase.table("videos")
+        .select("id, created_at, titulo_video, url_original")
+        .eq("tweet_id", tweet_id)
+        .limit(1)
+        .execute()
+    )
+    return response.data[0] if response.data else None
+
+
+async def find_video_by_tweet_id(tweet_id: str) -> Optional[dict]:
+    """The archived video for a tweet, whatever URL it was saved under."""
+    return await run_in_db_pool(_fetch_video_by_tweet_id, tweet_id)
+
+
+# How long another process's writes can go unseen by a mirror. Writes made by
+# this process move the archive generation and are picked up on the next read.
+# VECTOR_INDEX_SYNC_SECONDS is the name this had while only the vector index
+# mirrored the archive, and is still honoured.
+ARCHIVE_MIRROR_SYNC_SECONDS = int(
+    os.getenv("ARCHIVE_MIRROR_SYNC_SECONDS", os.getenv("VECTOR_INDEX_SYNC_SECONDS", "30"))
+)
+
+
+class ArchiveMirror(ABC):
+    """Base for in-process copies of the videos table.
+
+    Subclasses name the columns they need and fold rows in through `add`; this
+    class owns when to pull and from where. Pulls are incremental from a
+    created_at watermark, and `add` must tolerate rows it has already seen.
+    """
+
+    name = "archive mirror"
+    columns = "id, created_at"
+
+    def __init__(self):
+        self.watermark: Optional[str] = None
+        self.ready = False
+        self._synced_generation: Optional[int] = None
+        self._synced_at = 0.0
+        self._sync_lock = asyncio.Lock()
+
+    @abstractmethod
+    def add(self, rows: list[dict]) -> int:
+        """Fold `rows` in and return how many were new."""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    def _advance_watermark(self, row: dict) -> None:
+        created_at = row.get("created_at")
+        if created_at and (self.watermark is None or created_at > self.watermark):
+            self.watermark = created_at
+
+    def is_stale(self) -> bool:
+        return (
+            self._synced_generation != generation()
+            or time.monotonic() - self._synced_at > ARCHIVE_MIRROR_SYNC_SECONDS
+        )
+
+    async def sync(self, only_if_stale: bool = False) -> int:
+        """Pull every row at or past the watermark. The first call loads the
+        whole archive."""
+        async with self._sync_lock:
+            # Checked again under the lock: a burst of searches all find the
+            # mirror stale and queue here, and the first pull serves the rest.
+            if only_if_stale and not self.is_stale():
+                return 0
+
+            seen_generation = generation()
+            rows = await run_in_db_pool(fetch_videos_since, self.columns, self.watermark)
+            added = self.add(rows)
+
+            self._synced_generation = seen_generation
+            self._synced_at = time.monotonic()
+            self.ready = True
+
+            if added:
+                logger.info(f"{self.name} synced: +{added} rows, {len(self)} total")
+            return added
+
+    async def refresh_if_stale(self) -> None:
+        if not self.is_stale():
+            return
+
+        try:
+            await self.sync(only_if_stale=True)
+        except Exception as e:
+            # A mirror a few rows behind still answers correctly for everything
+            # it holds; failing the search over it would be worse.
+            logger.warning(f"{self.name} sync failed; serving it as it stands: {e}")
+
+    async def load(self) -> None:
+        """Startup hook. A failure leaves the mirror unready, and its searches
+        keep going to Postgres."""
+        try:
+            started = time.monotonic()
+            await self.sync()
+            logger.info(f"{self.name} loaded: {len(self)} rows in {time.monotonic() - started:.2f}s")
+        except Exception as e:
+            logger.error(f"Failed to load {self.name}; its searches stay on Postgres: {e}")
@@ -0,0 +1,157 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Optional, TypeVar
+from urllib.parse import urlparse
+
+from yt_dlp.utils import DownloadCancelled
+
+from core.logger import get_logger
+
+logger = get_logger("services.download_pool")
+
+T = TypeVar("T")
+
+# Downloads run on a pool of their own, like database and Gemini calls: a few
+# slow 100 MB fetches must not hold the threads everything else shares. They
+# are network reads and ffmpeg subprocesses, so threads are enough; a process
+# pool would also throw away the per-thread extractor and probe cache reuse.
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "4"))
+
+
+def _parse_host_limits(value: str) -> dict[str, int]:
+    limits = {}
+    for item in value.split(","):
+        host, _, limit = item.strip().partition("=")
+        if host and limit:
+            limits[host.strip().lower()] = int(limit)
+    return limits
+
+
+# Concurrent downloads per site, so a burst of analyses does not look like a
+# scraper to it. Hosts not listed share only the DOWNLOAD_WORKERS bound.
+DOWNLOAD_HOST_LIMITS = _parse_host_limits(os.getenv("DOWNLOAD_HOST_LIMITS", "twitter.com=3,x.com=3"))
+
+_executor = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix="download")
+_host_slots: dict[str, asyncio.Semaphore] = {}
+_local = threading.local()
+
+_lock = threading.Lock()
+_downloads: set["_Download"] = set()
+
+
+class _Download:
+    """One call's place in the pool: queued until a thread picks it up, then
+    running. State changes happen under _lock, from either side."""
+
+    def __init__(self, host: str):
+        self.host = host
+        self.state = "queued"
+        self.cancelled = threading.Event()
+
+
+@dataclass
+class DownloadPoolStats:
+    workers: int
+    queued: int
+    running: int
+    by_host: dict[str, int]
+
+
+def _host(url: str) -> str:
+    host = (urlparse(url).hostname or "").lower()
+    for prefix in ("www.", "mobile."):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    return host
+
+
+def _slots_for(host: str) -> Optional[asyncio.Semaphore]:
+    limit = DOWNLOAD_HOST_LIMITS.get(host)
+    if limit is None:
+        return None
+    if host not in _host_slots:
+        _host_slots[host] = asyncio.Semaphore(limit)
+    return _host_slots[host]
+
+
+def raise_if_cancelled(_progress: Optional[dict] = None) -> None:
+    """For yt-dlp's progress_hooks: stops the download running on this thread
+    once its caller has given up on it. A thread cannot be killed, so this is
+    how a running download is cancelled."""
+    download = getattr(_local, "download", None)
+    if download is not None and download.cancelled.is_set():
+        raise DownloadCancelled("Download cancelled")
+
+
+async def run_download(fn: Callable[..., T], url: str, *args) -> T:
+    """Run `fn(url, *args)` on the download pool, within the per-host limit.
+
+    Cancelling the awaiting task cancels the download: before it starts it is
+    simply dropped, and once it runs, yt-dlp stops at its next progress tick.
+    """
+    download = _Download(_host(url))
+
+    def call():
+        with _lock:
+            if download.state != "queued":
+                raise DownloadCancelled("Download cancelled")
+            download.state = "running"
+
+        _local.download = download
+        try:
+            return fn(url, *args)
+        finally:
+            _local.download = None
+            with _lock:
+                _downloads.discard(download)
+
+    with _lock:
+        _downloads.add(download)
+
+    slots = _slots_for(download.host)
+    try:
+        if slots is None:
+            return await asyncio.get_running_loop().run_in_executor(_executor, call)
+
+        async with slots:
+            return await asyncio.get_running_loop().run_in_executor(_executor, call)
+
+    except asyncio.CancelledError:
+        download.cancelled.set()
+        logger.info(f"Download from {download.host} cancelled")
+        raise
+
+    finally:
+        # Still queued means no thread will ever run it, so it is forgotten
+        # here; a running one is forgotten by its thread when it stops.
+        with _lock:
+            if download.state == "queued":
+                download.state = "dropped"
+                _downloads.discard(download)
+
+
+def stats() -> DownloadPoolStats:
+    with _lock:
+        downloads = [(d.host, d.state) for d in _downloads]
+
+    by_host: dict[str, int] = {}
+    for host, _state in downloads:
+        by_host[host] = by_host.get(host, 0) + 1
+
+    return DownloadPoolStats(
+        workers=DOWNLOAD_WORKERS,
+        queued=sum(1 for _host, state in downloads if state == "queued"),
+        running=sum(1 for _host, state in downloads if state == "running"),
+        by_host=by_host,
+    )
+
+
+def close() -> None:
+    """Drop queued downloads and stop the running ones."""
+    with _lock:
+        for download in _downloads:
+            download.cancelled.set()
+    _executor.shutdown(wait=False, cancel_futures=True)
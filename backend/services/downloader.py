@@ -1,55 +1,168 @@
+import copy
+import hashlib
 import os
+import subprocess
+import threading
 import uuid
+from dataclasses import dataclass
+from typing import Optional
+
 import yt_dlp
+from yt_dlp.utils import download_range_func
+from core.cache import TTLCache
+from core.exceptions import InvalidWindowError, extract_tweet_id
 from core.logger import get_logger
+from services.download_pool import raise_if_cancelled
+from services.temp_storage import TEMP_DIR
 
 logger = get_logger("services.downloader")
 
-DOWNLOAD_DIR = "temp_downloads"
+DOWNLOAD_DIR = TEMP_DIR
 MAX_FILESIZE_MB = 100 
 SOCKET_TIMEOUT = 30
 
-if not os.path.exists(DOWNLOAD_DIR):
-    os.makedirs(DOWNLOAD_DIR)
+# Gemini bills every second it is sent, so no analysis covers more than this
+# much of a video unless the server is configured otherwise (0 = no limit).
+# Longer videos are cut at download time, which also bounds the bytes fetched
+# and the disk used here.
+MAX_CLIP_SECONDS = int(os.getenv("MAX_CLIP_SECONDS", "300"))
+
+# What a probe returns (formats, duration, size) is the same for every request
+# for a tweet, but the media URLs in it expire, so the TTL stays short.
+PROBE_CACHE_SIZE = int(os.getenv("PROBE_CACHE_SIZE", "256"))
+PROBE_CACHE_TTL_SECONDS = int(os.getenv("PROBE_CACHE_TTL_SECONDS", "600"))
+
+YDL_OPTIONS = {
+    'format': f'best[ext=mp4][filesize<{MAX_FILESIZE_MB}M]/best[ext=mp4]/best',
+    'quiet': True,
+    'no_warnings': True,
+    'socket_timeout': SOCKET_TIMEOUT,
+    'max_filesize': MAX_FILESIZE_MB * 1024 * 1024,
+    'progress_hooks': [raise_if_cancelled],
+}
+
+probe_cache = TTLCache(PROBE_CACHE_SIZE, PROBE_CACHE_TTL_SECONDS)
+_local = threading.local()
+
+
+def clip_window(
+    duration: Optional[float], start: float = 0.0, end: Optional[float] = None
+) -> Optional[tuple[float, float]]:
+    """The (start, end) seconds to fetch, or None to fetch the whole video.
+    `end` is capped at MAX_CLIP_SECONDS after `start`."""
+    stop = end if end is not None else float("inf")
+    if MAX_CLIP_SECONDS > 0:
+        stop = min(stop, start + MAX_CLIP_SECONDS)
+
+    if duration:
+        if start >= duration:
+            raise InvalidWindowError(
+                f"The analysis window starts at {start:g}s but the video is only {duration:.0f}s long"
+            )
+        stop = min(stop, duration)
+        if start == 0 and stop >= duration:
+            return None
+    elif start == 0 and end is None:
+        # Nothing says the video is long, and a ranged download needs ffmpeg;
+        # MAX_FILESIZE_MB still bounds it.
+        return None
+
+    return (start, stop)
+
+
+def _downloader() -> yt_dlp.YoutubeDL:
+    """This thread's YoutubeDL. Building one loads every extractor, and the
+    extractors keep state worth reusing (the Twitter one, its guest token);
+    one per executor thread shares that without sharing an object yt-dlp does
+    not make thread-safe."""
+    ydl = getattr(_local, "ydl", None)
+    if ydl is None:
+        ydl = yt_dlp.YoutubeDL(dict(YDL_OPTIONS))
+        _local.ydl = ydl
+    return ydl
+
+
+def probe_video(url: str) -> dict:
+    """yt-dlp's info for `url`, cached by tweet ID. A copy every time, since
+    downloading from it writes into it."""
+    key = extract_tweet_id(url) or url
+    info = probe_cache.get(key)
 
+    if info is None:
+        ydl = _downloader()
+        info = ydl.sanitize_info(ydl.extract_info(url, download=False))
+        probe_cache.set(key, info)
+    else:
+        logger.debug(f"Probe cache hit for {key}")
 
-def download_video(url: str) -> str:
+    return copy.deepcopy(info)
+
+
+def _first_video(info: dict) -> dict:
+    """The video to analyse. A tweet with several videos is extracted as a
+    playlist of them; the first one is the one shown first in the tweet."""
+    while info.get('_type') == 'playlist':
+        entries = [entry for entry in info.get('entries') or [] if entry]
+        if not entries:
+            raise ValueError("The tweet has no downloadable video")
+        info = entries[0]
+    return info
+
+
+def download_video(url: str, start: float = 0.0, end: Optional[float] = None) -> str:
+    """Download the video behind `url`, or only the part of it the analysis
+    window (see clip_window) covers."""
     video_id = str(uuid.uuid4())
     output_template = os.path.join(DOWNLOAD_DIR, f"{video_id}.%(ext)s")
     
     logger.info(f"Starting download for URL: {url}")
 
-    ydl_opts = {
-        'format': f'best[ext=mp4][filesize<{MAX_FILESIZE_MB}M]/best[ext=mp4]/best',
-        'outtmpl': output_template,
-        'quiet': True, 
-        'no_warnings': True,
-        'socket_timeout': SOCKET_TIMEOUT,
-        'max_filesize': MAX_FILESIZE_MB * 1024 * 1024,
-    }
-
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            
-            filesize = info.get('filesize') or info.get('filesize_approx')
-            if filesize and filesize > MAX_FILESIZE_MB * 1024 * 1024:
-                raise ValueError(f"Video file size ({filesize / 1024 / 1024:.1f}MB) exceeds limit ({MAX_FILESIZE_MB}MB)")
-            
-            logger.debug(f"Video title detected: {info.get('title', 'Unknown')}")
-
-            ydl.download([url])
-            
-            for file in os.listdir(DOWNLOAD_DIR):
-                if file.startswith(video_id):
-                    final_path = os.path.join(DOWNLOAD_DIR, file)
-                    logger.info(f"Download finished successfully: {final_path}")
-                    return final_path
-            
+        info = _first_video(probe_video(url))
+
+        duration = info.get('duration')
+        window = clip_window(duration, start, end)
+
+        filesize = info.get('filesize') or info.get('filesize_approx')
+        if filesize and window and duration:
+            # Only the window is fetched, so that is what counts.
+            filesize = filesize * (window[1] - window[0]) / duration
+        if filesize and filesize > MAX_FILESIZE_MB * 1024 * 1024:
+            raise ValueError(f"Video file size ({filesize / 1024 / 1024:.1f}MB) exceeds limit ({MAX_FILESIZE_MB}MB)")
+        
+        logger.debug(f"Video title detected: {info.get('title', 'Unknown')}")
+
+        ydl = _downloader()
+        # Per-call settings on a shared instance: both are set every time so
+        # nothing carries over from the previous download on this thread.
+        ydl.params['outtmpl'] = {'default': output_template}
+        ydl.params.pop('download_ranges', None)
+
+        if window:
+            # yt-dlp hands ranged downloads to ffmpeg, which reads only the
+            # segments (HLS) or byte ranges (MP4) the window needs. Cuts land
+            # on the nearest keyframe; exact cuts would mean re-encoding.
+            logger.info(f"Fetching {window[0]:g}s-{window[1]:g}s of a {duration or '?'}s video")
+            ydl.params['download_ranges'] = download_range_func(None, [window])
+
+        # Downloads straight from the probed info rather than re-extracting
+        # the tweet, which is what ydl.download([url]) would do.
+        result = ydl.process_ie_result(info, download=True) or {}
+
+        downloads = result.get('requested_downloads') or [{}]
+        final_path = downloads[0].get('filepath') or ydl.prepare_filename(info)
+
+        if not os.path.exists(final_path):
             raise FileNotFoundError("Download finished but file not found.")
 
+        logger.info(f"Download finished successfully: {final_path}")
+        return final_path
+
     except Exception as e:
         logger.error(f"Failed to download video: {e}")
+        # The cached info may be what failed (media URLs expire), so the next
+        # attempt extracts afresh.
+        probe_cache.pop(extract_tweet_id(url) or url)
         _cleanup_partial_downloads(video_id)
         raise e
 
@@ -61,4 +174,106 @@ def _cleanup_partial_downloads(video_id: str) -> None:
                 os.remove(file_path)
                 logger.debug(f"Cleaned up partial download: {file_path}")
     except Exception as e:
-        logger.warning(f"Failed to clean up partial downloads: {e}")
\ No newline at end of file
+        logger.warning(f"Failed to clean up partial downloads: {e}")
+
+
+# Reposts of a viral clip arrive under unrelated tweet URLs, so the URL says
+# nothing about whether the video is new. Two fingerprints answer that instead:
+# the SHA-256 of the file catches byte-identical copies, and a difference hash
+# (dHash) of frames sampled evenly across the video catches re-encodes, resizes
+# and recompressions, which change every byte but barely change a 9x8 greyscale
+# thumbnail.
+FINGERPRINT_FRAMES = 16
+FINGERPRINT_BITS = FINGERPRINT_FRAMES * 64
+FINGERPRINT_TIMEOUT = 30
+
+# Mostly flat frames (black, a single colour) hash to nearly all zeros, which
+# would make every dark video look like every other. Below this many set bits
+# the perceptual half is dropped and only the exact hash is used.
+MIN_FINGERPRINT_BITS_SET = FINGERPRINT_BITS // 8
+
+
+@dataclass
+class VideoFingerprint:
+    sha256: str
+    # FINGERPRINT_BITS characters of '0'/'1', the literal pgvector's bit type
+    # takes; None when the frames were too few or too flat to be distinctive.
+    frames: Optional[str] = None
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _duration(path: str) -> float:
+    probe = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+        capture_output=True, text=True, timeout=FINGERPRINT_TIMEOUT, check=True,
+    )
+    return float(probe.stdout.strip())
+
+
+def _sample_frames(path: str) -> bytes:
+    """FINGERPRINT_FRAMES greyscale 9x8 frames, spread evenly over the video,
+    as raw bytes."""
+    duration = _duration(path)
+    rate = FINGERPRINT_FRAMES / max(duration, 0.1)
+
+    frames = subprocess.run(
+        [
+            "ffmpeg", "-v", "error", "-i", path,
+            "-vf", f"fps={rate:.6f},scale=9:8,format=gray",
+            "-frames:v", str(FINGERPRINT_FRAMES),
+            "-f", "rawvideo", "-",
+        ],
+        capture_output=True, timeout=FINGERPRINT_TIMEOUT, check=True,
+    )
+    return frames.stdout
+
+
+def dhash(frame: bytes) -> int:
+    """64-bit difference hash of one 9x8 greyscale frame: one bit per pair of
+    horizontally adjacent pixels, set when brightness increases."""
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = frame[row * 9 + col]
+            right = frame[row * 9 + col + 1]
+            bits = (bits << 1) | (right > left)
+    return bits
+
+
+def _frames_signature(raw: bytes) -> Optional[str]:
+    frame_size = 9 * 8
+    if len(raw) < FINGERPRINT_FRAMES * frame_size:
+        return None
+
+    signature = "".join(
+        format(dhash(raw[i * frame_size:(i + 1) * frame_size]), "064b")
+        for i in range(FINGERPRINT_FRAMES)
+    )
+    if signature.count("1") < MIN_FINGERPRINT_BITS_SET:
+        return None
+    return signature
+
+
+def fingerprint_video(path: str) -> Optional[VideoFingerprint]:
+    """Best effort: None if the file cannot be read, and no perceptual half if
+    ffmpeg cannot sample it. Fingerprinting only ever saves work, so it must
+    never be the reason an analysis fails."""
+    try:
+        fingerprint = VideoFingerprint(sha256=_sha256(path))
+    except OSError as e:
+        logger.warning(f"Could not hash {path}: {e}")
+        return None
+
+    try:
+        fingerprint.frames = _frames_signature(_sample_frames(path))
+    except (OSError, ValueError, subprocess.SubprocessError) as e:
+        logger.warning(f"Could not sample frames from {path}: {e}")
+
+    return fingerprint
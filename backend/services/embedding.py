@@ -1,10 +1,28 @@
+import os
+
+from core.cache import TTLCache
 from core.logger import get_logger
-from core.gemini import get_genai, EMBEDDING_MODEL
+from core.gemini import embed_content, EMBEDDING_DIMENSIONS, EMBEDDING_MODEL
 from dtos import VideoMetadataDTO
 
 logger = get_logger("services.embedding")
 
-genai = get_genai()
+# Search traffic is dominated by a few hundred popular queries, and a query
+# vector never changes for a given model, so repeats need not pay a Gemini
+# round trip. The TTL only bounds how long a vector outlives a model swap that
+# kept the same name; set QUERY_CACHE_SIZE=0 to disable the cache.
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1000"))
+QUERY_CACHE_TTL_SECONDS = int(os.getenv("QUERY_CACHE_TTL_SECONDS", "86400"))
+
+query_cache = TTLCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL_SECONDS)
+
+# How videos.embedding is stored: "vector" (float32, the default) or "halfvec"
+# (float16, see the migration at the end of schema.sql). Vectors are sent with
+# exactly the precision the column keeps: 9 significant digits round-trip any
+# float32, 5 any float16. Anything beyond that is thrown away by Postgres on
+# arrival, after having been serialised, sent and parsed for nothing.
+EMBEDDING_STORAGE = os.getenv("EMBEDDING_STORAGE", "vector").lower()
+VECTOR_DIGITS = 5 if EMBEDDING_STORAGE == "halfvec" else 9
 
 # gemini-embedding-001 accepts at most 2048 input tokens and returns an error
 # (rather than truncating) when that ceiling is exceeded. Counting tokens
@@ -65,16 +83,16 @@ def generate_searchable_text(data: VideoMetadataDTO) -> str:
     return payload
 
 
-def create_embedding(data: VideoMetadataDTO) -> list[float]:
+async def create_embedding(data: VideoMetadataDTO) -> list[float]:
     text_payload = generate_searchable_text(data)
 
     try:
         logger.info("Generating embedding for video metadata...")
-        result = genai.embed_content(
+        result = await embed_content(
             model=EMBEDDING_MODEL,
             content=text_payload,
             task_type="retrieval_document",
-            output_dimensionality=768
+            output_dimensionality=EMBEDDING_DIMENSIONS
         )
 
         embedding = result['embedding']
@@ -86,18 +104,74 @@ def create_embedding(data: VideoMetadataDTO) -> list[float]:
         raise e
 
 
+def encode_vector(vector: list[float]) -> str:
+    """pgvector's text literal, e.g. "[0.0123,-0.5]". PostgREST hands it to the
+    column or RPC parameter as is, and it is less than half the size of the
+    17-digit JSON float list the SDK returns."""
+    return "[" + ",".join(format(value, f".{VECTOR_DIGITS}g") for value in vector) + "]"
+
+
+def normalize_query(text: str) -> str:
+    """Collapse the differences that do not change what was asked: case and
+    runs of whitespace."""
+    return " ".join(text.split()).casefold()
+
+
+def _query_cache_key(text: str) -> tuple:
+    # The model and dimensionality are part of the key so that changing either
+    # can never serve a vector from the old space.
+    return (normalize_query(text), EMBEDDING_MODEL, EMBEDDING_DIMENSIONS)
+
+
 # No truncation needed here: SearchRequest.query is already capped at 500
 # characters by validation, well under the model's input limit.
-def embed_query(text: str) -> list[float]:
+async def embed_query(text: str) -> list[float]:
+    key = _query_cache_key(text)
+
+    cached = query_cache.get(key)
+    if cached is not None:
+        logger.debug(f"Query embedding served from cache: {text[:50]}...")
+        return cached
+
     try:
         logger.debug(f"Embedding query text: {text[:50]}...")
-        result = genai.embed_content(
+        result = await embed_content(
             model=EMBEDDING_MODEL,
-            content=text,
+            content=key[0],
             task_type="retrieval_query",
-            output_dimensionality=768
+            output_dimensionality=EMBEDDING_DIMENSIONS
         )
-        return result['embedding']
     except Exception as e:
         logger.error(f"Failed to embed query: {e}")
         raise e
+
+    embedding = result['embedding']
+    query_cache.set(key, embedding)
+    return embedding
+
+
+async def embed_queries(texts: list[str]) -> list[list[float]]:
+    """embed_query for many texts at once: cached vectors are reused and every
+    miss goes to Gemini in a single batched call."""
+    keys = [_query_cache_key(text) for text in texts]
+    vectors = {key: query_cache.get(key) for key in keys}
+    missing = list(dict.fromkeys(key for key, vector in vectors.items() if vector is None))
+
+    if missing:
+        try:
+            logger.debug(f"Embedding {len(missing)} query texts in one call")
+            result = await embed_content(
+                model=EMBEDDING_MODEL,
+                content=[key[0] for key in missing],
+                task_type="retrieval_query",
+                output_dimensionality=EMBEDDING_DIMENSIONS
+            )
+        except Exception as e:
+            logger.error(f"Failed to embed query batch: {e}")
+            raise e
+
+        for key, embedding in zip(missing, result['embedding']):
+            query_cache.set(key, embedding)
+            vectors[key] = embedding
+
+    return [vectors[key] for key in keys]
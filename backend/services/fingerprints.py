@@ -0,0 +1,41 @@
+import os
+from typing import Optional
+
+from core.logger import get_logger
+from db import execute, supabase
+from services.downloader import FINGERPRINT_BITS, VideoFingerprint
+
+logger = get_logger("services.fingerprints")
+
+# How many of the FINGERPRINT_BITS frame-hash bits may differ for two videos to
+# count as the same content. Re-encodes of one clip typically land well under
+# 5%; unrelated clips sit near 50%. The bound stays at 5% because a false match
+# is costly: another video's analysis, or a 409 pointing at it.
+FINGERPRINT_MAX_DISTANCE = int(os.getenv("FINGERPRINT_MAX_DISTANCE", str(FINGERPRINT_BITS // 20)))
+
+
+async def find_same_content(fingerprint: VideoFingerprint) -> Optional[str]:
+    """The tweet an identical or near-identical video was analysed for."""
+    response = await execute(supabase.rpc("match_fingerprint", {
+        "query_sha256": fingerprint.sha256,
+        "query_frames": fingerprint.frames,
+        "max_distance": FINGERPRINT_MAX_DISTANCE,
+    }))
+
+    if not response.data:
+        return None
+
+    match = response.data[0]
+    logger.debug(f"Content matches tweet {match['tweet_id']} at distance {match['distance']}")
+    return match["tweet_id"]
+
+
+async def record_fingerprint(fingerprint: VideoFingerprint, tweet_id: str) -> None:
+    # The first tweet a content was analysed for keeps it: that is the one
+    # the archive and the analysis cache know about.
+    await execute(
+        supabase.table("video_fingerprints").upsert(
+            {"sha256": fingerprint.sha256, "frames": fingerprint.frames, "tweet_id": tweet_id},
+            ignore_duplicates=True,
+        )
+    )
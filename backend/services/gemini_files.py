@@ -0,0 +1,144 @@
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Optional, Sequence
+
+from core.gemini import delete_file
+from core.logger import get_logger
+
+logger = get_logger("services.gemini_files")
+
+# Uploaded videos are kept on Gemini for a while instead of being deleted as
+# soon as their analysis ends, so a retry or a re-analysis of the same content
+# with other flags skips the upload and the PROCESSING wait. Gemini itself
+# drops files after 48 hours; they are reaped well before that, and before the
+# project's file storage fills up.
+GEMINI_FILE_REUSE_SECONDS = int(os.getenv("GEMINI_FILE_REUSE_SECONDS", str(6 * 3600)))
+GEMINI_FILE_REUSE_MAX = int(os.getenv("GEMINI_FILE_REUSE_MAX", "100"))
+REAPER_INTERVAL_SECONDS = 300
+
+# Never hand out a file this close to Gemini's own expiry: it could vanish
+# while the generation that uses it is still running.
+EXPIRY_MARGIN_SECONDS = 600
+
+
+@dataclass
+class TrackedFile:
+    file: Any
+    expires_at: float
+    in_use: int = 0
+
+
+def _expires_at(file, now: float) -> float:
+    expires_at = now + GEMINI_FILE_REUSE_SECONDS
+
+    expiration = getattr(file, "expiration_time", None)
+    if isinstance(expiration, datetime):
+        if expiration.tzinfo is None:
+            expiration = expiration.replace(tzinfo=timezone.utc)
+        expires_at = min(expires_at, expiration.timestamp() - EXPIRY_MARGIN_SECONDS)
+
+    return expires_at
+
+
+class UploadRegistry:
+    """ACTIVE Gemini files by content key. A file in use by an analysis is
+    never reaped; every other one is deleted once it expires or the registry
+    is over capacity."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._files: dict[str, TrackedFile] = {}
+        self.reused = 0
+
+    def acquire(self, keys: Sequence[str]) -> Optional[tuple[str, Any]]:
+        """The first still-valid file under any of `keys`, marked in use until
+        release(key)."""
+        now = time.time()
+        for key in keys:
+            tracked = self._files.get(key)
+            if tracked is not None and tracked.expires_at > now:
+                tracked.in_use += 1
+                self.reused += 1
+                return key, tracked.file
+        return None
+
+    def has(self, keys: Sequence[str]) -> bool:
+        """Whether acquire(keys) would find a file, without taking it."""
+        now = time.time()
+        return any(
+            key in self._files and self._files[key].expires_at > now for key in keys
+        )
+
+    def add(self, key: str, file) -> bool:
+        """Track a freshly processed file, in use by the caller. False when the
+        registry is disabled or already holds the key, so the caller keeps
+        ownership and deletes the file itself."""
+        if self.max_entries <= 0 or key in self._files:
+            return False
+
+        self._files[key] = TrackedFile(file, _expires_at(file, time.time()), in_use=1)
+        return True
+
+    def release(self, key: str) -> None:
+        tracked = self._files.get(key)
+        if tracked is not None:
+            tracked.in_use -= 1
+
+    async def discard(self, key: str, file=None) -> None:
+        """Forget `key` and delete its file, in use or not: Gemini refused it,
+        so every other analysis holding it would fail the same way. With
+        `file`, only if that is still the file under `key`."""
+        tracked = self._files.get(key)
+        if tracked is None or (file is not None and tracked.file is not file):
+            return
+
+        del self._files[key]
+        logger.warning(f"Dropped uploaded file {tracked.file.name} after a failed generation")
+        try:
+            await delete_file(tracked.file.name)
+        except Exception as e:
+            logger.warning(f"Failed to delete uploaded file {tracked.file.name}: {e}")
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    def _reapable(self, now: float) -> list[str]:
+        idle = [key for key, tracked in self._files.items() if not tracked.in_use]
+        expired = [key for key in idle if self._files[key].expires_at <= now]
+
+        # Oldest first beyond capacity: dicts keep insertion order.
+        surplus = len(self._files) - len(expired) - self.max_entries
+        oldest = [key for key in idle if key not in expired][:max(surplus, 0)]
+
+        return expired + oldest
+
+    async def reap(self, everything: bool = False) -> int:
+        now = time.time()
+        keys = [key for key, t in self._files.items() if not t.in_use] if everything else self._reapable(now)
+
+        for key in keys:
+            tracked = self._files.pop(key)
+            try:
+                await delete_file(tracked.file.name)
+                logger.debug(f"Reaped uploaded file {tracked.file.name}")
+            except Exception as e:
+                # It expires on Gemini's side anyway.
+                logger.warning(f"Failed to delete uploaded file {tracked.file.name}: {e}")
+
+        if keys:
+            logger.info(f"Reaped {len(keys)} uploaded files ({len(self._files)} kept)")
+        return len(keys)
+
+    async def run_reaper(self, interval: float = REAPER_INTERVAL_SECONDS) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reap()
+            except Exception:
+                logger.exception("Uploaded file reaper failed")
+
+
+uploaded_files = UploadRegistry(GEMINI_FILE_REUSE_MAX)
@@ -0,0 +1,114 @@
+import asyncio
+import os
+import secrets
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+
+from core.logger import get_logger
+
+logger = get_logger("services.jobs")
+
+# How many analyses run at once in this process, each one holding a download,
+# a Gemini upload and a generation. Jobs beyond that wait their turn, up to
+# ANALYSIS_QUEUE_LIMIT unfinished jobs in total; past that, new ones are
+# refused rather than left to wait longer than anyone would.
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "4"))
+ANALYSIS_QUEUE_LIMIT = int(os.getenv("ANALYSIS_QUEUE_LIMIT", "20"))
+
+# How long a finished job can still be fetched. Long enough for a client that
+# lost its connection to come back for the result.
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "900"))
+
+
+class JobQueueFullError(Exception):
+    """Too many unfinished jobs to accept another."""
+
+
+@dataclass
+class Job:
+    id: str
+    user_id: str
+    status: str = "queued"
+    result: Any = None
+    error: Optional[BaseException] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+
+class JobRunner:
+    """Runs coroutines as jobs on a bounded pool and keeps their outcome.
+
+    A job outlives the request that submitted it: a client that disconnects
+    does not cancel it, and can fetch the outcome by ID until it expires.
+    """
+
+    def __init__(self, workers: int, queue_limit: int, ttl_seconds: int):
+        self.queue_limit = queue_limit
+        self.ttl_seconds = ttl_seconds
+        self._slots = asyncio.Semaphore(workers)
+        self._jobs: dict[str, Job] = {}
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.ttl_seconds
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.done and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def unfinished(self, user_id: Optional[str] = None) -> int:
+        return sum(
+            1 for job in self._jobs.values()
+            if not job.done and (user_id is None or job.user_id == user_id)
+        )
+
+    def submit(self, user_id: str, work: Callable[[], Awaitable[Any]]) -> Job:
+        self._prune()
+
+        if self.unfinished() >= self.queue_limit:
+            raise JobQueueFullError()
+
+        job = Job(id=secrets.token_urlsafe(12), user_id=user_id)
+        job.task = asyncio.ensure_future(self._run(job, work))
+        self._jobs[job.id] = job
+
+        logger.info(f"Job {job.id} queued for {user_id} ({self.unfinished()} unfinished)")
+        return job
+
+    async def _run(self, job: Job, work: Callable[[], Awaitable[Any]]) -> None:
+        async with self._slots:
+            job.status = "running"
+            started = time.monotonic()
+
+            try:
+                job.result = await work()
+                job.status = "succeeded"
+            except Exception as e:
+                job.error = e
+                job.status = "failed"
+            finally:
+                job.finished_at = time.time()
+                logger.info(f"Job {job.id} {job.status} in {time.monotonic() - started:.1f}s")
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._prune()
+        return self._jobs.get(job_id)
+
+    async def wait(self, job: Job, timeout: Optional[float] = None) -> Job:
+        """Wait for the job to finish, or for `timeout` seconds. Shielded: the
+        waiter giving up never cancels the job."""
+        try:
+            await asyncio.wait_for(asyncio.shield(job.task), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return job
+
+
+analysis_jobs = JobRunner(ANALYSIS_WORKERS, ANALYSIS_QUEUE_LIMIT, JOB_TTL_SECONDS)
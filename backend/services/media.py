@@ -0,0 +1,248 @@
+import os
+import subprocess
+from dataclasses import dataclass
+from typing import Optional
+
+from core.logger import get_logger
+
+logger = get_logger("services.media")
+
+# Gemini samples video at about one frame per second and tokenises each frame
+# at a fixed budget, so pixels, frames and bits beyond what it looks at are
+# paid for in upload and processing time and buy nothing. The targets sit a
+# little above what the model samples. Audio is only kept when it will be
+# transcribed, since an audio track is billed per second on top of the frames.
+SHRINK_ENABLED = os.getenv("SHRINK_ENABLED", "true").lower() in ("1", "true", "yes")
+SHRINK_MAX_HEIGHT = int(os.getenv("SHRINK_MAX_HEIGHT", "480"))
+SHRINK_FPS = int(os.getenv("SHRINK_FPS", "2"))
+SHRINK_VIDEO_BITRATE = os.getenv("SHRINK_VIDEO_BITRATE", "600k")
+SHRINK_AUDIO_BITRATE = os.getenv("SHRINK_AUDIO_BITRATE", "48k")
+SHRINK_TIMEOUT = 120
+
+# A transcript-only analysis needs no frames at all, so only the audio track is
+# uploaded: mono AAC at speech quality, which Gemini downsamples to 16 kHz
+# anyway. Falls back to the video when the track cannot be extracted.
+AUDIO_ONLY_ENABLED = os.getenv("AUDIO_ONLY_ENABLED", "true").lower() in ("1", "true", "yes")
+AUDIO_ONLY_BITRATE = os.getenv("AUDIO_ONLY_BITRATE", "32k")
+
+# Keyframe mode sends a handful of stills instead of the video: one per scene
+# change, thinned evenly down to KEYFRAME_MAX_FRAMES. They go inline with the
+# prompt, together with the audio track when it is wanted, so everything has
+# to fit in one request; past KEYFRAME_MAX_INLINE_BYTES the video is uploaded
+# as usual instead.
+KEYFRAME_MAX_FRAMES = int(os.getenv("KEYFRAME_MAX_FRAMES", "12"))
+KEYFRAME_SCENE_THRESHOLD = float(os.getenv("KEYFRAME_SCENE_THRESHOLD", "0.3"))
+KEYFRAME_MAX_INLINE_BYTES = 18 * 1024 * 1024
+
+
+@dataclass
+class ShrinkResult:
+    """What to upload. `path` is the source itself when shrinking was skipped,
+    failed, or would not have made the file smaller."""
+    source_path: str
+    path: str
+    source_bytes: int
+    output_bytes: int
+    audio_only: bool = False
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.source_bytes - self.output_bytes
+
+    @property
+    def is_new_file(self) -> bool:
+        return self.path != self.source_path
+
+
+def _shrink_command(source: str, target: str, keep_audio: bool) -> list[str]:
+    command = [
+        "ffmpeg", "-v", "error", "-y", "-i", source,
+        "-vf", f"fps={SHRINK_FPS},scale=-2:'min({SHRINK_MAX_HEIGHT},ih)'",
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "30",
+        "-maxrate", SHRINK_VIDEO_BITRATE, "-bufsize", SHRINK_VIDEO_BITRATE,
+        "-pix_fmt", "yuv420p",
+    ]
+    if keep_audio:
+        command += ["-c:a", "aac", "-b:a", SHRINK_AUDIO_BITRATE, "-ac", "1"]
+    else:
+        command += ["-an"]
+
+    return command + ["-movflags", "+faststart", target]
+
+
+def _audio_command(source: str, target: str) -> list[str]:
+    # .aac (ADTS) rather than .m4a: audio/aac is a type Gemini accepts, and it
+    # is what the SDK guesses from the extension.
+    return [
+        "ffmpeg", "-v", "error", "-y", "-i", source,
+        "-vn", "-c:a", "aac", "-b:a", AUDIO_ONLY_BITRATE, "-ac", "1",
+        target,
+    ]
+
+
+def _transcode(path: str, target: str, command: list[str], audio_only: bool) -> ShrinkResult:
+    """Run `command` to produce `target` from `path`, keeping the result only
+    if it is smaller. Never raises: this only saves time, so any failure falls
+    back to uploading the file as downloaded."""
+    try:
+        source_bytes = os.path.getsize(path)
+    except OSError as e:
+        logger.warning(f"Cannot read {path} to shrink it: {e}")
+        return ShrinkResult(path, path, 0, 0)
+
+    unchanged = ShrinkResult(path, path, source_bytes, source_bytes)
+
+    try:
+        subprocess.run(command, capture_output=True, timeout=SHRINK_TIMEOUT, check=True)
+        output_bytes = os.path.getsize(target)
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning(f"Could not shrink {path}; uploading it as downloaded: {e}")
+        _remove(target)
+        return unchanged
+
+    if output_bytes >= source_bytes:
+        logger.debug(f"Shrinking {path} did not help ({source_bytes} -> {output_bytes} bytes)")
+        _remove(target)
+        return unchanged
+
+    result = ShrinkResult(path, target, source_bytes, output_bytes, audio_only)
+
+    # INFO, like token usage: this is the per-analysis record of what the
+    # stage saved in upload size.
+    logger.info(
+        f"Shrunk {'audio track' if audio_only else 'video'} for upload: "
+        f"{source_bytes} -> {output_bytes} bytes "
+        f"(saved {result.bytes_saved}, {result.bytes_saved / source_bytes:.0%})"
+    )
+    return result
+
+
+def shrink_video(path: str, keep_audio: bool) -> ShrinkResult:
+    """Transcode to the smallest file Gemini would see no difference in."""
+    if not SHRINK_ENABLED:
+        return _unchanged(path)
+
+    target = f"{os.path.splitext(path)[0]}.shrunk.mp4"
+    return _transcode(path, target, _shrink_command(path, target, keep_audio), audio_only=False)
+
+
+def extract_audio(path: str) -> ShrinkResult:
+    """Just the audio track. Fails back to `path` when there is none."""
+    target = f"{os.path.splitext(path)[0]}.audio.aac"
+    return _transcode(path, target, _audio_command(path, target), audio_only=True)
+
+
+def wants_audio_only(analyze_scenes: bool, analyze_audio: bool) -> bool:
+    return analyze_audio and not analyze_scenes and AUDIO_ONLY_ENABLED
+
+
+def prepare_upload(path: str, analyze_scenes: bool, analyze_audio: bool) -> ShrinkResult:
+    """Pick the smallest file that still answers what was asked for."""
+    if wants_audio_only(analyze_scenes, analyze_audio):
+        audio = extract_audio(path)
+        if audio.audio_only:
+            return audio
+
+    return shrink_video(path, keep_audio=analyze_audio)
+
+
+@dataclass
+class Keyframes:
+    """JPEG stills in playback order, and the AAC audio track if requested."""
+    frames: list[bytes]
+    audio: Optional[bytes] = None
+
+    @property
+    def size(self) -> int:
+        return sum(len(frame) for frame in self.frames) + len(self.audio or b"")
+
+
+def _keyframes_command(source: str) -> list[str]:
+    # The first frame always, then every scene change. Capped well above
+    # KEYFRAME_MAX_FRAMES so the thinning below still has the whole video to
+    # pick from, not just its opening cuts.
+    return [
+        "ffmpeg", "-v", "error", "-i", source,
+        "-vf", f"select='eq(n,0)+gt(scene,{KEYFRAME_SCENE_THRESHOLD})',scale=-2:'min({SHRINK_MAX_HEIGHT},ih)'",
+        "-vsync", "vfr", "-frames:v", str(KEYFRAME_MAX_FRAMES * 4),
+        "-c:v", "mjpeg", "-q:v", "5", "-f", "image2pipe", "-",
+    ]
+
+
+def _split_jpegs(stream: bytes) -> list[bytes]:
+    # Inside a JPEG every 0xFF data byte is stuffed, so an end-of-image marker
+    # followed by a start-of-image one only occurs between two images.
+    boundary = b"\xff\xd9\xff\xd8"
+    parts = stream.split(boundary)
+    if len(parts) == 1:
+        return [stream] if stream else []
+
+    return (
+        [parts[0] + b"\xff\xd9"]
+        + [b"\xff\xd8" + part + b"\xff\xd9" for part in parts[1:-1]]
+        + [b"\xff\xd8" + parts[-1]]
+    )
+
+
+def _thin(frames: list[bytes], limit: int) -> list[bytes]:
+    if len(frames) <= limit:
+        return frames
+
+    step = len(frames) / limit
+    return [frames[int(i * step)] for i in range(limit)]
+
+
+def extract_keyframes(path: str, with_audio: bool) -> Optional[Keyframes]:
+    """Representative stills of the video, or None when the caller should
+    upload the video instead. Never raises."""
+    try:
+        output = subprocess.run(
+            _keyframes_command(path), capture_output=True, timeout=SHRINK_TIMEOUT, check=True,
+        )
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning(f"Could not extract keyframes from {path}: {e}")
+        return None
+
+    frames = _thin(_split_jpegs(output.stdout), KEYFRAME_MAX_FRAMES)
+    if not frames:
+        logger.warning(f"No keyframes found in {path}")
+        return None
+
+    keyframes = Keyframes(frames)
+
+    if with_audio:
+        track = extract_audio(path)
+        if track.audio_only:
+            try:
+                with open(track.path, "rb") as f:
+                    keyframes.audio = f.read()
+            except OSError as e:
+                logger.warning(f"Could not read the audio track of {path}: {e}")
+            finally:
+                _remove(track.path)
+
+    if keyframes.size > KEYFRAME_MAX_INLINE_BYTES:
+        logger.info(f"Keyframes of {path} too large to send inline ({keyframes.size} bytes)")
+        return None
+
+    logger.info(
+        f"Extracted {len(frames)} keyframes from {path} "
+        f"({keyframes.size} bytes{' with audio' if keyframes.audio else ''})"
+    )
+    return keyframes
+
+
+def _unchanged(path: str) -> ShrinkResult:
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        size = 0
+    return ShrinkResult(path, path, size, size)
+
+
+def _remove(path: str) -> None:
+    try:
+        if os.path.exists(path):
+            os.remove(path)
+    except OSError as e:
+        logger.warning(f"Failed to remove {path}: {e}")
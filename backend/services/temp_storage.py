@@ -0,0 +1,198 @@
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from core.logger import get_logger
+
+logger = get_logger("services.temp_storage")
+
+MB = 1024 * 1024
+
+# Where downloads and the files derived from them live while an analysis runs.
+# TEMP_USE_TMPFS puts them in memory (/dev/shm) where the host has it, which
+# spares the disk but counts against RAM, so the budget must fit in it.
+TEMP_USE_TMPFS = os.getenv("TEMP_USE_TMPFS", "false").lower() in ("1", "true", "yes")
+TEMP_DIR = os.getenv(
+    "TEMP_DOWNLOAD_DIR",
+    "/dev/shm/pop-search" if TEMP_USE_TMPFS and os.path.isdir("/dev/shm") else "temp_downloads",
+)
+
+# Total bytes all running analyses may hold at once. An analysis that would go
+# over waits up to TEMP_WAIT_SECONDS for others to finish, then is refused.
+TEMP_BUDGET_MB = int(os.getenv("TEMP_BUDGET_MB", "1024"))
+TEMP_WAIT_SECONDS = float(os.getenv("TEMP_WAIT_SECONDS", "60"))
+
+# Files older than this belong to a process that died mid-analysis. Age rather
+# than "everything" because other workers may share the directory. Swept at
+# startup and then every TEMP_SWEEP_INTERVAL_SECONDS, so the leftovers of a
+# crash followed by a quick restart go too once they are old enough.
+TEMP_ORPHAN_AGE_SECONDS = int(os.getenv("TEMP_ORPHAN_AGE_SECONDS", "3600"))
+TEMP_SWEEP_INTERVAL_SECONDS = int(os.getenv("TEMP_SWEEP_INTERVAL_SECONDS", "300"))
+
+
+class TempStorageFullError(Exception):
+    """The temp budget stayed exhausted for the whole wait."""
+
+
+@dataclass
+class TempStorageStats:
+    budget_bytes: int
+    reserved_bytes: int
+    leases: int
+    tracked_files: int
+    waiting: int
+    swept_files: int
+    swept_bytes: int
+
+
+class TempLease:
+    """Bytes reserved for one analysis and the files it wrote. Releasing it
+    deletes the files and gives the bytes back."""
+
+    def __init__(self, storage: "TempStorage", nbytes: int):
+        self._storage = storage
+        self.nbytes = nbytes
+        self.paths: list[str] = []
+
+    def track(self, path: str) -> None:
+        self.paths.append(path)
+
+    async def fit(self, nbytes: int) -> None:
+        """Shrink the reservation once the real size is known."""
+        if nbytes < self.nbytes:
+            await self._storage._give_back(self.nbytes - nbytes)
+            self.nbytes = nbytes
+
+    async def release(self) -> None:
+        for path in self.paths:
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+                    logger.debug(f"Cleaned up temp file: {path}")
+            except OSError as e:
+                logger.warning(f"Failed to remove temp file {path}: {e}")
+
+        self._storage._leases.discard(self)
+        await self._storage._give_back(self.nbytes)
+        self.nbytes = 0
+
+
+class TempStorage:
+
+    def __init__(self, directory: str, budget_bytes: int, wait_seconds: float):
+        self.directory = directory
+        self.budget_bytes = budget_bytes
+        self.wait_seconds = wait_seconds
+        self._reserved = 0
+        self._waiting = 0
+        self._swept = (0, 0)
+        self._leases: set[TempLease] = set()
+        self._changed = asyncio.Condition()
+
+    async def reserve(self, nbytes: int) -> TempLease:
+        """A lease on `nbytes`, waiting for room if needed. A reservation larger
+        than the whole budget is let through alone rather than never."""
+        async with self._changed:
+            self._waiting += 1
+            try:
+                await asyncio.wait_for(
+                    self._changed.wait_for(
+                        lambda: self._reserved == 0 or self._reserved + nbytes <= self.budget_bytes
+                    ),
+                    self.wait_seconds,
+                )
+            except asyncio.TimeoutError:
+                logger.warning(
+                    f"Temp storage full: {self._reserved}/{self.budget_bytes} bytes reserved"
+                )
+                raise TempStorageFullError()
+            finally:
+                self._waiting -= 1
+
+            self._reserved += nbytes
+
+        lease = TempLease(self, nbytes)
+        self._leases.add(lease)
+        return lease
+
+    async def _give_back(self, nbytes: int) -> None:
+        async with self._changed:
+            self._reserved -= nbytes
+            self._changed.notify_all()
+
+    def _held_paths(self) -> set[str]:
+        return {os.path.abspath(path) for lease in list(self._leases) for path in lease.paths}
+
+    def sweep(self, max_age_seconds: int, held: Optional[set[str]] = None) -> tuple[int, int]:
+        """Delete files older than `max_age_seconds` that no live lease holds
+        (`held`, taken from the leases when not given). Returns (files, bytes)."""
+        os.makedirs(self.directory, exist_ok=True)
+        if held is None:
+            held = self._held_paths()
+        cutoff = time.time() - max_age_seconds
+        files = size = 0
+
+        for entry in os.scandir(self.directory):
+            if os.path.abspath(entry.path) in held:
+                # A long analysis of this process, not an orphan.
+                continue
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    entry_size = entry.stat().st_size
+                    os.remove(entry.path)
+                    files += 1
+                    size += entry_size
+            except OSError as e:
+                logger.warning(f"Could not sweep {entry.path}: {e}")
+
+        self._swept = (self._swept[0] + files, self._swept[1] + size)
+        if files:
+            logger.info(f"Swept {files} orphaned temp files ({size} bytes) from {self.directory}")
+        return files, size
+
+    async def run_sweeper(
+        self,
+        max_age_seconds: int = TEMP_ORPHAN_AGE_SECONDS,
+        interval: float = TEMP_SWEEP_INTERVAL_SECONDS,
+    ) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                # The held paths are read here, on the loop that changes them;
+                # the directory walk runs off it.
+                held = self._held_paths()
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self.sweep, max_age_seconds, held
+                )
+            except Exception:
+                logger.exception("Temp storage sweep failed")
+
+    def stats(self) -> TempStorageStats:
+        """From the reservations alone: a lease is fitted to its files once
+        their size is known, so this needs no filesystem call."""
+        leases = list(self._leases)
+
+        return TempStorageStats(
+            budget_bytes=self.budget_bytes,
+            reserved_bytes=self._reserved,
+            leases=len(leases),
+            tracked_files=sum(len(lease.paths) for lease in leases),
+            waiting=self._waiting,
+            swept_files=self._swept[0],
+            swept_bytes=self._swept[1],
+        )
+
+
+def file_size(path: str) -> int:
+    """Size of `path`, or 0 when it cannot be read."""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+os.makedirs(TEMP_DIR, exist_ok=True)
+
+temp_storage = TempStorage(TEMP_DIR, TEMP_BUDGET_MB * MB, TEMP_WAIT_SECONDS)
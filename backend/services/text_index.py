@@ -0,0 +1,256 @@
+import os
+import re
+import unicodedata
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Optional
+
+import snowballstemmer
+
+from core.logger import get_logger
+from services.archive import ArchiveMirror
+
+logger = get_logger("services.text_index")
+
+# Off by default, like the vector index: it holds every title, description and
+# transcript in memory. In exchange, text-mode searches never leave the process,
+# and a hybrid search can still answer with its lexical half when Postgres is
+# slow or down.
+TEXT_INDEX_ENABLED = os.getenv("TEXT_INDEX_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Mirrors match_videos and the fts column in schema.sql: ts_rank's default
+# weights for A (title), B (description) and C (structured metadata), and the
+# RRF constant that turns a rank into a score.
+WEIGHTS = {"A": 1.0, "B": 0.4, "C": 0.2}
+RRF_K = 50
+
+# The Snowball list that portuguese_stem filters with. Postgres checks it AFTER
+# unaccent has run, so accented entries such as "não" never match anything;
+# folded tokens are checked against this list unchanged to behave the same way.
+STOPWORDS = frozenset("""
+de a o que e do da em um para com não uma os no se na por mais as dos como mas
+ao ele das à seu sua ou quando muito nos já eu também só pelo pela até isso ela
+entre depois sem mesmo aos seus quem nas me esse eles você essa num nem suas meu
+às minha numa pelos elas qual nós lhe deles essas esses pelas este dele tu te
+vocês vos lhes meus minhas teu tua teus tuas nosso nossa nossos nossas dela delas
+esta estes estas aquele aquela aqueles aquelas isto aquilo estou está estamos
+estão estive esteve estivemos estiveram estava estávamos estavam estivera
+estivéramos esteja estejamos estejam estivesse estivéssemos estivessem estiver
+estivermos estiverem hei há havemos hão houve houvemos houveram houvera
+houvéramos haja hajamos hajam houvesse houvéssemos houvessem houver houvermos
+houverem houverei houverá houveremos houverão houveria houveríamos houveriam sou
+somos são era éramos eram fui foi fomos foram fora fôramos seja sejamos sejam
+fosse fôssemos fossem for formos forem serei será seremos serão seria seríamos
+seriam tenho tem temos tém tinha tínhamos tinham tive teve tivemos tiveram tivera
+tivéramos tenha tenhamos tenham tivesse tivéssemos tivessem tiver tivermos
+tiverem terei terá teremos terão teria teríamos teriam
+""".split())
+
+_WORD = re.compile(r"[^\W_]+")
+_QUERY_TOKEN = re.compile(r'(-?)"([^"]*)"?|(\S+)')
+
+_stemmer = snowballstemmer.stemmer("portuguese")
+
+
+def fold(text: str) -> str:
+    """Lowercase and strip accents, as unaccent does before stemming."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def _lexemes(text: str) -> list[tuple[int, str]]:
+    """(position, lexeme) pairs. Stopwords are dropped but still take up a
+    position, exactly as to_tsvector counts them, so phrases spanning one
+    still need the gap."""
+    out = []
+    for position, word in enumerate(_WORD.findall(fold(text)), start=1):
+        if word not in STOPWORDS:
+            out.append((position, _stemmer.stemWord(word)))
+    return out
+
+
+def _metadata_text(meta: Optional[dict]) -> str:
+    """The same values the fts column pulls out of metadados_estruturados."""
+    meta = meta or {}
+    audio = meta.get("audio") or {}
+    pessoas = [p.get("descricao") or "" for p in (meta.get("pessoas") or []) if isinstance(p, dict)]
+
+    return " ".join([
+        audio.get("transcricao") or "",
+        audio.get("musica") or "",
+        audio.get("artista") or "",
+        " ".join(pessoas),
+        " ".join(str(e) for e in (meta.get("elementos_cenario") or [])),
+    ])
+
+
+@dataclass
+class Phrase:
+    """One query item: a single word is a one-lexeme phrase. Offsets keep the
+    gaps left by stopwords, like the <N> distance websearch_to_tsquery emits."""
+    lexemes: list[tuple[int, str]]
+    negated: bool = False
+
+
+@dataclass
+class Clause:
+    """Items joined by AND. A query is a list of clauses joined by OR."""
+    items: list[Phrase] = field(default_factory=list)
+
+
+def parse_query(text: str) -> list[Clause]:
+    """websearch_to_tsquery's grammar: words are ANDed, "quoted text" is a
+    phrase, a leading - negates, and a bare `or` separates alternatives. It
+    never fails: whatever cannot be read is dropped."""
+    clauses = [Clause()]
+
+    for negated_phrase, quoted, bare in _QUERY_TOKEN.findall(text):
+        if bare and bare.lower() == "or":
+            if clauses[-1].items:
+                clauses.append(Clause())
+            continue
+
+        if bare:
+            negated = bare.startswith("-")
+            words = bare.lstrip("-")
+        else:
+            negated = bool(negated_phrase)
+            words = quoted
+
+        lexemes = _lexemes(words)
+        if not lexemes:
+            continue
+
+        first = lexemes[0][0]
+        clauses[-1].items.append(
+            Phrase([(position - first, lexeme) for position, lexeme in lexemes], negated)
+        )
+
+    return [clause for clause in clauses if clause.items]
+
+
+class TextIndex(ArchiveMirror):
+    """Inverted index over the same text, weights and normalisation as the
+    generated fts column, answering websearch-style queries in-process.
+
+    Ranking sums the weights of every matching occurrence. That equals
+    ts_rank_cd for single-word queries and tracks it closely otherwise; the
+    matched set itself is the same as `fts @@ websearch_to_tsquery(...)`.
+    """
+
+    name = "Text index"
+    columns = "id, created_at, titulo_video, descricao_completa, url_original, metadados_estruturados"
+
+    def __init__(self):
+        super().__init__()
+        self._postings: dict[str, dict[str, list[tuple[int, float]]]] = defaultdict(dict)
+        self._documents: dict[str, dict] = {}
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def add(self, rows: list[dict]) -> int:
+        added = 0
+
+        for row in rows:
+            self._advance_watermark(row)
+
+            if row["id"] in self._documents:
+                continue
+
+            offset = 0
+            for text, weight in (
+                (row.get("titulo_video") or "", WEIGHTS["A"]),
+                (row.get("descricao_completa") or "", WEIGHTS["B"]),
+                (_metadata_text(row.get("metadados_estruturados")), WEIGHTS["C"]),
+            ):
+                lexemes = _lexemes(text)
+                for position, lexeme in lexemes:
+                    self._postings[lexeme].setdefault(row["id"], []).append((offset + position, weight))
+                if lexemes:
+                    offset += lexemes[-1][0]
+
+            self._documents[row["id"]] = {
+                "id": row["id"],
+                "titulo_video": row.get("titulo_video"),
+                "descricao_completa": row.get("descricao_completa"),
+                "url_original": row.get("url_original"),
+            }
+            added += 1
+
+        return added
+
+    def _phrase_matches(self, phrase: Phrase) -> dict[str, float]:
+        """Documents containing the phrase, with the weight it contributes."""
+        first_offset, first_lexeme = phrase.lexemes[0]
+        candidates = self._postings.get(first_lexeme, {})
+
+        matches = {}
+        for doc_id, occurrences in candidates.items():
+            if len(phrase.lexemes) == 1:
+                matches[doc_id] = sum(weight for _, weight in occurrences)
+                continue
+
+            positions = {
+                lexeme: {pos for pos, _ in self._postings.get(lexeme, {}).get(doc_id, [])}
+                for _, lexeme in phrase.lexemes
+            }
+            starts = [
+                pos for pos, _ in occurrences
+                if all(pos + offset in positions[lexeme] for offset, lexeme in phrase.lexemes[1:])
+            ]
+            if starts:
+                matches[doc_id] = sum(
+                    weight
+                    for _, lexeme in phrase.lexemes
+                    for _, weight in self._postings[lexeme][doc_id]
+                )
+
+        return matches
+
+    def _clause_matches(self, clause: Clause) -> dict[str, float]:
+        positive = [item for item in clause.items if not item.negated]
+        negative = [item for item in clause.items if item.negated]
+
+        if positive:
+            scores = self._phrase_matches(positive[0])
+            for item in positive[1:]:
+                other = self._phrase_matches(item)
+                scores = {doc_id: score + other[doc_id] for doc_id, score in scores.items() if doc_id in other}
+        else:
+            # A clause made only of exclusions matches everything else, with
+            # nothing to rank it by.
+            scores = {doc_id: 0.0 for doc_id in self._documents}
+
+        for item in negative:
+            excluded = self._phrase_matches(item)
+            scores = {doc_id: score for doc_id, score in scores.items() if doc_id not in excluded}
+
+        return scores
+
+    def search(self, query: str, match_count: int) -> list[dict]:
+        """Results shaped like match_videos in text mode."""
+        scores: dict[str, float] = {}
+        for clause in parse_query(query):
+            for doc_id, score in self._clause_matches(clause).items():
+                scores[doc_id] = max(score, scores.get(doc_id, 0.0))
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:max(match_count, 1)]
+
+        return [
+            {
+                **self._documents[doc_id],
+                "similarity": 0.0,
+                "text_rank": round(score, 6),
+                "score": 1.0 / (RRF_K + rank),
+            }
+            for rank, (doc_id, score) in enumerate(ranked, start=1)
+        ]
+
+
+text_index = TextIndex()
+
+
+async def load_text_index() -> None:
+    if TEXT_INDEX_ENABLED:
+        await text_index.load()
@@ -1,6 +1,5 @@
-import asyncio
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta, timezone
 from statistics import mean, median
 from typing import Optional
@@ -8,7 +7,7 @@ from typing import Optional
 from dotenv import load_dotenv
 
 from core.logger import get_logger
-from db import supabase
+from db import execute, run_in_db_pool, supabase
 
 load_dotenv()
 
@@ -98,8 +97,7 @@ def _fetch_quota(user_id: str) -> Quota:
 
 
 async def get_quota(user_id: str) -> Quota:
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, _fetch_quota, user_id)
+    return await run_in_db_pool(_fetch_quota, user_id)
 
 
 @dataclass
@@ -133,8 +131,7 @@ def _fetch_project_usage() -> ProjectUsage:
 
 
 async def get_project_usage() -> ProjectUsage:
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, _fetch_project_usage)
+    return await run_in_db_pool(_fetch_project_usage)
 
 
 @dataclass
@@ -159,8 +156,7 @@ def _fetch_is_admin(user_id: str) -> bool:
 
 
 async def is_admin(user_id: str) -> bool:
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, _fetch_is_admin, user_id)
+    return await run_in_db_pool(_fetch_is_admin, user_id)
 
 
 def _fetch_all_usage() -> list[UserUsage]:
@@ -201,8 +197,7 @@ def _fetch_all_usage() -> list[UserUsage]:
 
 
 async def get_all_usage() -> list[UserUsage]:
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, _fetch_all_usage)
+    return await run_in_db_pool(_fetch_all_usage)
 
 
 @dataclass
@@ -224,6 +219,7 @@ class AdminStats:
     analyses_today: int
     daily_limit: int
     projected_tokens_at_limit: int
+    cost_by_mode: list[dict] = field(default_factory=list)
 
 
 # A month of this project's events is small; if the archive ever outgrows this,
@@ -236,7 +232,7 @@ def _fetch_admin_stats(days: int) -> AdminStats:
 
     events = (
         supabase.table("usage_events")
-        .select("kind, succeeded, failure_reason, total_tokens, created_at")
+        .select("kind, succeeded, failure_reason, total_tokens, analysis_mode, created_at")
         .gte("created_at", since.isoformat())
         .order("created_at", desc=True)
         .limit(MAX_EVENTS_SCANNED)
@@ -263,6 +259,12 @@ def _fetch_admin_stats(days: int) -> AdminStats:
         entry["analyses"] += 1
         entry["tokens"] += event.get("total_tokens") or 0
 
+    # Rows from before the mode was recorded were all full-video analyses.
+    by_mode: dict[str, list[int]] = {}
+    for event in analyses:
+        if (event.get("total_tokens") or 0) > 0:
+            by_mode.setdefault(event.get("analysis_mode") or "video", []).append(event["total_tokens"])
+
     today = _day_start().date().isoformat()
     avg = round(mean(measured)) if measured else 0
 
@@ -288,12 +290,15 @@ def _fetch_admin_stats(days: int) -> AdminStats:
         analyses_today=by_day.get(today, {}).get("analyses", 0),
         daily_limit=DAILY_ANALYSIS_LIMIT,
         projected_tokens_at_limit=avg * DAILY_ANALYSIS_LIMIT,
+        cost_by_mode=[
+            {"mode": mode, "analyses": len(tokens), "avg_tokens": round(mean(tokens))}
+            for mode, tokens in sorted(by_mode.items())
+        ],
     )
 
 
 async def get_admin_stats(days: int) -> AdminStats:
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, _fetch_admin_stats, days)
+    return await run_in_db_pool(_fetch_admin_stats, days)
 
 
 async def record_event(
@@ -304,6 +309,8 @@ async def record_event(
     prompt_tokens: Optional[int] = None,
     output_tokens: Optional[int] = None,
     total_tokens: Optional[int] = None,
+    analysis_mode: Optional[str] = None,
+    bytes_saved: Optional[int] = None,
 ) -> None:
     """Never raises: losing an accounting row must not fail a request that
     already succeeded."""
@@ -315,13 +322,11 @@ async def record_event(
         "prompt_tokens": prompt_tokens,
         "output_tokens": output_tokens,
         "total_tokens": total_tokens,
+        "analysis_mode": analysis_mode,
+        "bytes_saved": bytes_saved,
     }
 
-    def insert():
-        return supabase.table("usage_events").insert(payload).execute()
-
     try:
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, insert)
+        await execute(supabase.table("usage_events").insert(payload))
     except Exception as e:
         logger.error(f"Failed to record {kind} usage for {user_id}: {e}")
@@ -0,0 +1,147 @@
+import json
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from core.gemini import EMBEDDING_DIMENSIONS
+from core.logger import get_logger
+from services.archive import ArchiveMirror
+
+logger = get_logger("services.vector_index")
+
+# Off by default: it trades API memory (about 3 KB per video) for skipping the
+# HNSW query and the 768-float upload on every semantic search. Worth it while
+# the archive fits comfortably in the process; past that, Postgres is the index.
+VECTOR_INDEX_ENABLED = os.getenv("VECTOR_INDEX_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Mirrors the constants inside match_videos, so that both paths rank and score
+# a semantic search identically.
+RRF_K = 50
+MAX_CANDIDATES = 200
+
+
+@dataclass
+class VectorHit:
+    id: str
+    similarity: float
+    rank: int
+
+    @property
+    def score(self) -> float:
+        return 1.0 / (RRF_K + self.rank)
+
+
+def candidate_pool(match_count: int) -> int:
+    return min(max(match_count, 1) * 4, MAX_CANDIDATES)
+
+
+def _parse_embedding(value) -> Optional[list[float]]:
+    # PostgREST serialises vector columns as their text form, "[0.1,0.2,...]",
+    # which happens to be valid JSON.
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = json.loads(value)
+    return value
+
+
+class VectorIndex(ArchiveMirror):
+    """Every video embedding as one contiguous float32 matrix of unit rows, so
+    that cosine similarity against a query is a single matrix-vector product.
+
+    Rows only ever get appended: the archive has no delete path, and a row that
+    vanished anyway is dropped when search results are hydrated.
+    """
+
+    name = "Vector index"
+    columns = "id, created_at, embedding"
+
+    def __init__(self, dimensions: int = EMBEDDING_DIMENSIONS):
+        super().__init__()
+        self.dimensions = dimensions
+        self._matrix = np.empty((0, dimensions), dtype=np.float32)
+        self._size = 0
+        self._ids: list[str] = []
+        self._positions: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _reserve(self, extra: int) -> None:
+        needed = self._size + extra
+        if needed <= len(self._matrix):
+            return
+
+        # Doubling keeps a steady trickle of saves from copying the whole
+        # matrix on every sync.
+        grown = np.empty((max(needed, len(self._matrix) * 2, 64), self.dimensions), dtype=np.float32)
+        grown[:self._size] = self._matrix[:self._size]
+        self._matrix = grown
+
+    def add(self, rows: list[dict]) -> int:
+        """Append rows carrying id, created_at and embedding. Returns how many
+        were new."""
+        fresh = []
+        for row in rows:
+            self._advance_watermark(row)
+
+            if row["id"] in self._positions:
+                continue
+
+            values = _parse_embedding(row.get("embedding"))
+            if values is None or len(values) != self.dimensions:
+                continue
+
+            fresh.append((row["id"], values))
+
+        if not fresh:
+            return 0
+
+        vectors = np.asarray([values for _, values in fresh], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1, norms)
+
+        self._reserve(len(fresh))
+        self._matrix[self._size:self._size + len(fresh)] = vectors
+
+        for offset, (video_id, _) in enumerate(fresh):
+            self._positions[video_id] = self._size + offset
+            self._ids.append(video_id)
+
+        self._size += len(fresh)
+        return len(fresh)
+
+    def search(self, query_vector: list[float], threshold: float, match_count: int) -> list[VectorHit]:
+        """Same candidates, filter and order as the semantic branch of
+        match_videos: the nearest `candidate_pool` rows, then only those at or
+        above the threshold, best first."""
+        if self._size == 0:
+            return []
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+
+        similarities = self._matrix[:self._size] @ (query / norm)
+
+        pool = min(candidate_pool(match_count), self._size)
+        nearest = np.argpartition(-similarities, pool - 1)[:pool]
+        nearest = nearest[np.argsort(-similarities[nearest], kind="stable")]
+
+        hits = [
+            VectorHit(id=self._ids[i], similarity=float(similarities[i]), rank=rank)
+            for rank, i in enumerate(nearest, start=1)
+            if similarities[i] >= threshold
+        ]
+        return hits[:max(match_count, 1)]
+
+
+vector_index = VectorIndex()
+
+
+async def load_vector_index() -> None:
+    if VECTOR_INDEX_ENABLED:
+        await vector_index.load()
@@ -5,6 +5,7 @@ import pytest
 from core.auth import current_user
 from core.limiter import limiter
 from main import app
+from routers.search import ranking_cache, result_cache
 from services.usage import ProjectUsage, Quota
 
 TEST_USER_ID = "00000000-0000-4000-8000-000000000001"
@@ -24,6 +25,17 @@ def reset_limiter_storage():
                 limiter._storage.storage.clear()
 
 
+@pytest.fixture(autouse=True)
+def empty_result_cache():
+    """Tests reuse the same queries with different mocked rows; a result cached
+    by one test must never answer the next."""
+    result_cache.clear()
+    ranking_cache.clear()
+    yield
+    result_cache.clear()
+    ranking_cache.clear()
+
+
 @pytest.fixture(autouse=True)
 def authenticated():
     """Signed in by default, so tests exercise their own subject rather than auth."""
@@ -40,10 +52,14 @@ def anonymous():
 
 @pytest.fixture(autouse=True)
 def quota_available():
-    """Within quota by default, and never touching the real database."""
+    """Within quota, never a duplicate or a cached analysis, and never touching
+    the real database."""
     with patch("routers.videos.get_quota", new=AsyncMock(return_value=TEST_QUOTA)), \
          patch("routers.videos.record_event", new=AsyncMock()), \
          patch("routers.videos.get_project_usage", new=AsyncMock(return_value=TEST_PROJECT)), \
+         patch("routers.videos.find_video_by_tweet_id", new=AsyncMock(return_value=None)), \
+         patch("routers.videos.get_cached_analysis", new=AsyncMock(return_value=None)), \
+         patch("routers.videos.store_analysis", new=AsyncMock()), \
          patch("routers.me.get_quota", new=AsyncMock(return_value=TEST_QUOTA)), \
          patch("routers.me.get_project_usage", new=AsyncMock(return_value=TEST_PROJECT)), \
          patch("routers.me.is_admin", new=AsyncMock(return_value=False)):
@@ -66,5 +82,8 @@ def no_real_database():
     with patch("services.usage.supabase", guard), \
          patch("routers.me.supabase", guard), \
          patch("routers.videos.supabase", guard), \
-         patch("routers.search.supabase", guard):
+         patch("routers.search.supabase", guard), \
+         patch("services.archive.supabase", guard), \
+         patch("services.analysis_cache.supabase", guard), \
+         patch("services.fingerprints.supabase", guard):
         yield
@@ -4,7 +4,7 @@ from unittest.mock import AsyncMock, patch
 from fastapi.testclient import TestClient
 
 from main import app
-from services import usage
+from services import download_pool, usage
 
 client = TestClient(app)
 
@@ -55,6 +55,20 @@ class TestCostPerAnalysis:
         assert stats.measured == 1
         assert stats.analyses == 2
 
+    def test_compares_the_cost_of_each_analysis_mode(self):
+        """Rows from before the mode was recorded count as full-video."""
+        events = [_event(tokens=9000), _event(tokens=7000), _event(tokens=1500)]
+        events[1]["analysis_mode"] = "video"
+        events[2]["analysis_mode"] = "keyframes"
+        _with_events(events)
+
+        stats = usage._fetch_admin_stats(30)
+
+        assert stats.cost_by_mode == [
+            {"mode": "keyframes", "analyses": 1, "avg_tokens": 1500},
+            {"mode": "video", "analyses": 2, "avg_tokens": 8000},
+        ]
+
     def test_projects_what_a_full_day_would_cost(self):
         _with_events([_event(tokens=5000)])
 
@@ -171,3 +185,7 @@ class TestEndpoint:
         assert body["avg_tokens"] == 5000
         assert body["failures_by_reason"] == [{"reason": "timeout", "count": 1}]
         assert body["projected_tokens_at_limit"] == 500000
+        assert body["downloads"]["workers"] == download_pool.DOWNLOAD_WORKERS
+        assert body["downloads"]["queued"] == 0
+        assert body["temp_storage"]["reserved_bytes"] == 0
+        assert "directory" not in body["temp_storage"]
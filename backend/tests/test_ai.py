@@ -1,7 +1,7 @@
 """Tests for the prompt contract, blocked responses and cost accounting."""
 import asyncio
 import pytest
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
 from core.exceptions import ContentBlockedError
 from dtos import (
@@ -11,6 +11,8 @@ from dtos import (
     MAX_TRANSCRICAO_CHARS,
 )
 from services.ai import (
+    TokenUsage,
+    analyze_keyframes,
     analyze_video_content,
     get_system_prompt,
     _extract_json,
@@ -39,6 +41,15 @@ class TestSystemPrompt:
         assert "titulo_sugerido: no máximo" in prompt
         assert "descricao_completa: no máximo" in prompt
 
+    def test_audio_only_prompt_asks_only_about_what_is_heard(self):
+        prompt = get_system_prompt(analyze_scenes=False, analyze_audio=True, audio_only=True)
+
+        assert "apenas o áudio" in prompt
+        assert "PESSOAS" not in prompt
+        assert "cenário" not in prompt
+        assert '"transcricao"' in prompt
+        assert '"titulo_sugerido"' in prompt
+
 
 def _response(finish_reason: str = "STOP", text: str = '{"ok": true}'):
     candidate = MagicMock()
@@ -134,10 +145,10 @@ class TestTokenUsageLogging:
         async def _generate(*_args, **_kwargs):
             return blocked
 
-        with patch("services.ai.genai") as mock_genai, \
+        with patch("services.ai.upload_file", new=AsyncMock(return_value=uploaded)), \
+             patch("services.ai.delete_file", new=AsyncMock()), \
              patch("services.ai.model") as mock_model, \
              patch("services.ai.logger") as mock_logger:
-            mock_genai.upload_file.return_value = uploaded
             mock_model.generate_content_async = _generate
 
             with pytest.raises(ContentBlockedError):
@@ -145,3 +156,47 @@ class TestTokenUsageLogging:
 
         logged = " ".join(str(call) for call in mock_logger.info.call_args_list)
         assert "prompt=8000" in logged
+
+
+class TestKeyframes:
+
+    def test_sends_the_frames_inline_without_uploading_anything(self):
+        """No upload means no PROCESSING state to poll."""
+        sent = []
+
+        async def _generate(contents, **_kwargs):
+            sent.extend(contents)
+            return _response(text='{"titulo_sugerido": "ok"}')
+
+        upload = AsyncMock()
+        usage = TokenUsage()
+
+        with patch("services.ai.upload_file", new=upload), \
+             patch("services.ai.model") as mock_model:
+            mock_model.generate_content_async = _generate
+            result = asyncio.run(analyze_keyframes(
+                [b"frame-1", b"frame-2"], b"audio", analyze_audio=True, usage=usage,
+            ))
+
+        assert result == {"titulo_sugerido": "ok"}
+        upload.assert_not_called()
+        assert "quadros-chave" in sent[0]
+        assert sent[1:] == [
+            {"mime_type": "image/jpeg", "data": b"frame-1"},
+            {"mime_type": "image/jpeg", "data": b"frame-2"},
+            {"mime_type": "audio/aac", "data": b"audio"},
+        ]
+        assert usage.mode == "keyframes"
+
+    def test_does_not_ask_for_a_transcript_without_the_audio_track(self):
+        sent = []
+
+        async def _generate(contents, **_kwargs):
+            sent.extend(contents)
+            return _response()
+
+        with patch("services.ai.model") as mock_model:
+            mock_model.generate_content_async = _generate
+            asyncio.run(analyze_keyframes([b"frame"], None, analyze_audio=True))
+
+        assert '"transcricao"' not in sent[0]
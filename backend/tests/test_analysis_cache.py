@@ -0,0 +1,114 @@
+"""Tests for reusing earlier analyses of the same tweet."""
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from fastapi.testclient import TestClient
+
+from core.gemini import GENERATION_MODEL
+from main import app
+from services import analysis_cache
+
+client = TestClient(app)
+
+URL = "https://x.com/user/status/123?s=20"
+
+RESULT = {
+    "titulo_sugerido": "Um titulo valido",
+    "descricao_completa": "Uma descricao suficientemente longa para validar",
+    "url_original": "https://twitter.com/other/status/123",
+    "metadados_estruturados": {},
+}
+
+
+class TestCacheHit:
+
+    @patch("routers.videos.record_event", new_callable=AsyncMock)
+    @patch("routers.videos.analyze_video_content")
+    @patch("routers.videos.download_video")
+    def test_is_served_without_download_gemini_or_charge(self, mock_download, mock_analyze, mock_record):
+        with patch("routers.videos.get_cached_analysis", new=AsyncMock(return_value=RESULT)) as lookup, \
+             patch("routers.videos.get_quota") as quota:
+            response = client.post("/videos/analyze", json={"url": URL, "analyze_audio": False})
+
+        assert response.status_code == 200
+        assert response.json()["titulo_sugerido"] == RESULT["titulo_sugerido"]
+        # The URL the user pasted, not whichever one was analysed first.
+        assert response.json()["url_original"] == URL
+        lookup.assert_awaited_once_with("123", True, False)
+        mock_download.assert_not_called()
+        mock_analyze.assert_not_called()
+        mock_record.assert_not_called()
+        quota.assert_not_called()
+
+    @patch("routers.videos.analyze_video_content")
+    @patch("routers.videos.download_video")
+    def test_an_entry_the_dto_no_longer_accepts_is_a_miss(self, mock_download, mock_analyze):
+        """The prompt and the limits change over time; a stale shape must not
+        be handed to the review form."""
+        mock_download.return_value = "does-not-exist.mp4"
+        mock_analyze.return_value = dict(RESULT)
+
+        with patch("routers.videos.get_cached_analysis", new=AsyncMock(return_value={"titulo_sugerido": "x"})):
+            response = client.post("/videos/analyze", json={"url": URL})
+
+        assert response.status_code == 200
+        mock_analyze.assert_called_once()
+
+
+class TestCacheFill:
+
+    @patch("routers.videos.analyze_video_content")
+    @patch("routers.videos.download_video")
+    def test_a_fresh_analysis_is_stored(self, mock_download, mock_analyze):
+        mock_download.return_value = "does-not-exist.mp4"
+        mock_analyze.return_value = dict(RESULT)
+
+        with patch("routers.videos.store_analysis", new=AsyncMock()) as store:
+            response = client.post("/videos/analyze", json={"url": URL, "analyze_scenes": False})
+
+        assert response.status_code == 200
+        tweet_id, scenes, audio, stored = store.await_args.args
+        assert (tweet_id, scenes, audio) == ("123", False, True)
+        assert stored["titulo_sugerido"] == RESULT["titulo_sugerido"]
+
+    @patch("routers.videos.analyze_video_content")
+    @patch("routers.videos.download_video")
+    def test_a_failed_store_does_not_fail_the_analysis(self, mock_download, mock_analyze):
+        mock_download.return_value = "does-not-exist.mp4"
+        mock_analyze.return_value = dict(RESULT)
+
+        with patch("routers.videos.store_analysis", new=AsyncMock(side_effect=Exception("db down"))):
+            response = client.post("/videos/analyze", json={"url": URL})
+
+        assert response.status_code == 200
+
+
+class TestService:
+
+    @patch("services.analysis_cache.supabase")
+    def test_key_includes_the_model(self, mock_supabase):
+        query = mock_supabase.table.return_value.select.return_value
+        query.eq.return_value = query
+        query.gte.return_value.limit.return_value.execute.return_value = MagicMock(data=[])
+
+        asyncio.run(analysis_cache.get_cached_analysis("123", True, True))
+
+        filters = {call.args for call in query.eq.call_args_list}
+        assert ("model", GENERATION_MODEL) in filters
+        assert ("tweet_id", "123") in filters
+
+    @patch("services.analysis_cache.supabase")
+    def test_every_write_prunes(self, mock_supabase):
+        asyncio.run(analysis_cache.store_analysis("123", True, True, RESULT))
+
+        name, params = mock_supabase.rpc.call_args.args
+        assert name == "prune_analysis_cache"
+        assert params["max_rows"] == analysis_cache.ANALYSIS_CACHE_MAX_ENTRIES
+
+    @patch("services.analysis_cache.ANALYSIS_CACHE_MAX_ENTRIES", 0)
+    @patch("services.analysis_cache.supabase")
+    def test_a_zero_cap_disables_the_cache(self, mock_supabase):
+        assert asyncio.run(analysis_cache.get_cached_analysis("123", True, True)) is None
+        asyncio.run(analysis_cache.store_analysis("123", True, True, RESULT))
+
+        mock_supabase.table.assert_not_called()
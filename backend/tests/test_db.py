@@ -0,0 +1,43 @@
+import asyncio
+import threading
+import time
+from unittest.mock import MagicMock
+
+import db
+
+
+def test_queries_run_on_the_database_pool():
+    seen = {}
+
+    def record():
+        seen["thread"] = threading.current_thread().name
+        return "response"
+
+    query = MagicMock()
+    query.execute.side_effect = record
+
+    assert asyncio.run(db.execute(query)) == "response"
+    assert seen["thread"].startswith("db")
+
+
+def test_a_slow_query_does_not_stall_the_event_loop():
+    """Regression: search and save used to call .execute() inline, freezing
+    every other request for the whole Postgres round trip."""
+    query = MagicMock()
+    query.execute.side_effect = lambda: time.sleep(0.2)
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        task = asyncio.ensure_future(ticker())
+        await db.execute(query)
+        task.cancel()
+        return ticks
+
+    assert asyncio.run(scenario()) >= 5
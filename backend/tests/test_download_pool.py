@@ -0,0 +1,149 @@
+"""Tests for the dedicated download pool: per-host caps, queue depth, cancellation."""
+import asyncio
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from yt_dlp.utils import DownloadCancelled
+
+from main import app
+from services import download_pool
+from services.download_pool import raise_if_cancelled, run_download
+
+client = TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def fresh_slots():
+    # Semaphores bind to the event loop that first waits on them, and each
+    # test runs its own loop.
+    download_pool._host_slots.clear()
+    yield
+    download_pool._host_slots.clear()
+
+
+def _blocking_download(release: threading.Event, peak: list, active: list):
+    lock = threading.Lock()
+
+    def download(url):
+        with lock:
+            active.append(url)
+            peak.append(len(active))
+        release.wait(5)
+        with lock:
+            active.remove(url)
+        return url
+
+    return download
+
+
+class TestHostLimits:
+
+    @patch("services.download_pool.DOWNLOAD_HOST_LIMITS", {"x.com": 2})
+    def test_caps_concurrent_downloads_per_host_and_reports_the_queue(self):
+        release, peak, active = threading.Event(), [], []
+        download = _blocking_download(release, peak, active)
+
+        async def scenario():
+            tasks = [
+                asyncio.ensure_future(run_download(download, f"https://x.com/user/status/{i}"))
+                for i in range(4)
+            ]
+            while len(active) < 2:
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.05)
+
+            during = download_pool.stats()
+            release.set()
+            await asyncio.gather(*tasks)
+            return during
+
+        during = asyncio.run(scenario())
+
+        assert max(peak) == 2
+        assert during.running == 2
+        assert during.queued == 2
+        assert during.by_host == {"x.com": 4}
+        assert download_pool.stats().by_host == {}
+
+    @patch("services.download_pool.DOWNLOAD_HOST_LIMITS", {"x.com": 1, "twitter.com": 1})
+    def test_hosts_do_not_wait_for_each_other(self):
+        release, peak, active = threading.Event(), [], []
+        download = _blocking_download(release, peak, active)
+
+        async def scenario():
+            tasks = [
+                asyncio.ensure_future(run_download(download, "https://x.com/a/status/1")),
+                asyncio.ensure_future(run_download(download, "https://mobile.twitter.com/a/status/2")),
+            ]
+            while len(active) < 2:
+                await asyncio.sleep(0.01)
+            release.set()
+            return await asyncio.gather(*tasks)
+
+        assert len(asyncio.run(scenario())) == 2
+
+
+class TestCancellation:
+
+    def test_a_cancelled_download_stops_at_its_next_progress_tick(self):
+        """A thread cannot be killed; yt-dlp's progress hook is where it stops."""
+        started, outcome = threading.Event(), []
+
+        def download(url):
+            started.set()
+            try:
+                for _ in range(500):
+                    raise_if_cancelled({"status": "downloading"})
+                    time.sleep(0.01)
+                outcome.append("finished")
+            except DownloadCancelled:
+                outcome.append("cancelled")
+                raise
+
+        async def scenario():
+            task = asyncio.ensure_future(run_download(download, "https://x.com/a/status/1"))
+            while not started.is_set():
+                await asyncio.sleep(0.01)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(scenario())
+
+        deadline = time.time() + 2
+        while not outcome and time.time() < deadline:
+            time.sleep(0.01)
+        assert outcome == ["cancelled"]
+
+    @patch("services.download_pool.DOWNLOAD_HOST_LIMITS", {"x.com": 1})
+    def test_a_queued_download_that_is_cancelled_never_runs(self):
+        release, ran = threading.Event(), []
+
+        def download(url):
+            ran.append(url)
+            release.wait(5)
+
+        async def scenario():
+            first = asyncio.ensure_future(run_download(download, "https://x.com/a/status/1"))
+            queued = asyncio.ensure_future(run_download(download, "https://x.com/a/status/2"))
+            while not ran:
+                await asyncio.sleep(0.01)
+
+            queued.cancel()
+            await asyncio.gather(queued, return_exceptions=True)
+            assert download_pool.stats().queued == 0
+
+            release.set()
+            await first
+
+        asyncio.run(scenario())
+
+        assert ran == ["https://x.com/a/status/1"]
+
+
+def test_the_public_health_check_does_not_show_the_download_queue():
+    """Which sites are being fetched is for admins, under /me/admin/stats."""
+    assert client.get("/").json() == {"status": "ok", "version": "1.0.0"}
@@ -0,0 +1,175 @@
+"""Tests for fetching only the part of a video that will be analysed."""
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from core.exceptions import InvalidWindowError
+from main import app
+from services import downloader
+from services.downloader import clip_window, download_video
+
+client = TestClient(app)
+
+
+class TestClipWindow:
+
+    def test_a_short_video_is_fetched_whole(self):
+        assert clip_window(90) is None
+
+    @patch("services.downloader.MAX_CLIP_SECONDS", 300)
+    def test_a_long_video_is_cut_at_the_server_maximum(self):
+        assert clip_window(3600) == (0, 300)
+
+    @patch("services.downloader.MAX_CLIP_SECONDS", 300)
+    def test_the_requested_window_cannot_exceed_the_maximum(self):
+        assert clip_window(3600, start=600, end=1800) == (600, 900)
+
+    def test_the_window_stops_at_the_end_of_the_video(self):
+        assert clip_window(100, start=40, end=500) == (40, 100)
+
+    @patch("services.downloader.MAX_CLIP_SECONDS", 300)
+    def test_an_unknown_duration_is_only_cut_when_asked(self):
+        """Some embeds report no duration. Cutting those by default would make
+        every such download depend on ffmpeg for nothing."""
+        assert clip_window(None) is None
+        assert clip_window(None, start=60) == (60, 360)
+
+    @patch("services.downloader.MAX_CLIP_SECONDS", 0)
+    def test_the_maximum_can_be_disabled(self):
+        assert clip_window(None) is None
+        assert clip_window(3600) is None
+
+    def test_a_window_past_the_end_is_refused(self):
+        with pytest.raises(InvalidWindowError):
+            clip_window(60, start=120)
+
+
+def _fake_ydl(info):
+    """A YoutubeDL that "downloads" by writing the file it said it would."""
+    ydl = MagicMock()
+    ydl.params = {}
+    ydl.extract_info.return_value = info
+    ydl.sanitize_info.side_effect = lambda value: value
+    ydl.prepare_filename.side_effect = lambda _info: ydl.params["outtmpl"]["default"].replace("%(ext)s", "mp4")
+    ydl.process_ie_result.side_effect = lambda *_args, **_kwargs: open(
+        ydl.prepare_filename(None), "wb"
+    ).close()
+    return ydl
+
+
+@pytest.fixture
+def fresh_downloader():
+    downloader.probe_cache.clear()
+    downloader._local.__dict__.clear()
+    yield
+    downloader.probe_cache.clear()
+    downloader._local.__dict__.clear()
+
+
+@pytest.mark.usefixtures("fresh_downloader")
+class TestDownload:
+
+    @patch("services.downloader.MAX_CLIP_SECONDS", 300)
+    def test_only_the_window_is_downloaded_and_the_size_check_counts_only_it(self, tmp_path):
+        """A 600 MB hour-long video is fine when only five minutes are fetched."""
+        ydl = _fake_ydl({"duration": 3600, "filesize": 600 * 1024 * 1024})
+
+        with patch("services.downloader.DOWNLOAD_DIR", str(tmp_path)), \
+             patch("services.downloader.yt_dlp.YoutubeDL", return_value=ydl):
+            path = download_video("https://x.com/user/status/123")
+
+        assert os.path.exists(path)
+        assert ydl.params["download_ranges"].ranges == [(0, 300)]
+
+    def test_extracts_once_and_downloads_from_that_result(self, tmp_path):
+        """ydl.download([url]) would extract the tweet a second time."""
+        ydl = _fake_ydl({"duration": 30})
+
+        with patch("services.downloader.DOWNLOAD_DIR", str(tmp_path)), \
+             patch("services.downloader.yt_dlp.YoutubeDL", return_value=ydl) as build:
+            first = download_video("https://x.com/user/status/123")
+            second = download_video("https://twitter.com/user/status/123?s=20")
+
+        build.assert_called_once()
+        ydl.extract_info.assert_called_once()
+        ydl.download.assert_not_called()
+        assert first != second
+        assert "download_ranges" not in ydl.params
+
+    def test_a_tweet_with_several_videos_downloads_the_first(self, tmp_path):
+        """yt-dlp extracts those tweets as a playlist, which has no file name
+        of its own."""
+        first = {"id": "123_1", "duration": 30}
+        ydl = _fake_ydl({"_type": "playlist", "id": "123", "entries": [first, {"id": "123_2", "duration": 90}]})
+        ydl.prepare_filename.side_effect = lambda _info: "unused.NA"
+
+        def process(info, download):
+            path = ydl.params["outtmpl"]["default"].replace("%(ext)s", "mp4")
+            open(path, "wb").close()
+            return {**info, "requested_downloads": [{"filepath": path}]}
+
+        ydl.process_ie_result.side_effect = process
+
+        with patch("services.downloader.DOWNLOAD_DIR", str(tmp_path)), \
+             patch("services.downloader.yt_dlp.YoutubeDL", return_value=ydl):
+            path = download_video("https://x.com/user/status/123")
+
+        assert os.path.exists(path)
+        assert ydl.process_ie_result.call_args.args[0] == first
+
+    def test_a_failed_download_is_probed_again_next_time(self, tmp_path):
+        """Media URLs in a cached probe expire; a failure must not stick."""
+        ydl = _fake_ydl({"duration": 30})
+        ydl.process_ie_result.side_effect = Exception("HTTP Error 403")
+
+        with patch("services.downloader.DOWNLOAD_DIR", str(tmp_path)), \
+             patch("services.downloader.yt_dlp.YoutubeDL", return_value=ydl):
+            for _ in range(2):
+                with pytest.raises(Exception):
+                    download_video("https://x.com/user/status/123")
+
+        assert ydl.extract_info.call_count == 2
+        assert os.listdir(tmp_path) == []
+
+
+class TestAnalysisWindow:
+
+    def test_rejects_an_end_before_the_start(self):
+        response = client.post("/videos/analyze", json={
+            "url": "https://x.com/user/status/123", "start_seconds": 30, "end_seconds": 10,
+        })
+
+        assert response.status_code == 422
+
+    @patch("routers.videos.download_video")
+    def test_passes_the_window_to_the_downloader(self, mock_download):
+        mock_download.side_effect = InvalidWindowError("The analysis window starts at 500s but the video is only 60s long")
+
+        response = client.post("/videos/analyze", json={
+            "url": "https://x.com/user/status/123", "start_seconds": 500,
+        })
+
+        assert response.status_code == 422
+        assert "60s" in response.json()["detail"]
+        assert mock_download.call_args.args[1:] == (500, None)
+
+    @patch("routers.videos.get_cached_analysis")
+    @patch("routers.videos.download_video")
+    def test_a_custom_window_skips_the_analysis_cache(self, mock_download, mock_cached):
+        """A cached analysis of the whole video does not describe the part that
+        was asked for."""
+        mock_cached.return_value = {
+            "titulo_sugerido": "Um titulo valido",
+            "descricao_completa": "Uma descricao suficientemente longa para validar",
+            "metadados_estruturados": {},
+        }
+        mock_download.side_effect = InvalidWindowError("past the end")
+
+        client.post("/videos/analyze", json={
+            "url": "https://x.com/user/status/123", "end_seconds": 30,
+        })
+
+        mock_cached.assert_not_called()
+        mock_download.assert_called_once()
@@ -0,0 +1,186 @@
+"""Tests for recognising the same video content under different tweets."""
+import os
+import random
+import shutil
+import subprocess
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from services.fingerprints import FINGERPRINT_MAX_DISTANCE
+from services.downloader import (
+    FINGERPRINT_BITS,
+    FINGERPRINT_FRAMES,
+    VideoFingerprint,
+    _frames_signature,
+    dhash,
+    fingerprint_video,
+)
+
+client = TestClient(app)
+
+FRAME = 9 * 8
+
+
+def _textured_frames(seed=0):
+    rng = random.Random(seed)
+    return bytes(rng.randrange(256) for _ in range(FINGERPRINT_FRAMES * FRAME))
+
+
+class TestDHash:
+
+    def test_brightening_rows_set_every_bit(self):
+        frame = bytes(col * 10 for _ in range(8) for col in range(9))
+
+        assert dhash(frame) == 2 ** 64 - 1
+
+    def test_flat_frame_sets_none(self):
+        assert dhash(bytes([128] * FRAME)) == 0
+
+
+class TestSignature:
+
+    def test_one_hash_per_sampled_frame(self):
+        signature = _frames_signature(_textured_frames())
+
+        assert len(signature) == FINGERPRINT_BITS
+        assert set(signature) <= {"0", "1"}
+
+    def test_unrelated_textured_clips_stay_above_the_match_threshold(self):
+        """A false match hands this video another one's analysis."""
+        signatures = [_frames_signature(_textured_frames(seed)) for seed in range(6)]
+        closest = min(
+            sum(a != b for a, b in zip(x, y))
+            for i, x in enumerate(signatures)
+            for y in signatures[i + 1:]
+        )
+
+        assert FINGERPRINT_MAX_DISTANCE <= FINGERPRINT_BITS // 20
+        assert closest > FINGERPRINT_MAX_DISTANCE
+
+    def test_too_few_frames_give_no_signature(self):
+        assert _frames_signature(_textured_frames()[:FRAME * 3]) is None
+
+    def test_flat_videos_give_no_signature(self):
+        """Otherwise every black or single-colour clip would match every other."""
+        assert _frames_signature(bytes([0] * FINGERPRINT_FRAMES * FRAME)) is None
+
+
+class TestFingerprintVideo:
+
+    def test_missing_file_gives_nothing(self):
+        assert fingerprint_video("does-not-exist.mp4") is None
+
+    def test_without_ffmpeg_the_exact_hash_still_works(self, tmp_path):
+        video = tmp_path / "clip.mp4"
+        video.write_bytes(b"not really a video")
+
+        with patch("services.downloader.subprocess.run", side_effect=FileNotFoundError("ffmpeg")):
+            fingerprint = fingerprint_video(str(video))
+
+        assert len(fingerprint.sha256) == 64
+        assert fingerprint.frames is None
+
+    def test_samples_frames_when_ffmpeg_works(self, tmp_path):
+        video = tmp_path / "clip.mp4"
+        video.write_bytes(b"not really a video")
+
+        with patch("services.downloader._sample_frames", return_value=_textured_frames()):
+            fingerprint = fingerprint_video(str(video))
+
+        assert fingerprint.frames == _frames_signature(_textured_frames())
+
+    @pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+    def test_a_reencode_stays_close_and_another_clip_does_not(self, tmp_path):
+        def render(path, source, size):
+            subprocess.run(
+                ["ffmpeg", "-v", "error", "-f", "lavfi", "-i", f"{source}=duration=4:size={size}:rate=25",
+                 "-pix_fmt", "yuv420p", str(path)],
+                check=True,
+            )
+
+        original, reencode, other = (tmp_path / name for name in ("a.mp4", "b.mp4", "c.mp4"))
+        render(original, "testsrc", "640x360")
+        render(reencode, "testsrc", "320x180")
+        render(other, "mandelbrot", "640x360")
+
+        def distance(x, y):
+            return sum(a != b for a, b in zip(fingerprint_video(str(x)).frames, fingerprint_video(str(y)).frames))
+
+        assert os.path.getsize(original) != os.path.getsize(reencode)
+        assert distance(original, reencode) <= FINGERPRINT_MAX_DISTANCE
+        assert distance(original, other) > FINGERPRINT_BITS // 4
+
+
+ARCHIVED = {
+    "id": "abc",
+    "created_at": "2026-08-11T12:00:00+00:00",
+    "titulo_video": "Original",
+    "url_original": "https://x.com/first/status/111",
+}
+
+RESULT = {
+    "titulo_sugerido": "Um titulo valido",
+    "descricao_completa": "Uma descricao suficientemente longa para validar",
+    "url_original": "https://x.com/first/status/111",
+    "metadados_estruturados": {},
+}
+
+FINGERPRINT = VideoFingerprint(sha256="f" * 64, frames="01" * (FINGERPRINT_BITS // 2))
+
+
+@patch("routers.videos.fingerprint_video", return_value=FINGERPRINT)
+@patch("routers.videos.record_event", new_callable=AsyncMock)
+@patch("routers.videos.analyze_video_content")
+@patch("routers.videos.download_video", return_value="does-not-exist.mp4")
+class TestRepostReuse:
+    """A repost is downloaded (its URL says nothing), but never sent to Gemini."""
+
+    def test_a_repost_of_an_archived_video_points_at_it(self, mock_download, mock_analyze, mock_record, _fp):
+        async def archived(tweet_id):
+            return ARCHIVED if tweet_id == "111" else None
+
+        with patch("routers.videos.find_same_content", new=AsyncMock(return_value="111")), \
+             patch("routers.videos.find_video_by_tweet_id", new=archived):
+            response = client.post("/videos/analyze", json={"url": "https://x.com/reposter/status/222"})
+
+        assert response.status_code == 409
+        assert response.json()["video"]["id"] == "abc"
+        mock_analyze.assert_not_called()
+        mock_record.assert_not_called()
+
+    def test_a_repost_of_an_analysed_video_reuses_the_analysis(self, mock_download, mock_analyze, mock_record, _fp):
+        async def cached(tweet_id, scenes, audio):
+            return RESULT if tweet_id == "111" else None
+
+        with patch("routers.videos.find_same_content", new=AsyncMock(return_value="111")), \
+             patch("routers.videos.get_cached_analysis", new=cached):
+            response = client.post("/videos/analyze", json={"url": "https://x.com/reposter/status/222"})
+
+        assert response.status_code == 200
+        assert response.json()["url_original"] == "https://x.com/reposter/status/222"
+        mock_analyze.assert_not_called()
+        mock_record.assert_not_called()
+
+    def test_new_content_is_analysed_and_remembered(self, mock_download, mock_analyze, mock_record, _fp):
+        mock_analyze.return_value = dict(RESULT)
+
+        with patch("routers.videos.find_same_content", new=AsyncMock(return_value=None)), \
+             patch("routers.videos.record_fingerprint", new=AsyncMock()) as record:
+            response = client.post("/videos/analyze", json={"url": "https://x.com/someone/status/333"})
+
+        assert response.status_code == 200
+        mock_analyze.assert_called_once()
+        record.assert_awaited_once_with(FINGERPRINT, "333")
+
+    def test_a_failed_lookup_does_not_block_the_analysis(self, mock_download, mock_analyze, mock_record, _fp):
+        mock_analyze.return_value = dict(RESULT)
+
+        with patch("routers.videos.find_same_content", new=AsyncMock(side_effect=Exception("db down"))), \
+             patch("routers.videos.record_fingerprint", new=AsyncMock()):
+            response = client.post("/videos/analyze", json={"url": "https://x.com/someone/status/333"})
+
+        assert response.status_code == 200
+        mock_analyze.assert_called_once()
@@ -0,0 +1,178 @@
+"""Tests for the non-blocking Gemini client layer."""
+import asyncio
+import threading
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from core import gemini
+
+
+class TestBlockingCallsLeaveTheLoop:
+
+    def test_upload_runs_on_the_gemini_pool(self):
+        seen = {}
+
+        def upload_file(path):
+            seen["thread"] = threading.current_thread().name
+            return "file"
+
+        with patch("core.gemini.genai.upload_file", side_effect=upload_file):
+            assert asyncio.run(gemini.upload_file("clip.mp4")) == "file"
+
+        assert seen["thread"].startswith("gemini")
+
+    def test_a_slow_upload_does_not_freeze_other_requests(self):
+        def slow_upload(path):
+            time.sleep(0.2)
+            return "file"
+
+        async def scenario():
+            upload = asyncio.ensure_future(gemini.upload_file("clip.mp4"))
+            started = time.monotonic()
+            await asyncio.sleep(0.01)
+            ticked_after = time.monotonic() - started
+            await upload
+            return ticked_after
+
+        with patch("core.gemini.genai.upload_file", side_effect=slow_upload):
+            assert asyncio.run(scenario()) < 0.1
+
+
+class TestConcurrencyLimits:
+
+    def test_queueing_for_a_slot_does_not_count_towards_the_timeout(self):
+        model = MagicMock()
+
+        async def generate(_contents):
+            await asyncio.sleep(0.05)
+            return "response"
+
+        model.generate_content_async = generate
+
+        async def scenario():
+            return await asyncio.gather(
+                gemini.generate_content(model, ["a"], timeout=0.08),
+                gemini.generate_content(model, ["b"], timeout=0.08),
+            )
+
+        with patch("core.gemini._generation_slots", asyncio.Semaphore(1)):
+            assert asyncio.run(scenario()) == ["response", "response"]
+
+    def test_embeddings_use_the_async_client(self):
+        with patch("core.gemini.genai.embed_content_async", new=AsyncMock(return_value={"embedding": [0.1]})) as embed, \
+             patch("core.gemini.genai.embed_content") as blocking:
+            result = asyncio.run(gemini.embed_content(model="m", content="gato"))
+
+        assert result == {"embedding": [0.1]}
+        embed.assert_awaited_once_with(model="m", content="gato")
+        blocking.assert_not_called()
+
+
+def _file(name: str, state: str = "PROCESSING"):
+    file = MagicMock()
+    file.name = name
+    file.state.name = state
+    return file
+
+
+class _FakeFiles:
+    """Gemini's file service: each file turns ACTIVE after `ready_after` reads
+    of its state, by get or by list."""
+
+    def __init__(self, names, ready_after=2):
+        self.reads = {name: 0 for name in names}
+        self.ready_after = ready_after
+        self.gets = 0
+        self.lists = 0
+
+    def _current(self, name):
+        self.reads[name] += 1
+        return _file(name, "ACTIVE" if self.reads[name] >= self.ready_after else "PROCESSING")
+
+    def get_file(self, name):
+        self.gets += 1
+        return self._current(name)
+
+    def list_files(self, page_size):
+        self.lists += 1
+        return iter([self._current(name) for name in self.reads])
+
+
+class TestFilePoller:
+
+    def _run(self, files, names, timeout=5):
+        poller = gemini.FilePoller()
+
+        async def scenario():
+            return await asyncio.gather(*(poller.wait(_file(name), timeout) for name in names))
+
+        with patch("core.gemini.genai.get_file", side_effect=files.get_file), \
+             patch("core.gemini.genai.list_files", side_effect=files.list_files), \
+             patch("core.gemini.FILE_POLL_MIN_SECONDS", 0.01):
+            return asyncio.run(scenario()), poller
+
+    def test_a_ready_file_is_returned_without_polling(self):
+        poller = gemini.FilePoller()
+        ready = _file("files/a", "ACTIVE")
+
+        assert asyncio.run(poller.wait(ready, timeout=1)) is ready
+        assert poller.requests == 0
+
+    def test_many_pending_files_share_one_list_call_per_round(self):
+        """Polling each file separately multiplies status requests by the
+        number of analyses in flight."""
+        names = [f"files/{i}" for i in range(5)]
+        files = _FakeFiles(names, ready_after=2)
+
+        results, poller = self._run(files, names)
+
+        assert [file.state.name for file in results] == ["ACTIVE"] * 5
+        assert files.lists == 2
+        assert files.gets == 0
+
+    def test_a_lone_file_is_polled_with_get(self):
+        files = _FakeFiles(["files/a"], ready_after=3)
+
+        results, _ = self._run(files, ["files/a"])
+
+        assert results[0].state.name == "ACTIVE"
+        assert files.lists == 0
+        assert files.gets == 3
+
+    def test_a_failed_file_wakes_its_waiter_too(self):
+        with patch("core.gemini.genai.get_file", return_value=_file("files/a", "FAILED")), \
+             patch("core.gemini.FILE_POLL_MIN_SECONDS", 0.01):
+            result = asyncio.run(gemini.FilePoller().wait(_file("files/a"), timeout=1))
+
+        assert result.state.name == "FAILED"
+
+    def test_gives_up_after_the_timeout(self):
+        with patch("core.gemini.genai.get_file", return_value=_file("files/a")), \
+             patch("core.gemini.FILE_POLL_MIN_SECONDS", 0.01):
+            with pytest.raises(asyncio.TimeoutError):
+                asyncio.run(gemini.FilePoller().wait(_file("files/a"), timeout=0.1))
+
+    def test_starts_fast_and_backs_off(self):
+        """Short clips are ready almost at once; long ones should not be
+        hammered while they process."""
+        moments = []
+
+        def get_file(name):
+            moments.append(time.monotonic())
+            return _file(name)
+
+        async def scenario():
+            try:
+                await gemini.FilePoller().wait(_file("files/a"), timeout=0.5)
+            except asyncio.TimeoutError:
+                pass
+
+        with patch("core.gemini.genai.get_file", side_effect=get_file), \
+             patch("core.gemini.FILE_POLL_MIN_SECONDS", 0.02), \
+             patch("core.gemini.FILE_POLL_MAX_SECONDS", 0.2):
+            asyncio.run(scenario())
+
+        gaps = [later - earlier for earlier, later in zip(moments, moments[1:])]
+        assert gaps[0] < gaps[-1]
@@ -0,0 +1,235 @@
+"""Tests for reusing uploaded Gemini files and reaping them later."""
+import asyncio
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+from google.api_core.exceptions import NotFound
+
+from main import app
+from routers.videos import _upload_keys
+from services.ai import analyze_video_content
+from services.downloader import VideoFingerprint
+from services.gemini_files import UploadRegistry
+from services.media import ShrinkResult
+
+client = TestClient(app)
+
+
+def _file(name: str, state: str = "ACTIVE", expires_in: timedelta = timedelta(hours=48)):
+    file = MagicMock()
+    file.name = name
+    file.state.name = state
+    file.expiration_time = datetime.now(timezone.utc) + expires_in
+    return file
+
+
+def _response(text='{"titulo_sugerido": "ok"}', finish_reason="STOP"):
+    response = MagicMock()
+    candidate = MagicMock()
+    candidate.finish_reason.name = finish_reason
+    response.candidates = [candidate]
+    response.text = text
+    return response
+
+
+class TestRegistry:
+
+    def test_hands_out_a_tracked_file_until_it_expires(self):
+        registry = UploadRegistry(max_entries=10)
+        registry.add("abc:video", _file("files/1"))
+        registry.release("abc:video")
+
+        key, file = registry.acquire(["abc:video-muted", "abc:video"])
+
+        assert (key, file.name) == ("abc:video", "files/1")
+
+    def test_never_hands_out_a_file_about_to_expire_on_gemini(self):
+        registry = UploadRegistry(max_entries=10)
+        registry.add("abc:video", _file("files/1", expires_in=timedelta(minutes=5)))
+
+        assert registry.acquire(["abc:video"]) is None
+
+    def test_the_reaper_spares_files_in_use(self):
+        """Deleting a file mid-generation would fail that analysis."""
+        registry = UploadRegistry(max_entries=10)
+        registry.add("busy", _file("files/busy"))
+        registry.add("idle", _file("files/idle"))
+        registry.release("idle")
+
+        delete = AsyncMock()
+        with patch("services.gemini_files.delete_file", new=delete):
+            assert asyncio.run(registry.reap(everything=True)) == 1
+
+        delete.assert_awaited_once_with("files/idle")
+        assert len(registry) == 1
+
+    def test_reaps_the_oldest_beyond_capacity(self):
+        registry = UploadRegistry(max_entries=2)
+        for name in ("a", "b", "c"):
+            registry.add(name, _file(f"files/{name}"))
+            registry.release(name)
+
+        delete = AsyncMock()
+        with patch("services.gemini_files.delete_file", new=delete):
+            asyncio.run(registry.reap())
+
+        delete.assert_awaited_once_with("files/a")
+
+    def test_reaps_what_has_expired(self):
+        registry = UploadRegistry(max_entries=10)
+        registry.add("old", _file("files/old"))
+        registry.release("old")
+
+        registry.add("new", _file("files/new"))
+        registry.release("new")
+        registry._files["old"].expires_at = 0
+
+        delete = AsyncMock()
+        with patch("services.gemini_files.delete_file", new=delete):
+            asyncio.run(registry.reap())
+
+        delete.assert_awaited_once_with("files/old")
+        assert len(registry) == 1
+
+
+class TestReuse:
+
+    def test_a_retry_reuses_the_upload_instead_of_deleting_it(self):
+        """The first attempt fails after paying for the upload; the second
+        should not pay for it again."""
+        registry = UploadRegistry(max_entries=10)
+        upload = AsyncMock(return_value=_file("files/1"))
+        delete = AsyncMock()
+        attempts = [_response(finish_reason="SAFETY"), _response()]
+
+        async def generate(_contents):
+            return attempts.pop(0)
+
+        with patch("services.ai.uploaded_files", registry), \
+             patch("services.ai.upload_file", new=upload), \
+             patch("services.ai.delete_file", new=delete), \
+             patch("services.ai.model") as mock_model:
+            mock_model.generate_content_async = generate
+
+            with pytest.raises(Exception):
+                asyncio.run(analyze_video_content("clip.mp4", reuse_keys=["abc:video"]))
+            result = asyncio.run(analyze_video_content("clip.mp4", reuse_keys=["abc:video"]))
+
+        assert result == {"titulo_sugerido": "ok"}
+        upload.assert_awaited_once()
+        delete.assert_not_called()
+        assert registry.reused == 1
+
+    def test_without_a_key_the_upload_is_deleted_at_once(self):
+        registry = UploadRegistry(max_entries=10)
+        delete = AsyncMock()
+
+        async def generate(_contents):
+            return _response()
+
+        with patch("services.ai.uploaded_files", registry), \
+             patch("services.ai.upload_file", new=AsyncMock(return_value=_file("files/1"))), \
+             patch("services.ai.delete_file", new=delete), \
+             patch("services.ai.model") as mock_model:
+            mock_model.generate_content_async = generate
+            asyncio.run(analyze_video_content("clip.mp4"))
+
+        delete.assert_awaited_once_with("files/1")
+        assert len(registry) == 0
+
+    def test_a_file_that_failed_processing_is_not_kept(self):
+        registry = UploadRegistry(max_entries=10)
+        delete = AsyncMock()
+
+        with patch("services.ai.uploaded_files", registry), \
+             patch("services.ai.upload_file", new=AsyncMock(return_value=_file("files/1", "FAILED"))), \
+             patch("services.ai.delete_file", new=delete):
+            assert asyncio.run(analyze_video_content("clip.mp4", reuse_keys=["abc:video"])) is None
+
+        delete.assert_awaited_once_with("files/1")
+        assert len(registry) == 0
+
+
+    def test_a_file_gemini_rejects_is_dropped_not_reused(self):
+        """Otherwise every retry for hours would be charged for the same
+        failure."""
+        registry = UploadRegistry(max_entries=10)
+        upload = AsyncMock(side_effect=[_file("files/1"), _file("files/2")])
+        delete = AsyncMock()
+
+        async def generate(_contents):
+            raise NotFound("File files/1 is not in an ACTIVE state")
+
+        with patch("services.ai.uploaded_files", registry), \
+             patch("services.ai.upload_file", new=upload), \
+             patch("services.gemini_files.delete_file", new=delete), \
+             patch("services.ai.model") as mock_model:
+            mock_model.generate_content_async = generate
+            assert asyncio.run(analyze_video_content("clip.mp4", reuse_keys=["abc:video"])) is None
+
+            assert len(registry) == 0
+            delete.assert_awaited_once_with("files/1")
+
+            asyncio.run(analyze_video_content("clip.mp4", reuse_keys=["abc:video"]))
+
+        assert upload.await_count == 2
+
+    def test_a_timeout_keeps_the_file_for_the_retry(self):
+        registry = UploadRegistry(max_entries=10)
+
+        async def generate(_contents):
+            raise asyncio.TimeoutError()
+
+        with patch("services.ai.uploaded_files", registry), \
+             patch("services.ai.upload_file", new=AsyncMock(return_value=_file("files/1"))), \
+             patch("services.ai.model") as mock_model:
+            mock_model.generate_content_async = generate
+            with pytest.raises(asyncio.TimeoutError):
+                asyncio.run(analyze_video_content("clip.mp4", reuse_keys=["abc:video"]))
+
+        assert registry.has(["abc:video"])
+
+    @patch("routers.videos.analyze_video_content")
+    @patch("routers.videos.download_video", return_value="does-not-exist.mp4")
+    def test_a_reused_upload_skips_the_transcode(self, _download, mock_analyze):
+        registry = UploadRegistry(max_entries=10)
+        registry.add("abc:video", _file("files/1"))
+        registry.release("abc:video")
+        mock_analyze.return_value = {
+            "titulo_sugerido": "Um titulo valido",
+            "descricao_completa": "Uma descricao suficientemente longa para validar",
+            "metadados_estruturados": {},
+        }
+
+        with patch("routers.videos.uploaded_files", registry), \
+             patch("routers.videos.fingerprint_video", return_value=VideoFingerprint(sha256="abc")), \
+             patch("routers.videos.find_same_content", new=AsyncMock(return_value=None)), \
+             patch("routers.videos.prepare_upload") as prepare:
+            response = client.post("/videos/analyze", json={"url": "https://x.com/user/status/123"})
+
+        assert response.status_code == 200
+        prepare.assert_not_called()
+        assert mock_analyze.call_args.kwargs["reuse_keys"] == ["abc:video"]
+
+
+class TestUploadKeys:
+
+    FINGERPRINT = VideoFingerprint(sha256="abc")
+
+    def test_a_muted_upload_can_use_the_video_with_sound(self):
+        upload = ShrinkResult("a.mp4", "a.shrunk.mp4", 10, 5)
+
+        assert _upload_keys(self.FINGERPRINT, upload, keep_audio=False) == ["abc:video-muted", "abc:video"]
+        assert _upload_keys(self.FINGERPRINT, upload, keep_audio=True) == ["abc:video"]
+
+    def test_an_audio_track_is_never_swapped_for_a_video(self):
+        upload = ShrinkResult("a.mp4", "a.audio.aac", 10, 1, audio_only=True)
+
+        assert _upload_keys(self.FINGERPRINT, upload, keep_audio=True) == ["abc:audio"]
+
+    def test_no_fingerprint_means_no_reuse(self):
+        upload = ShrinkResult("a.mp4", "a.mp4", 10, 10)
+
+        assert _upload_keys(None, upload, keep_audio=True) == []
@@ -0,0 +1,187 @@
+"""Tests for running analyses as background jobs."""
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import httpx
+import pytest
+
+from main import app
+from services.jobs import JobQueueFullError, JobRunner
+from tests.conftest import TEST_QUOTA
+
+URL = "https://x.com/user/status/123"
+
+RESULT = {
+    "titulo_sugerido": "Um titulo valido",
+    "descricao_completa": "Uma descricao suficientemente longa para validar",
+    "url_original": URL,
+    "metadados_estruturados": {},
+}
+
+
+class TestJobRunner:
+
+    def test_never_runs_more_than_its_workers(self):
+        running = 0
+        peak = 0
+
+        async def work():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        async def scenario():
+            runner = JobRunner(workers=2, queue_limit=10, ttl_seconds=60)
+            jobs = [runner.submit("user", work) for _ in range(6)]
+            for job in jobs:
+                await runner.wait(job)
+            return jobs
+
+        jobs = asyncio.run(scenario())
+        assert peak == 2
+        assert all(job.status == "succeeded" for job in jobs)
+
+    def test_refuses_past_the_queue_limit(self):
+        async def scenario():
+            runner = JobRunner(workers=1, queue_limit=2, ttl_seconds=60)
+            runner.submit("user", lambda: asyncio.sleep(0.01))
+            runner.submit("user", lambda: asyncio.sleep(0.01))
+            with pytest.raises(JobQueueFullError):
+                runner.submit("user", lambda: asyncio.sleep(0.01))
+
+        asyncio.run(scenario())
+
+    def test_keeps_the_failure(self):
+        async def fail():
+            raise RuntimeError("boom")
+
+        async def scenario():
+            runner = JobRunner(workers=1, queue_limit=2, ttl_seconds=60)
+            return await runner.wait(runner.submit("user", fail))
+
+        job = asyncio.run(scenario())
+        assert job.status == "failed"
+        assert isinstance(job.error, RuntimeError)
+
+    def test_a_waiter_timing_out_does_not_cancel_the_job(self):
+        async def scenario():
+            runner = JobRunner(workers=1, queue_limit=2, ttl_seconds=60)
+            job = runner.submit("user", lambda: asyncio.sleep(0.05))
+            await runner.wait(job, timeout=0.01)
+            status_after_timeout = job.status
+            await runner.wait(job)
+            return status_after_timeout, job.status
+
+        assert asyncio.run(scenario()) == ("running", "succeeded")
+
+    def test_finished_jobs_expire(self):
+        async def scenario():
+            runner = JobRunner(workers=1, queue_limit=2, ttl_seconds=0)
+            job = await runner.wait(runner.submit("user", lambda: asyncio.sleep(0)))
+            job.finished_at -= 1
+            return runner.get(job.id)
+
+        assert asyncio.run(scenario()) is None
+
+
+@pytest.fixture
+def runner():
+    fresh = JobRunner(workers=2, queue_limit=5, ttl_seconds=60)
+    with patch("routers.videos.analysis_jobs", fresh):
+        yield fresh
+
+
+def _run(scenario):
+    """The job outlives the request that submitted it, so every request of a
+    test has to share one event loop."""
+    async def wrapper():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await scenario(client)
+
+    return asyncio.run(wrapper())
+
+
+class TestJobEndpoints:
+
+    @patch("routers.videos.analyze_video_content")
+    @patch("routers.videos.download_video", return_value="does-not-exist.mp4")
+    def test_submit_returns_at_once_and_the_result_can_be_fetched(self, _download, mock_analyze, runner):
+        mock_analyze.return_value = dict(RESULT)
+
+        async def scenario(client):
+            submitted = await client.post("/videos/jobs", json={"url": URL})
+            job_id = submitted.json()["job_id"]
+            fetched = await client.get(f"/videos/jobs/{job_id}", params={"wait": 5})
+            return submitted, fetched
+
+        submitted, fetched = _run(scenario)
+
+        assert submitted.status_code == 202
+        assert submitted.json()["status"] == "queued"
+        assert fetched.json()["status"] == "succeeded"
+        assert fetched.json()["result"]["titulo_sugerido"] == RESULT["titulo_sugerido"]
+
+    def test_failures_carry_the_status_the_endpoint_would_have_returned(self, runner):
+        from core.exceptions import ContentBlockedError
+
+        with patch("routers.videos.download_video", return_value="does-not-exist.mp4"), \
+             patch("routers.videos.analyze_video_content", side_effect=ContentBlockedError("SAFETY")):
+            async def scenario(client):
+                job_id = (await client.post("/videos/jobs", json={"url": URL})).json()["job_id"]
+                return await client.get(f"/videos/jobs/{job_id}", params={"wait": 5})
+
+            fetched = _run(scenario)
+
+        assert fetched.json()["status"] == "failed"
+        assert fetched.json()["error"]["status_code"] == 422
+
+    def test_a_cached_result_needs_no_job(self, runner):
+        with patch("routers.videos.get_cached_analysis", new=AsyncMock(return_value=RESULT)):
+            response = _run(lambda client: client.post("/videos/jobs", json={"url": URL}))
+
+        assert response.status_code == 200
+        assert response.json()["job_id"] is None
+        assert response.json()["result"]["titulo_sugerido"] == RESULT["titulo_sugerido"]
+
+    def test_other_users_jobs_are_not_found(self, runner):
+        async def scenario(client):
+            job = await runner.wait(runner.submit("someone-else", AsyncMock(return_value=RESULT)))
+            return await client.get(f"/videos/jobs/{job.id}")
+
+        response = _run(scenario)
+
+        assert response.status_code == 404
+
+    def test_jobs_in_flight_count_against_the_quota(self, runner):
+        """They are only recorded when they finish; without counting them, a
+        burst of submissions would all pass the check."""
+        release = asyncio.Event()
+
+        async def slow_analysis(*args):
+            await release.wait()
+            return RESULT
+
+        one_left = TEST_QUOTA.__class__(used=TEST_QUOTA.limit - 1, limit=TEST_QUOTA.limit, resets_at=TEST_QUOTA.resets_at)
+
+        async def scenario(client):
+            first = await client.post("/videos/jobs", json={"url": URL})
+            second = await client.post("/videos/jobs", json={"url": "https://x.com/user/status/456"})
+            release.set()
+            return first, second
+
+        with patch("routers.videos._run_analysis", new=slow_analysis), \
+             patch("routers.videos.get_quota", new=AsyncMock(return_value=one_left)):
+            first, second = _run(scenario)
+
+        assert first.status_code == 202
+        assert second.status_code == 429
+
+    def test_a_full_queue_is_refused_without_charging(self, runner):
+        with patch("routers.videos.analysis_jobs.submit", side_effect=JobQueueFullError()):
+            response = _run(lambda client: client.post("/videos/jobs", json={"url": URL}))
+
+        assert response.status_code == 503
+        assert "Nothing was taken" in response.json()["detail"]
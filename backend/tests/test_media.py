@@ -0,0 +1,273 @@
+"""Tests for preparing downloaded videos before they go to Gemini."""
+import os
+import subprocess
+from unittest.mock import AsyncMock, patch
+
+from fastapi.testclient import TestClient
+
+from main import app
+from services.media import Keyframes, _split_jpegs, extract_keyframes, prepare_upload, shrink_video
+
+client = TestClient(app)
+
+
+def _fake_ffmpeg(output_size):
+    """Stands in for ffmpeg: writes `output_size` bytes to the target path."""
+    def run(command, **kwargs):
+        with open(command[-1], "wb") as f:
+            f.write(b"x" * output_size)
+        return subprocess.CompletedProcess(command, 0)
+    return run
+
+
+class TestShrinkVideo:
+
+    def test_uploads_the_smaller_file_and_reports_the_saving(self, tmp_path):
+        source = tmp_path / "clip.mp4"
+        source.write_bytes(b"x" * 1000)
+
+        with patch("services.media.subprocess.run", side_effect=_fake_ffmpeg(300)):
+            result = shrink_video(str(source), keep_audio=True)
+
+        assert result.is_new_file
+        assert os.path.getsize(result.path) == 300
+        assert result.bytes_saved == 700
+
+    def test_keeps_the_original_when_transcoding_does_not_help(self, tmp_path):
+        source = tmp_path / "clip.mp4"
+        source.write_bytes(b"x" * 100)
+
+        with patch("services.media.subprocess.run", side_effect=_fake_ffmpeg(200)):
+            result = shrink_video(str(source), keep_audio=True)
+
+        assert result.path == str(source)
+        assert result.bytes_saved == 0
+        assert sorted(os.listdir(tmp_path)) == ["clip.mp4"]
+
+    def test_strips_the_audio_only_when_it_will_not_be_transcribed(self, tmp_path):
+        source = tmp_path / "clip.mp4"
+        source.write_bytes(b"x" * 1000)
+
+        with patch("services.media.subprocess.run", side_effect=_fake_ffmpeg(300)) as run:
+            shrink_video(str(source), keep_audio=False)
+            without_audio = run.call_args.args[0]
+            shrink_video(str(source), keep_audio=True)
+            with_audio = run.call_args.args[0]
+
+        assert "-an" in without_audio
+        assert "-an" not in with_audio
+
+    def test_without_ffmpeg_the_download_is_uploaded_as_is(self, tmp_path):
+        source = tmp_path / "clip.mp4"
+        source.write_bytes(b"x" * 1000)
+
+        with patch("services.media.subprocess.run", side_effect=FileNotFoundError("ffmpeg")):
+            result = shrink_video(str(source), keep_audio=True)
+
+        assert result.path == str(source)
+        assert not result.is_new_file
+
+    @patch("services.media.SHRINK_ENABLED", False)
+    def test_can_be_disabled(self, tmp_path):
+        source = tmp_path / "clip.mp4"
+        source.write_bytes(b"x" * 1000)
+
+        with patch("services.media.subprocess.run") as run:
+            result = shrink_video(str(source), keep_audio=True)
+
+        run.assert_not_called()
+        assert result.path == str(source)
+
+
+class TestAudioOnly:
+
+    def test_transcript_only_uploads_just_the_audio_track(self, tmp_path):
+        source = tmp_path / "clip.mp4"
+        source.write_bytes(b"x" * 1000)
+
+        with patch("services.media.subprocess.run", side_effect=_fake_ffmpeg(50)) as run:
+            result = prepare_upload(str(source), analyze_scenes=False, analyze_audio=True)
+
+        assert result.audio_only
+        assert result.path.endswith(".aac")
+        assert "-vn" in run.call_args.args[0]
+
+    def test_falls_back_to_the_video_when_there_is_no_audio_track(self, tmp_path):
+        source = tmp_path / "clip.mp4"
+        source.write_bytes(b"x" * 1000)
+
+        def ffmpeg(command, **kwargs):
+            if "-vn" in command:
+                raise subprocess.CalledProcessError(1, command)
+            return _fake_ffmpeg(300)(command)
+
+        with patch("services.media.subprocess.run", side_effect=ffmpeg):
+            result = prepare_upload(str(source), analyze_scenes=False, analyze_audio=True)
+
+        assert not result.audio_only
+        assert result.path.endswith(".shrunk.mp4")
+        assert sorted(os.listdir(tmp_path)) == ["clip.mp4", "clip.shrunk.mp4"]
+
+    def test_scenes_still_need_the_video(self, tmp_path):
+        source = tmp_path / "clip.mp4"
+        source.write_bytes(b"x" * 1000)
+
+        with patch("services.media.subprocess.run", side_effect=_fake_ffmpeg(300)):
+            result = prepare_upload(str(source), analyze_scenes=True, analyze_audio=True)
+
+        assert not result.audio_only
+        assert result.path.endswith(".shrunk.mp4")
+
+
+def _jpeg(tag: bytes) -> bytes:
+    return b"\xff\xd8" + tag + b"\xff\xd9"
+
+
+class TestKeyframes:
+
+    def test_splits_the_piped_stream_into_images(self):
+        frames = [_jpeg(b"one"), _jpeg(b"two"), _jpeg(b"three")]
+
+        assert _split_jpegs(b"".join(frames)) == frames
+
+    @patch("services.media.KEYFRAME_MAX_FRAMES", 3)
+    def test_thins_scene_changes_across_the_whole_video(self, tmp_path):
+        """Taking the first N cuts would describe only the opening seconds."""
+        source = tmp_path / "clip.mp4"
+        source.write_bytes(b"x" * 1000)
+        stream = b"".join(_jpeg(str(i).encode()) for i in range(9))
+
+        with patch("services.media.subprocess.run",
+                   return_value=subprocess.CompletedProcess([], 0, stdout=stream)):
+            keyframes = extract_keyframes(str(source), with_audio=False)
+
+        assert keyframes.frames == [_jpeg(b"0"), _jpeg(b"3"), _jpeg(b"6")]
+        assert keyframes.audio is None
+
+    def test_carries_the_audio_track_and_leaves_no_file_behind(self, tmp_path):
+        source = tmp_path / "clip.mp4"
+        source.write_bytes(b"x" * 1000)
+
+        def ffmpeg(command, **kwargs):
+            if command[-1] == "-":
+                return subprocess.CompletedProcess(command, 0, stdout=_jpeg(b"frame"))
+            return _fake_ffmpeg(40)(command)
+
+        with patch("services.media.subprocess.run", side_effect=ffmpeg):
+            keyframes = extract_keyframes(str(source), with_audio=True)
+
+        assert keyframes.audio == b"x" * 40
+        assert os.listdir(tmp_path) == ["clip.mp4"]
+
+    def test_gives_up_when_the_frames_would_not_fit_in_one_request(self, tmp_path):
+        source = tmp_path / "clip.mp4"
+        source.write_bytes(b"x" * 1000)
+
+        with patch("services.media.KEYFRAME_MAX_INLINE_BYTES", 5), \
+             patch("services.media.subprocess.run",
+                   return_value=subprocess.CompletedProcess([], 0, stdout=_jpeg(b"frame"))):
+            assert extract_keyframes(str(source), with_audio=False) is None
+
+
+@patch("routers.videos.analyze_keyframes")
+@patch("routers.videos.analyze_video_content")
+@patch("routers.videos.download_video")
+def test_keyframe_mode_falls_back_to_the_video(mock_download, mock_video, mock_keyframes, tmp_path):
+    source = tmp_path / "download.mp4"
+    source.write_bytes(b"x" * 1000)
+    mock_download.return_value = str(source)
+    mock_video.return_value = {
+        "titulo_sugerido": "Um titulo valido",
+        "descricao_completa": "Uma descricao suficientemente longa para validar",
+        "metadados_estruturados": {},
+    }
+
+    with patch("routers.videos.extract_keyframes", return_value=None), \
+         patch("routers.videos.fingerprint_video", return_value=None), \
+         patch("services.media.subprocess.run", side_effect=FileNotFoundError("ffmpeg")):
+        response = client.post(
+            "/videos/analyze",
+            json={"url": "https://x.com/user/status/123", "mode": "keyframes"},
+        )
+
+    assert response.status_code == 200
+    mock_keyframes.assert_not_called()
+    mock_video.assert_awaited_once()
+
+
+@patch("routers.videos.analyze_keyframes")
+@patch("routers.videos.download_video")
+def test_keyframe_analyses_are_metered_by_mode_and_not_cached(mock_download, mock_keyframes, tmp_path):
+    """A keyframe result must not be served later to someone who asked for
+    the whole video."""
+    source = tmp_path / "download.mp4"
+    source.write_bytes(b"x" * 1000)
+    mock_download.return_value = str(source)
+
+    async def analyze(frames, audio, scenes, wants_audio, usage):
+        usage.mode, usage.total = "keyframes", 1200
+        return {
+            "titulo_sugerido": "Um titulo valido",
+            "descricao_completa": "Uma descricao suficientemente longa para validar",
+            "metadados_estruturados": {},
+        }
+
+    mock_keyframes.side_effect = analyze
+    recorder = AsyncMock()
+
+    with patch("routers.videos.extract_keyframes", return_value=Keyframes([b"frame"])), \
+         patch("routers.videos.fingerprint_video", return_value=None), \
+         patch("routers.videos.store_analysis") as store, \
+         patch("routers.videos.record_event", new=recorder):
+        response = client.post(
+            "/videos/analyze",
+            json={"url": "https://x.com/user/status/123", "mode": "keyframes"},
+        )
+
+    assert response.status_code == 200
+    store.assert_not_called()
+    assert recorder.call_args.kwargs["analysis_mode"] == "keyframes"
+
+
+@patch("routers.videos.analyze_video_content")
+@patch("routers.videos.download_video")
+def test_gemini_gets_the_shrunk_file_and_both_are_cleaned_up(mock_download, mock_analyze, tmp_path):
+    source = tmp_path / "download.mp4"
+    source.write_bytes(b"x" * 1000)
+    mock_download.return_value = str(source)
+    mock_analyze.return_value = {
+        "titulo_sugerido": "Um titulo valido",
+        "descricao_completa": "Uma descricao suficientemente longa para validar",
+        "metadados_estruturados": {},
+    }
+
+    with patch("services.media.subprocess.run", side_effect=_fake_ffmpeg(300)), \
+         patch("routers.videos.fingerprint_video", return_value=None):
+        response = client.post("/videos/analyze", json={"url": "https://x.com/user/status/123"})
+
+    assert response.status_code == 200
+    uploaded = mock_analyze.call_args.args[0]
+    assert uploaded.endswith(".shrunk.mp4")
+    assert os.listdir(tmp_path) == []
+
+
+@patch("routers.videos.analyze_video_content")
+@patch("routers.videos.download_video")
+def test_bytes_saved_are_recorded_with_the_analysis(mock_download, mock_analyze, tmp_path):
+    source = tmp_path / "download.mp4"
+    source.write_bytes(b"x" * 1000)
+    mock_download.return_value = str(source)
+    mock_analyze.return_value = {
+        "titulo_sugerido": "Um titulo valido",
+        "descricao_completa": "Uma descricao suficientemente longa para validar",
+        "metadados_estruturados": {},
+    }
+    recorder = AsyncMock()
+
+    with patch("services.media.subprocess.run", side_effect=_fake_ffmpeg(300)), \
+         patch("routers.videos.fingerprint_video", return_value=None), \
+         patch("routers.videos.record_event", new=recorder):
+        response = client.post("/videos/analyze", json={"url": "https://x.com/user/status/123"})
+
+    assert response.status_code == 200
+    assert recorder.call_args.kwargs["bytes_saved"] == 700
@@ -29,6 +29,7 @@ def test_saving_records_the_signed_in_user_as_owner(mock_embedding, mock_supabas
     assert response.status_code == 200
     payload = mock_supabase.table.return_value.insert.call_args[0][0]
     assert payload["user_id"] == TEST_USER_ID
+    assert payload["tweet_id"] == "123"
 
 
 @patch("routers.me.supabase")
@@ -74,3 +75,22 @@ def test_listing_tolerates_an_empty_library(mock_supabase):
 
     assert response.status_code == 200
     assert response.json() == []
+
+
+@patch("routers.videos.supabase")
+@patch("routers.videos.create_embedding")
+def test_saving_moves_the_archive_generation_forward(mock_embedding, mock_supabase):
+    """Cached search results are keyed by generation; a save that left it alone
+    would keep serving results that miss the new video."""
+    from services.archive import generation
+
+    mock_embedding.return_value = [0.1] * 768
+    mock_supabase.table.return_value.insert.return_value.execute.return_value = (
+        ("data", [{"id": "video-1"}]),
+        ("count", None),
+    )
+    before = generation()
+
+    client.post("/videos", json=VALID_VIDEO)
+
+    assert generation() == before + 1
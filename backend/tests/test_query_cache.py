@@ -0,0 +1,170 @@
+"""Tests for the bounded cache and the query embeddings it keeps."""
+import asyncio
+import json
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from core.cache import TTLCache
+from core.gemini import EMBEDDING_DIMENSIONS, EMBEDDING_MODEL
+from services import embedding
+from services.embedding import embed_query, encode_vector, normalize_query
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache:
+
+    def test_returns_what_was_stored(self):
+        cache = TTLCache(max_entries=2, ttl_seconds=60)
+        cache.set("a", [1.0])
+
+        assert cache.get("a") == [1.0]
+
+    def test_entries_expire_after_their_ttl(self):
+        clock = FakeClock()
+        cache = TTLCache(max_entries=2, ttl_seconds=60, clock=clock)
+        cache.set("a", [1.0])
+
+        clock.now = 61
+
+        assert cache.get("a") is None
+        assert len(cache) == 0
+
+    def test_evicts_the_least_recently_used_entry(self):
+        cache = TTLCache(max_entries=2, ttl_seconds=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+        assert cache.stats().evictions == 1
+
+    def test_counts_hits_and_misses(self):
+        cache = TTLCache(max_entries=2, ttl_seconds=60)
+        cache.set("a", 1)
+        cache.get("a")
+        cache.get("a")
+        cache.get("missing")
+
+        stats = cache.stats()
+        assert (stats.hits, stats.misses) == (2, 1)
+        assert stats.hit_rate == pytest.approx(2 / 3, abs=1e-4)
+
+    def test_a_zero_sized_cache_stores_nothing(self):
+        cache = TTLCache(max_entries=0, ttl_seconds=60)
+        cache.set("a", 1)
+
+        assert cache.get("a") is None
+
+
+@pytest.fixture
+def empty_query_cache():
+    embedding.query_cache.clear()
+    yield embedding.query_cache
+    embedding.query_cache.clear()
+
+
+class TestQueryEmbeddingCache:
+    """Popular queries repeat constantly; only the first should reach Gemini."""
+
+    @patch("services.embedding.embed_content")
+    def test_repeat_query_skips_gemini(self, mock_embed, empty_query_cache):
+        mock_embed.return_value = {"embedding": [0.1, 0.2]}
+
+        first = asyncio.run(embed_query("gato laranja"))
+        second = asyncio.run(embed_query("gato laranja"))
+
+        assert first == second == [0.1, 0.2]
+        mock_embed.assert_called_once()
+        assert empty_query_cache.stats().hits == 1
+
+    @patch("services.embedding.embed_content")
+    def test_case_and_spacing_do_not_split_the_cache(self, mock_embed, empty_query_cache):
+        mock_embed.return_value = {"embedding": [0.1, 0.2]}
+
+        asyncio.run(embed_query("Gato  Laranja"))
+        asyncio.run(embed_query("  gato laranja "))
+
+        mock_embed.assert_called_once()
+        assert mock_embed.call_args.kwargs["content"] == "gato laranja"
+
+    @patch("services.embedding.embed_content")
+    def test_failures_are_not_cached(self, mock_embed, empty_query_cache):
+        mock_embed.side_effect = [RuntimeError("boom"), {"embedding": [0.3]}]
+
+        with pytest.raises(RuntimeError):
+            asyncio.run(embed_query("capivara"))
+
+        assert asyncio.run(embed_query("capivara")) == [0.3]
+        assert mock_embed.call_count == 2
+
+    def test_key_pins_the_model_and_dimensionality(self):
+        key = embedding._query_cache_key("Capivara")
+
+        assert key == (normalize_query("Capivara"), EMBEDDING_MODEL, EMBEDDING_DIMENSIONS)
+
+
+def _embed_queries(texts):
+    return asyncio.run(embedding.embed_queries(texts))
+
+
+class TestBatchedQueryEmbedding:
+
+    @patch("services.embedding.embed_content")
+    def test_only_misses_reach_gemini_in_one_call(self, mock_embed, empty_query_cache):
+        mock_embed.side_effect = [
+            {"embedding": [0.1]},
+            {"embedding": [[0.2], [0.3]]},
+        ]
+        asyncio.run(embed_query("gato"))
+
+        vectors = _embed_queries(["gato", "rato", "Rato", "pato"])
+
+        assert vectors == [[0.1], [0.2], [0.2], [0.3]]
+        assert mock_embed.call_args.kwargs["content"] == ["rato", "pato"]
+        assert mock_embed.call_count == 2
+
+    @patch("services.embedding.embed_content")
+    def test_nothing_is_sent_when_everything_is_cached(self, mock_embed, empty_query_cache):
+        mock_embed.return_value = {"embedding": [0.1]}
+        asyncio.run(embed_query("gato"))
+
+        assert _embed_queries(["gato"]) == [[0.1]]
+        mock_embed.assert_called_once()
+
+
+class TestVectorEncoding:
+    """Vectors travel as pgvector text literals carrying only the precision
+    the column keeps."""
+
+    def test_round_trips_float32_exactly(self):
+        vector = np.random.default_rng(0).standard_normal(768).astype(np.float32)
+
+        decoded = np.array(json.loads(encode_vector(vector.tolist())), dtype=np.float32)
+
+        assert np.array_equal(decoded, vector)
+
+    def test_is_much_smaller_than_a_json_float_list(self):
+        vector = np.random.default_rng(0).standard_normal(768).tolist()
+
+        assert len(encode_vector(vector)) < len(json.dumps(vector)) * 0.6
+
+    def test_halfvec_storage_sends_float16_precision(self):
+        vector = np.random.default_rng(0).standard_normal(768).astype(np.float16)
+
+        with patch("services.embedding.VECTOR_DIGITS", 5):
+            encoded = encode_vector(vector.astype(np.float64).tolist())
+
+        assert np.array_equal(np.array(json.loads(encoded), dtype=np.float16), vector)
@@ -83,7 +83,7 @@ class TestUsageRecording:
             response = client.post("/videos/analyze", json=ANALYZE_BODY)
 
         assert response.status_code == 200
-        recorder.assert_awaited_once_with(TEST_USER_ID, "analysis", True, None, 0, 0, 0)
+        recorder.assert_awaited_once_with(TEST_USER_ID, "analysis", True, None, 0, 0, 0, analysis_mode="video", bytes_saved=0)
 
     @patch("routers.videos.analyze_video_content")
     @patch("routers.videos.download_video")
@@ -97,7 +97,7 @@ class TestUsageRecording:
             response = client.post("/videos/analyze", json=ANALYZE_BODY)
 
         assert response.status_code == 422
-        recorder.assert_awaited_once_with(TEST_USER_ID, "analysis", False, "blocked:SAFETY", 0, 0, 0)
+        recorder.assert_awaited_once_with(TEST_USER_ID, "analysis", False, "blocked:SAFETY", 0, 0, 0, analysis_mode="video", bytes_saved=0)
 
     @patch("routers.videos.analyze_video_content")
     @patch("routers.videos.download_video")
@@ -112,14 +112,14 @@ class TestUsageRecording:
             response = client.post("/videos/analyze", json=ANALYZE_BODY)
 
         assert response.status_code == 504
-        recorder.assert_awaited_once_with(TEST_USER_ID, "analysis", False, "timeout", 0, 0, 0)
+        recorder.assert_awaited_once_with(TEST_USER_ID, "analysis", False, "timeout", 0, 0, 0, analysis_mode="video", bytes_saved=0)
 
     @patch("routers.videos.analyze_video_content")
     @patch("routers.videos.download_video")
     def test_stores_the_tokens_the_analysis_reported(self, mock_download, mock_analyze):
         mock_download.return_value = "does-not-exist.mp4"
 
-        async def fill_usage(_path, _scenes, _audio, usage):
+        async def fill_usage(_path, _scenes, _audio, usage, **_options):
             usage.prompt, usage.output, usage.total = 8451, 609, 10890
             return {
                 "titulo_sugerido": "Um titulo valido",
@@ -134,7 +134,7 @@ class TestUsageRecording:
             client.post("/videos/analyze", json=ANALYZE_BODY)
 
         recorder.assert_awaited_once_with(
-            TEST_USER_ID, "analysis", True, None, 8451, 609, 10890
+            TEST_USER_ID, "analysis", True, None, 8451, 609, 10890, analysis_mode="video", bytes_saved=0
         )
 
     @patch("routers.videos.analyze_video_content")
@@ -144,7 +144,7 @@ class TestUsageRecording:
         burned its input tokens, and a return value never arrives."""
         mock_download.return_value = "does-not-exist.mp4"
 
-        async def burn_then_fail(_path, _scenes, _audio, usage):
+        async def burn_then_fail(_path, _scenes, _audio, usage, **_options):
             usage.prompt, usage.output, usage.total = 8000, 0, 8523
             raise ContentBlockedError("SAFETY")
 
@@ -155,7 +155,7 @@ class TestUsageRecording:
             client.post("/videos/analyze", json=ANALYZE_BODY)
 
         recorder.assert_awaited_once_with(
-            TEST_USER_ID, "analysis", False, "blocked:SAFETY", 8000, 0, 8523
+            TEST_USER_ID, "analysis", False, "blocked:SAFETY", 8000, 0, 8523, analysis_mode="video", bytes_saved=0
         )
 
     @patch("routers.videos.download_video")
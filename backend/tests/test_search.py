@@ -1,3 +1,5 @@
+import json
+
 from fastapi.testclient import TestClient
 from unittest.mock import patch, MagicMock
 from main import app
@@ -140,8 +142,9 @@ def test_text_mode_skips_embedding_generation(mock_embed, mock_supabase):
     assert rpc_params["search_mode"] == "text"
     # The signature still demands a vector(768); anything shorter is rejected
     # by Postgres before the LIMIT 0 ever applies.
-    assert len(rpc_params["query_embedding"]) == 768
-    assert set(rpc_params["query_embedding"]) == {0.0}
+    zeros = json.loads(rpc_params["query_embedding"])
+    assert len(zeros) == 768
+    assert set(zeros) == {0.0}
 
 
 @patch("routers.search.supabase")
@@ -173,3 +176,291 @@ def test_search_handles_empty_rpc_response(mock_embed, mock_supabase):
 
     assert response.status_code == 200
     assert response.json() == []
+
+
+@patch("routers.search.supabase")
+@patch("routers.search.embed_query")
+def test_prefilter_is_only_sent_when_configured(mock_embed, mock_supabase):
+    """Databases whose match_videos predates the two-stage parameters must keep
+    working with the default."""
+    mock_embed.return_value = [0.1, 0.2, 0.3]
+    _mock_rpc(mock_supabase, [])
+
+    client.post("/search", json={"query": "capivara"})
+
+    _, rpc_params = mock_supabase.rpc.call_args[0]
+    assert "vector_prefilter" not in rpc_params
+    assert "rerank_factor" not in rpc_params
+
+
+@patch("routers.search.VECTOR_PREFILTER", "binary")
+@patch("routers.search.supabase")
+@patch("routers.search.embed_query")
+def test_configured_prefilter_reaches_the_rpc(mock_embed, mock_supabase):
+    mock_embed.return_value = [0.1, 0.2, 0.3]
+    _mock_rpc(mock_supabase, [])
+
+    client.post("/search", json={"query": "capivara"})
+
+    _, rpc_params = mock_supabase.rpc.call_args[0]
+    assert rpc_params["vector_prefilter"] == "binary"
+    assert rpc_params["rerank_factor"] >= 1
+
+
+class TestResultCache:
+    """The archive only changes when a video is saved, so a repeat search can
+    skip both the embedding and the RPC until then."""
+
+    ROW = {
+        "id": "123",
+        "titulo_video": "Teste",
+        "descricao_completa": "Descrição",
+        "url_original": "http://twitter.com/teste",
+        "similarity": 0.9,
+        "text_rank": 0.0,
+        "score": 0.0196,
+    }
+
+    @patch("routers.search.supabase")
+    @patch("routers.search.embed_query")
+    def test_repeat_search_is_served_from_memory(self, mock_embed, mock_supabase):
+        mock_embed.return_value = [0.1, 0.2, 0.3]
+        _mock_rpc(mock_supabase, [self.ROW])
+
+        first = client.post("/search", json={"query": "gato laranja"})
+        second = client.post("/search", json={"query": "  Gato laranja"})
+
+        assert first.json() == second.json()
+        mock_embed.assert_called_once()
+        mock_supabase.rpc.assert_called_once()
+
+    @patch("routers.search.supabase")
+    @patch("routers.search.embed_query")
+    def test_different_parameters_are_cached_apart(self, mock_embed, mock_supabase):
+        mock_embed.return_value = [0.1, 0.2, 0.3]
+        _mock_rpc(mock_supabase, [])
+
+        client.post("/search", json={"query": "gato", "limit": 5})
+        client.post("/search", json={"query": "gato", "limit": 10})
+        client.post("/search", json={"query": "gato", "threshold": 0.3})
+        client.post("/search", json={"query": "gato", "mode": "text"})
+
+        assert mock_supabase.rpc.call_count == 4
+
+    @patch("routers.search.supabase")
+    @patch("routers.search.embed_query")
+    def test_saving_a_video_invalidates_cached_results(self, mock_embed, mock_supabase):
+        from services.archive import bump_generation
+
+        mock_embed.return_value = [0.1, 0.2, 0.3]
+        _mock_rpc(mock_supabase, [])
+        client.post("/search", json={"query": "gato"})
+
+        bump_generation()
+        _mock_rpc(mock_supabase, [self.ROW])
+        response = client.post("/search", json={"query": "gato"})
+
+        assert response.json()[0]["id"] == "123"
+        assert mock_supabase.rpc.call_count == 2
+
+    @patch("routers.search.supabase")
+    @patch("routers.search.embed_query")
+    def test_failures_are_not_cached(self, mock_embed, mock_supabase):
+        mock_embed.return_value = [0.1, 0.2, 0.3]
+        mock_supabase.rpc.return_value.execute.side_effect = [Exception("down"), MagicMock(data=[])]
+
+        assert client.post("/search", json={"query": "gato"}).status_code == 500
+        assert client.post("/search", json={"query": "gato"}).status_code == 200
+
+
+class TestBatchSearch:
+    """Bulk consumers pay one rate-limit slot and one embedding call."""
+
+    @patch("routers.search.supabase")
+    @patch("routers.search.embed_queries")
+    @patch("routers.search.embed_query")
+    def test_embeds_every_query_in_one_call(self, mock_embed, mock_embed_many, mock_supabase):
+        mock_embed_many.side_effect = lambda texts: [[float(i)] for i in range(len(texts))]
+        _mock_rpc(mock_supabase, [])
+
+        response = client.post("/search/batch", json={"searches": [
+            {"query": "gato"},
+            {"query": "cachorro", "mode": "semantic"},
+            {"query": "capivara", "mode": "text"},
+        ]})
+
+        assert response.status_code == 200
+        assert response.json() == [[], [], []]
+        mock_embed.assert_not_called()
+        mock_embed_many.assert_called_once_with(["gato", "cachorro"])
+        assert mock_supabase.rpc.call_count == 3
+
+    @patch("routers.search.supabase")
+    @patch("routers.search.embed_queries")
+    def test_results_come_back_in_request_order(self, mock_embed_many, mock_supabase):
+        mock_embed_many.side_effect = lambda texts: [[0.1] for _ in texts]
+
+        def rpc(_name, params):
+            call = MagicMock()
+            call.execute.return_value.data = [{
+                "id": params["query_text"],
+                "titulo_video": params["query_text"],
+                "url_original": "http://twitter.com/x",
+                "similarity": 0.9,
+            }]
+            return call
+
+        mock_supabase.rpc.side_effect = rpc
+        queries = ["um", "dois", "tres", "quatro"]
+
+        response = client.post("/search/batch", json={"searches": [{"query": q} for q in queries]})
+
+        assert [page[0]["id"] for page in response.json()] == queries
+
+    @patch("routers.search.supabase")
+    @patch("routers.search.embed_queries")
+    def test_cached_searches_are_not_embedded_again(self, mock_embed_many, mock_supabase):
+        mock_embed_many.side_effect = lambda texts: [[0.1] for _ in texts]
+        _mock_rpc(mock_supabase, [])
+
+        client.post("/search/batch", json={"searches": [{"query": "gato"}]})
+        client.post("/search/batch", json={"searches": [{"query": "gato"}, {"query": "rato"}]})
+
+        assert mock_embed_many.call_args_list[1].args[0] == ["rato"]
+
+    def test_rejects_an_empty_batch(self):
+        assert client.post("/search/batch", json={"searches": []}).status_code == 422
+
+    def test_rejects_an_oversized_batch(self):
+        from dtos import MAX_BATCH_SEARCHES
+
+        searches = [{"query": f"busca {i}"} for i in range(MAX_BATCH_SEARCHES + 1)]
+        assert client.post("/search/batch", json={"searches": searches}).status_code == 422
+
+
+def _stream(payload):
+    import json
+
+    response = client.post("/search/stream", json=payload)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    return [json.loads(line) for line in response.text.splitlines() if line]
+
+
+class TestStreamingSearch:
+    """Full-text hits need no embedding, so a hybrid search can show them
+    after one database round trip instead of waiting on Gemini."""
+
+    TEXT_ROW = {"id": "t", "titulo_video": "Texto", "url_original": "http://twitter.com/t",
+                "similarity": 0.0, "text_rank": 0.5, "score": 0.0196}
+    FUSED_ROW = {"id": "f", "titulo_video": "Fundido", "url_original": "http://twitter.com/f",
+                 "similarity": 0.8, "text_rank": 0.5, "score": 0.0392}
+
+    def _rpc_by_mode(self, mock_supabase):
+        def rpc(_name, params):
+            call = MagicMock()
+            call.execute.return_value.data = [self.TEXT_ROW if params["search_mode"] == "text" else self.FUSED_ROW]
+            return call
+
+        mock_supabase.rpc.side_effect = rpc
+
+    @patch("routers.search.supabase")
+    @patch("routers.search.embed_query")
+    def test_hybrid_sends_text_hits_then_the_fused_ranking(self, mock_embed, mock_supabase):
+        mock_embed.return_value = [0.1, 0.2, 0.3]
+        self._rpc_by_mode(mock_supabase)
+
+        events = _stream({"query": "gato"})
+
+        assert [event["phase"] for event in events] == ["partial", "final"]
+        assert events[0]["results"][0]["id"] == "t"
+        assert events[1]["results"][0]["id"] == "f"
+
+    @patch("routers.search.supabase")
+    @patch("routers.search.embed_query")
+    def test_other_modes_send_a_single_final_event(self, mock_embed, mock_supabase):
+        mock_embed.return_value = [0.1, 0.2, 0.3]
+        self._rpc_by_mode(mock_supabase)
+
+        for mode in ("semantic", "text"):
+            events = _stream({"query": "gato", "mode": mode})
+            assert [event["phase"] for event in events] == ["final"], mode
+
+    @patch("routers.search.supabase")
+    @patch("routers.search.embed_query")
+    def test_a_cached_search_is_final_straight_away(self, mock_embed, mock_supabase):
+        mock_embed.return_value = [0.1, 0.2, 0.3]
+        self._rpc_by_mode(mock_supabase)
+        client.post("/search", json={"query": "gato"})
+
+        events = _stream({"query": "gato"})
+
+        assert [event["phase"] for event in events] == ["final"]
+
+    @patch("routers.search.supabase")
+    @patch("routers.search.embed_query")
+    def test_an_embedding_failure_ends_with_an_error_event(self, mock_embed, mock_supabase):
+        mock_embed.side_effect = RuntimeError("gemini down")
+        self._rpc_by_mode(mock_supabase)
+
+        events = _stream({"query": "gato"})
+
+        assert [event["phase"] for event in events] == ["partial", "error"]
+        assert "gemini" not in events[1]["detail"]
+
+
+class TestPagination:
+    """Later pages are slices of a ranking kept server-side, so paging never
+    re-embeds the query or re-runs the RPC."""
+
+    @staticmethod
+    def _rows(count):
+        return [
+            {"id": str(i), "titulo_video": f"Vídeo {i}", "url_original": f"http://twitter.com/{i}",
+             "similarity": 0.5, "text_rank": 0.0, "score": 0.01}
+            for i in range(count)
+        ]
+
+    @patch("routers.search.supabase")
+    @patch("routers.search.embed_query")
+    def test_pages_through_one_ranking(self, mock_embed, mock_supabase):
+        mock_embed.return_value = [0.1, 0.2, 0.3]
+        _mock_rpc(mock_supabase, self._rows(12))
+
+        first = client.post("/search/page", json={"query": "gato", "limit": 5}).json()
+        second = client.get("/search/page", params={"cursor": first["next_cursor"]}).json()
+        third = client.get("/search/page", params={"cursor": second["next_cursor"]}).json()
+
+        assert [r["id"] for r in first["results"]] == ["0", "1", "2", "3", "4"]
+        assert [r["id"] for r in second["results"]] == ["5", "6", "7", "8", "9"]
+        assert [r["id"] for r in third["results"]] == ["10", "11"]
+        assert third["next_cursor"] is None
+        assert first["total"] == 12
+
+        mock_embed.assert_called_once()
+        mock_supabase.rpc.assert_called_once()
+
+    @patch("routers.search.supabase")
+    @patch("routers.search.embed_query")
+    def test_ranks_as_deep_as_the_candidate_pools_go(self, mock_embed, mock_supabase):
+        from routers.search import PAGINATION_DEPTH
+
+        mock_embed.return_value = [0.1, 0.2, 0.3]
+        _mock_rpc(mock_supabase, [])
+
+        client.post("/search/page", json={"query": "gato", "limit": 5})
+
+        _, rpc_params = mock_supabase.rpc.call_args[0]
+        assert rpc_params["match_count"] == PAGINATION_DEPTH
+
+    def test_an_expired_cursor_is_gone(self):
+        from routers.search import _encode_cursor
+
+        response = client.get("/search/page", params={"cursor": _encode_cursor("forgotten", 5)})
+
+        assert response.status_code == 410
+
+    def test_a_malformed_cursor_is_rejected(self):
+        response = client.get("/search/page", params={"cursor": "%%%not-a-cursor"})
+
+        assert response.status_code == 400
@@ -117,8 +117,9 @@ def test_google_refusal_is_translated_at_the_boundary():
     import asyncio
     import pytest
 
-    with patch("services.ai.genai") as mock_genai, patch("services.ai.model") as mock_model:
-        mock_genai.upload_file.return_value = uploaded
+    with patch("services.ai.upload_file", new=AsyncMock(return_value=uploaded)), \
+         patch("services.ai.delete_file", new=AsyncMock()), \
+         patch("services.ai.model") as mock_model:
         mock_model.generate_content_async = refuse
 
         with pytest.raises(ServiceQuotaExhaustedError):
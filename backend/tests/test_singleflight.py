@@ -0,0 +1,126 @@
+"""Tests for coalescing concurrent identical work."""
+import asyncio
+import time
+from unittest.mock import MagicMock, patch
+
+from core.singleflight import SingleFlight
+from dtos import SearchRequest
+
+
+class TestSingleFlight:
+
+    def test_concurrent_callers_share_one_call(self):
+        calls = 0
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return "result"
+
+        async def scenario():
+            flight = SingleFlight()
+            return await asyncio.gather(*(flight.do("key", work) for _ in range(5)))
+
+        assert asyncio.run(scenario()) == ["result"] * 5
+        assert calls == 1
+
+    def test_different_keys_do_not_share(self):
+        async def scenario():
+            flight = SingleFlight()
+
+            async def echo(value):
+                await asyncio.sleep(0.01)
+                return value
+
+            return await asyncio.gather(flight.do("a", lambda: echo("a")), flight.do("b", lambda: echo("b")))
+
+        assert asyncio.run(scenario()) == ["a", "b"]
+
+    def test_every_caller_sees_the_failure(self):
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream down")
+
+        async def scenario():
+            flight = SingleFlight()
+            return await asyncio.gather(
+                flight.do("key", fail), flight.do("key", fail), return_exceptions=True
+            )
+
+        results = asyncio.run(scenario())
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+    def test_forgets_the_key_once_done(self):
+        """It deduplicates, it does not cache: the next call runs again."""
+        calls = 0
+
+        async def work():
+            nonlocal calls
+            calls += 1
+
+        async def scenario():
+            flight = SingleFlight()
+            await flight.do("key", work)
+            await flight.do("key", work)
+            return len(flight)
+
+        assert asyncio.run(scenario()) == 0
+        assert calls == 2
+
+    def test_one_caller_giving_up_does_not_cancel_the_others(self):
+        async def work():
+            await asyncio.sleep(0.05)
+            return "done"
+
+        async def scenario():
+            flight = SingleFlight()
+            impatient = asyncio.ensure_future(flight.do("key", work))
+            patient = asyncio.ensure_future(flight.do("key", work))
+            await asyncio.sleep(0.01)
+            impatient.cancel()
+            return await patient
+
+        assert asyncio.run(scenario()) == "done"
+
+
+@patch("routers.search.supabase")
+@patch("routers.search.embed_query")
+def test_a_burst_of_identical_searches_costs_one_upstream_call(mock_embed, mock_supabase):
+    from routers.search import _result_cache_key, _search
+
+    def slow_embed(_text):
+        time.sleep(0.05)
+        return [0.1, 0.2, 0.3]
+
+    mock_embed.side_effect = slow_embed
+    mock_supabase.rpc.return_value.execute.return_value = MagicMock(data=[])
+
+    async def burst():
+        request = SearchRequest(query="gato laranja")
+        return await asyncio.gather(*(_search(request, _result_cache_key(request)) for _ in range(10)))
+
+    assert asyncio.run(burst()) == [[]] * 10
+    assert mock_embed.call_count == 1
+    assert mock_supabase.rpc.call_count == 1
+
+
+@patch("routers.search.supabase")
+@patch("routers.search.embed_query")
+def test_modes_of_the_same_query_share_the_embedding(mock_embed, mock_supabase):
+    from routers.search import _result_cache_key, _search
+
+    def slow_embed(_text):
+        time.sleep(0.05)
+        return [0.1, 0.2, 0.3]
+
+    mock_embed.side_effect = slow_embed
+    mock_supabase.rpc.return_value.execute.return_value = MagicMock(data=[])
+
+    async def burst():
+        requests = [SearchRequest(query="gato", mode=mode) for mode in ("hybrid", "semantic")]
+        return await asyncio.gather(*(_search(r, _result_cache_key(r)) for r in requests))
+
+    asyncio.run(burst())
+    assert mock_embed.call_count == 1
+    assert mock_supabase.rpc.call_count == 2
@@ -0,0 +1,146 @@
+"""Tests for the temp storage budget, file cleanup and orphan sweep."""
+import asyncio
+import os
+import time
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from services.temp_storage import TempStorage, TempStorageFullError
+
+client = TestClient(app)
+
+
+class TestBudget:
+
+    def test_waits_for_room_and_then_proceeds(self, tmp_path):
+        storage = TempStorage(str(tmp_path), budget_bytes=100, wait_seconds=5)
+
+        async def scenario():
+            first = await storage.reserve(80)
+            second = asyncio.ensure_future(storage.reserve(50))
+            await asyncio.sleep(0.05)
+            assert not second.done()
+            assert storage.stats().waiting == 1
+
+            await first.release()
+            await second
+            return storage.stats()
+
+        stats = asyncio.run(scenario())
+
+        assert stats.reserved_bytes == 50
+        assert stats.waiting == 0
+
+    def test_refuses_once_the_wait_runs_out(self, tmp_path):
+        storage = TempStorage(str(tmp_path), budget_bytes=100, wait_seconds=0.05)
+
+        async def scenario():
+            await storage.reserve(80)
+            with pytest.raises(TempStorageFullError):
+                await storage.reserve(50)
+
+        asyncio.run(scenario())
+
+        assert storage.stats().reserved_bytes == 80
+
+    def test_trimming_a_reservation_lets_a_waiter_in(self, tmp_path):
+        """Reservations start at the worst case; the real size frees the rest."""
+        storage = TempStorage(str(tmp_path), budget_bytes=100, wait_seconds=5)
+
+        async def scenario():
+            first = await storage.reserve(100)
+            second = asyncio.ensure_future(storage.reserve(60))
+            await asyncio.sleep(0.05)
+
+            await first.fit(30)
+            await second
+
+        asyncio.run(scenario())
+
+        assert storage.stats().reserved_bytes == 90
+
+    def test_a_reservation_larger_than_the_budget_runs_alone(self, tmp_path):
+        storage = TempStorage(str(tmp_path), budget_bytes=100, wait_seconds=0.05)
+
+        lease = asyncio.run(storage.reserve(500))
+
+        assert lease.nbytes == 500
+
+
+class TestFiles:
+
+    def test_release_deletes_what_was_tracked(self, tmp_path):
+        storage = TempStorage(str(tmp_path), budget_bytes=100, wait_seconds=1)
+        video = tmp_path / "video.mp4"
+        video.write_bytes(b"x" * 40)
+
+        async def scenario():
+            lease = await storage.reserve(80)
+            lease.track(str(video))
+            during = storage.stats()
+            await lease.release()
+            return during
+
+        during = asyncio.run(scenario())
+
+        assert (during.leases, during.tracked_files, during.reserved_bytes) == (1, 1, 80)
+        assert not video.exists()
+        assert storage.stats().reserved_bytes == 0
+
+    def test_sweeps_only_files_old_enough_to_be_orphans(self, tmp_path):
+        """Another worker may be using the fresh ones."""
+        storage = TempStorage(str(tmp_path), budget_bytes=100, wait_seconds=1)
+        orphan = tmp_path / "orphan.mp4"
+        orphan.write_bytes(b"x" * 10)
+        stale = time.time() - 7200
+        os.utime(orphan, (stale, stale))
+        (tmp_path / "live.mp4").write_bytes(b"x")
+
+        assert storage.sweep(max_age_seconds=3600) == (1, 10)
+        assert os.listdir(tmp_path) == ["live.mp4"]
+        assert storage.stats().swept_bytes == 10
+
+    def test_a_sweep_spares_files_a_live_analysis_holds(self, tmp_path):
+        """Sweeps run while serving, and an analysis can outlast the age."""
+        storage = TempStorage(str(tmp_path), budget_bytes=100, wait_seconds=1)
+        stale = time.time() - 7200
+        for name in ("held.mp4", "orphan.mp4"):
+            (tmp_path / name).write_bytes(b"x")
+            os.utime(tmp_path / name, (stale, stale))
+
+        async def scenario():
+            lease = await storage.reserve(10)
+            lease.track(str(tmp_path / "held.mp4"))
+            return storage.sweep(max_age_seconds=3600)
+
+        assert asyncio.run(scenario()) == (1, 1)
+        assert os.listdir(tmp_path) == ["held.mp4"]
+
+    def test_orphans_left_by_a_quick_restart_are_swept_once_old_enough(self, tmp_path):
+        storage = TempStorage(str(tmp_path), budget_bytes=100, wait_seconds=1)
+        (tmp_path / "orphan.mp4").write_bytes(b"x")
+
+        async def scenario():
+            sweeper = asyncio.create_task(storage.run_sweeper(max_age_seconds=0, interval=0.01))
+            await asyncio.sleep(0.2)
+            sweeper.cancel()
+
+        asyncio.run(scenario())
+
+        assert os.listdir(tmp_path) == []
+
+
+@patch("routers.videos.download_video")
+def test_a_full_disk_budget_is_a_503_and_costs_nothing(mock_download):
+    recorder = AsyncMock()
+
+    with patch("routers.videos.temp_storage.reserve", new=AsyncMock(side_effect=TempStorageFullError())), \
+         patch("routers.videos.record_event", new=recorder):
+        response = client.post("/videos/analyze", json={"url": "https://x.com/user/status/123"})
+
+    assert response.status_code == 503
+    mock_download.assert_not_called()
+    recorder.assert_not_called()
@@ -0,0 +1,217 @@
+"""Tests for the in-process mirror of the fts column."""
+import asyncio
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from services.archive import ArchiveMirror
+from services.text_index import RRF_K, TextIndex, fold, parse_query
+
+client = TestClient(app)
+
+
+def _video(video_id, titulo="", descricao="", meta=None):
+    return {
+        "id": video_id,
+        "created_at": "2026-08-11T12:00:00+00:00",
+        "titulo_video": titulo,
+        "descricao_completa": descricao,
+        "url_original": f"https://x.com/u/status/{video_id}",
+        "metadados_estruturados": meta or {},
+    }
+
+
+def _index(*rows):
+    index = TextIndex()
+    index.add(list(rows))
+    index.ready = True
+    return index
+
+
+def _ids(results):
+    return [row["id"] for row in results]
+
+
+class TestNormalisation:
+    """Accents and inflection are normalised on both sides, as in
+    portuguese_unaccent."""
+
+    def test_folds_accents(self):
+        assert fold("Música Ação") == "musica acao"
+
+    def test_unaccented_query_finds_accented_text(self):
+        index = _index(_video("1", titulo="Show de música ao vivo"))
+
+        assert _ids(index.search("musica", 5)) == ["1"]
+
+    def test_inflections_share_a_stem(self):
+        index = _index(_video("1", descricao="Dois gatos correndo pela sala"))
+
+        assert _ids(index.search("gato", 5)) == ["1"]
+
+    def test_stopwords_alone_match_nothing(self):
+        index = _index(_video("1", titulo="O gato e a casa"))
+
+        assert index.search("o e a", 5) == []
+
+
+class TestWeighting:
+
+    def test_title_outranks_description_outranks_metadata(self):
+        index = _index(
+            _video("meta", titulo="Vídeo qualquer", meta={"elementos_cenario": ["capivara"]}),
+            _video("desc", titulo="Vídeo qualquer", descricao="Uma capivara no rio"),
+            _video("title", titulo="Capivara nadando"),
+        )
+
+        results = index.search("capivara", 5)
+
+        assert _ids(results) == ["title", "desc", "meta"]
+        assert results[0]["text_rank"] == pytest.approx(1.0)
+        assert results[0]["score"] == pytest.approx(1 / (RRF_K + 1))
+        assert results[0]["similarity"] == 0.0
+
+    def test_indexes_the_same_metadata_values_as_the_fts_column(self):
+        index = _index(_video("1", meta={
+            "pessoas": [{"descricao": "Mulher de chapéu", "papel": None}],
+            "audio": {"transcricao": "bom dia", "musica": "Evidências", "artista": "Chitãozinho"},
+        }))
+
+        for query in ("chapeu", "bom dia", "evidencias", "chitaozinho"):
+            assert _ids(index.search(query, 5)) == ["1"], query
+
+
+class TestWebsearchSyntax:
+    """Same grammar as websearch_to_tsquery: words AND, "phrases", -term, or."""
+
+    @pytest.fixture
+    def index(self):
+        return _index(
+            _video("1", titulo="Gato laranja comendo ração"),
+            _video("2", titulo="Gato preto dormindo"),
+            _video("3", titulo="Cachorro laranja correndo"),
+        )
+
+    def test_words_are_anded(self, index):
+        assert _ids(index.search("gato laranja", 5)) == ["1"]
+
+    def test_or_separates_alternatives(self, index):
+        assert sorted(_ids(index.search("preto or cachorro", 5))) == ["2", "3"]
+
+    def test_minus_excludes(self, index):
+        assert _ids(index.search("gato -laranja", 5)) == ["2"]
+
+    def test_quoted_phrase_requires_adjacency(self, index):
+        assert _ids(index.search('"gato laranja"', 5)) == ["1"]
+        assert index.search('"laranja gato"', 5) == []
+
+    def test_phrase_keeps_the_gap_of_a_stopword(self):
+        index = _index(_video("1", titulo="Copo de leite"), _video("2", titulo="Copo leite"))
+
+        assert _ids(index.search('"copo de leite"', 5)) == ["1"]
+
+    def test_parser_never_fails_on_junk(self):
+        assert parse_query("%%% *** or") == []
+        assert len(parse_query('"gato laranja')) == 1
+
+    def test_limit_is_honoured(self, index):
+        assert len(index.search("gato or cachorro", 2)) == 2
+
+
+class TestSync:
+
+    def test_a_mirror_without_add_fails_at_construction(self):
+        class Incomplete(ArchiveMirror):
+            def __len__(self):
+                return 0
+
+        with pytest.raises(TypeError):
+            Incomplete()
+
+    def test_rows_seen_twice_are_indexed_once(self):
+        index = _index(_video("1", titulo="Capivara"))
+        index.add([_video("1", titulo="Capivara")])
+
+        assert len(index.search("capivara", 5)) == 1
+
+    def test_sync_pulls_rows_past_the_watermark(self):
+        index = TextIndex()
+
+        with patch("services.archive.fetch_videos_since", return_value=[_video("1", titulo="Capivara")]) as fetch:
+            asyncio.run(index.sync())
+
+        assert fetch.call_args.args[0] == TextIndex.columns
+        assert index.ready
+        assert _ids(index.search("capivara", 5)) == ["1"]
+
+
+@patch("routers.search.supabase")
+@patch("routers.search.embed_query")
+def test_text_mode_is_answered_locally(mock_embed, mock_supabase):
+    index = _index(_video("1", titulo="Capivara nadando"))
+
+    with patch("routers.search.text_index", index), \
+         patch.object(index, "is_stale", return_value=False):
+        response = client.post("/search", json={"query": "capivara", "mode": "text"})
+
+    assert response.status_code == 200
+    assert _ids(response.json()) == ["1"]
+    mock_embed.assert_not_called()
+    mock_supabase.rpc.assert_not_called()
+
+
+@patch("routers.search.supabase")
+@patch("routers.search.embed_query")
+def test_hybrid_falls_back_to_the_text_index_when_postgres_fails(mock_embed, mock_supabase):
+    index = _index(_video("1", titulo="Capivara nadando"))
+    mock_embed.return_value = [0.1, 0.2, 0.3]
+    mock_supabase.rpc.return_value.execute.side_effect = TimeoutError("statement timeout")
+
+    with patch("routers.search.text_index", index), \
+         patch.object(index, "is_stale", return_value=False):
+        response = client.post("/search", json={"query": "capivara"})
+
+    assert response.status_code == 200
+    assert _ids(response.json()) == ["1"]
+
+
+@patch("routers.search.supabase")
+@patch("routers.search.embed_query")
+def test_semantic_search_does_not_fall_back_to_words(mock_embed, mock_supabase):
+    index = _index(_video("1", titulo="Capivara nadando"))
+    mock_embed.return_value = [0.1, 0.2, 0.3]
+    mock_supabase.rpc.return_value.execute.side_effect = TimeoutError("statement timeout")
+
+    with patch("routers.search.text_index", index):
+        response = client.post("/search", json={"query": "capivara", "mode": "semantic"})
+
+    assert response.status_code == 500
+
+
+@patch("routers.search.SEARCH_RPC_TIMEOUT_SECONDS", 0.01)
+@patch("routers.search.supabase")
+@patch("routers.search.embed_query")
+def test_slow_semantic_search_is_not_timed_out(mock_embed, mock_supabase):
+    """The RPC timeout exists to fall back on the text index; a semantic search
+    has nothing to fall back on, so it must wait for the slow answer."""
+    index = _index(_video("1", titulo="Capivara nadando"))
+    mock_embed.return_value = [0.1, 0.2, 0.3]
+
+    def slow_execute():
+        time.sleep(0.1)
+        return MagicMock(data=[{
+            "id": "2", "titulo_video": "Roedor no rio", "descricao_completa": "",
+            "url_original": "https://x.com/u/status/2", "similarity": 0.9,
+            "text_rank": 0.0, "score": 0.9,
+        }])
+
+    mock_supabase.rpc.return_value.execute.side_effect = slow_execute
+
+    with patch("routers.search.text_index", index):
+        response = client.post("/search", json={"query": "roedor lento", "mode": "semantic"})
+
+    assert response.status_code == 200
+    assert _ids(response.json()) == ["2"]
@@ -1,7 +1,7 @@
 from fastapi.testclient import TestClient
-from unittest.mock import patch, MagicMock
+from unittest.mock import AsyncMock, patch, MagicMock
 from main import app
-from core.exceptions import validate_video_url, ALLOWED_DOMAINS, ContentBlockedError
+from core.exceptions import validate_video_url, extract_tweet_id, ALLOWED_DOMAINS, ContentBlockedError
 
 client = TestClient(app)
 
@@ -46,6 +46,62 @@ class TestURLValidation:
         assert "youtu.be" not in message.lower()
 
 
+class TestTweetId:
+    """Every URL form of a tweet must reduce to the same ID, or duplicates
+    slip past the check before the download."""
+
+    def test_the_forms_of_one_tweet_agree(self):
+        urls = [
+            "https://x.com/user/status/1234567890",
+            "https://twitter.com/user/status/1234567890?s=20&t=abc",
+            "https://mobile.twitter.com/User/status/1234567890/",
+            "https://www.x.com/user/status/1234567890/video/1",
+            "https://x.com/i/status/1234567890",
+            "https://twitter.com/i/web/status/1234567890",
+        ]
+
+        assert {extract_tweet_id(url) for url in urls} == {"1234567890"}
+
+    def test_non_status_urls_have_no_id(self):
+        assert extract_tweet_id("https://x.com/user") is None
+        assert extract_tweet_id("https://x.com/search?q=status/123") is None
+        assert extract_tweet_id("https://example.com/user/status/123") is None
+
+
+class TestDuplicateAnalysis:
+
+    EXISTING = {
+        "id": "abc",
+        "created_at": "2026-08-11T12:00:00+00:00",
+        "titulo_video": "Já arquivado",
+        "url_original": "https://twitter.com/user/status/123",
+    }
+
+    @patch("routers.videos.analyze_video_content")
+    @patch("routers.videos.download_video")
+    def test_a_known_tweet_is_returned_without_downloading(self, mock_download, mock_analyze):
+        with patch("routers.videos.find_video_by_tweet_id", new=AsyncMock(return_value=self.EXISTING)) as find, \
+             patch("routers.videos.get_quota") as quota:
+            response = client.post("/videos/analyze", json={"url": "https://x.com/other/status/123?s=20"})
+
+        assert response.status_code == 409
+        assert response.json()["video"] == self.EXISTING
+        find.assert_awaited_once_with("123")
+        mock_download.assert_not_called()
+        mock_analyze.assert_not_called()
+        quota.assert_not_called()
+
+    @patch("routers.videos.analyze_video_content")
+    @patch("routers.videos.download_video")
+    def test_a_failed_check_does_not_block_the_analysis(self, mock_download, mock_analyze):
+        mock_download.side_effect = Exception("stop here")
+
+        with patch("routers.videos.find_video_by_tweet_id", new=AsyncMock(side_effect=Exception("db down"))):
+            client.post("/videos/analyze", json={"url": "https://x.com/user/status/123"})
+
+        mock_download.assert_called_once()
+
+
 class TestAnalysisDefaults:
 
     @patch("routers.videos.analyze_video_content")
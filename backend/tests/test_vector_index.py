@@ -0,0 +1,165 @@
+"""Tests for the in-process mirror of videos.embedding."""
+import asyncio
+import json
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from services.vector_index import RRF_K, VectorIndex, candidate_pool
+
+client = TestClient(app)
+
+DIMENSIONS = 4
+
+
+def _row(video_id, vector, created_at="2026-08-11T12:00:00+00:00"):
+    # Sent the way PostgREST sends a vector column: as its text form.
+    return {"id": video_id, "created_at": created_at, "embedding": json.dumps(vector)}
+
+
+def _index(*rows):
+    index = VectorIndex(dimensions=DIMENSIONS)
+    index.add(list(rows))
+    index.ready = True
+    return index
+
+
+class TestSearch:
+
+    def test_ranks_by_cosine_similarity(self):
+        index = _index(
+            _row("far", [0, 1, 0, 0]),
+            _row("near", [1, 0.1, 0, 0]),
+            _row("exact", [2, 0, 0, 0]),
+        )
+
+        hits = index.search([1, 0, 0, 0], threshold=-1.0, match_count=3)
+
+        assert [hit.id for hit in hits] == ["exact", "near", "far"]
+        assert hits[0].similarity == pytest.approx(1.0)
+        assert hits[2].similarity == pytest.approx(0.0, abs=1e-6)
+
+    def test_matches_a_brute_force_computation(self):
+        rng = np.random.default_rng(7)
+        vectors = rng.normal(size=(300, DIMENSIONS))
+        index = _index(*[_row(str(i), v.tolist()) for i, v in enumerate(vectors)])
+        query = rng.normal(size=DIMENSIONS)
+
+        hits = index.search(query.tolist(), threshold=-1.0, match_count=10)
+
+        expected = vectors @ query / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(query))
+        assert [hit.id for hit in hits] == [str(i) for i in np.argsort(-expected)[:10]]
+
+    def test_threshold_filters_but_keeps_the_rpc_rank(self):
+        """Scores must match match_videos, where rank counts every candidate
+        in the pool, including the ones the threshold later removes."""
+        index = _index(
+            _row("a", [1, 0, 0, 0]),
+            _row("b", [1, 1, 0, 0]),
+            _row("c", [0, 1, 0, 0]),
+        )
+
+        hits = index.search([1, 0, 0, 0], threshold=0.5, match_count=5)
+
+        assert [hit.id for hit in hits] == ["a", "b"]
+        assert hits[1].rank == 2
+        assert hits[1].score == pytest.approx(1 / (RRF_K + 2))
+
+    def test_candidate_pool_mirrors_the_rpc(self):
+        assert candidate_pool(5) == 20
+        assert candidate_pool(50) == 200
+        assert candidate_pool(0) == 4
+
+
+class TestSync:
+
+    def test_rows_seen_twice_are_indexed_once(self):
+        index = _index(_row("a", [1, 0, 0, 0]))
+
+        assert index.add([_row("a", [1, 0, 0, 0]), _row("b", [0, 1, 0, 0])]) == 1
+        assert len(index) == 2
+
+    def test_rows_without_a_usable_embedding_are_skipped(self):
+        index = _index({"id": "none", "created_at": "2026-08-11", "embedding": None}, _row("short", [1, 0]))
+
+        assert len(index) == 0
+
+    def test_sync_asks_only_for_rows_past_the_watermark(self):
+        index = VectorIndex(dimensions=DIMENSIONS)
+        fetch = MagicMock(side_effect=[
+            [_row("a", [1, 0, 0, 0], "2026-08-11T10:00:00+00:00")],
+            [_row("a", [1, 0, 0, 0], "2026-08-11T10:00:00+00:00"),
+             _row("b", [0, 1, 0, 0], "2026-08-11T11:00:00+00:00")],
+        ])
+
+        with patch("services.archive.fetch_videos_since", fetch):
+            asyncio.run(index.sync())
+            added = asyncio.run(index.sync())
+
+        assert added == 1
+        assert fetch.call_args_list[0].args[1] is None
+        assert fetch.call_args_list[1].args[1] == "2026-08-11T10:00:00+00:00"
+        assert index.watermark == "2026-08-11T11:00:00+00:00"
+
+    def test_a_burst_of_stale_searches_pulls_once(self):
+        """Each queued search re-pulling in turn would put N round trips in
+        front of the last one."""
+        index = VectorIndex(dimensions=DIMENSIONS)
+        fetch = MagicMock(return_value=[_row("a", [1, 0, 0, 0])])
+
+        async def burst():
+            await asyncio.gather(*(index.refresh_if_stale() for _ in range(10)))
+
+        with patch("services.archive.fetch_videos_since", fetch):
+            asyncio.run(burst())
+
+        assert fetch.call_count == 1
+        assert len(index) == 1
+
+    def test_a_save_makes_the_index_stale(self):
+        from services.archive import bump_generation
+
+        index = VectorIndex(dimensions=DIMENSIONS)
+        with patch("services.archive.fetch_videos_since", return_value=[]):
+            asyncio.run(index.sync())
+
+        assert not index.is_stale()
+        bump_generation()
+        assert index.is_stale()
+
+
+@patch("routers.search.supabase")
+@patch("routers.search.embed_query")
+def test_semantic_search_is_answered_by_the_index(mock_embed, mock_supabase):
+    index = _index(_row("v1", [1, 0, 0, 0]), _row("v2", [0, 1, 0, 0]))
+    mock_embed.return_value = [1, 0, 0, 0]
+    mock_supabase.table.return_value.select.return_value.in_.return_value.execute.return_value.data = [
+        {"id": "v1", "titulo_video": "Capivara", "descricao_completa": None, "url_original": "https://x.com/a/status/1"},
+    ]
+
+    with patch("routers.search.vector_index", index), \
+         patch.object(index, "is_stale", return_value=False):
+        response = client.post("/search", json={"query": "capivara", "mode": "semantic", "threshold": 0.5})
+
+    assert response.status_code == 200
+    data = response.json()
+    assert [row["id"] for row in data] == ["v1"]
+    assert data[0]["similarity"] == pytest.approx(1.0)
+    assert data[0]["score"] == pytest.approx(1 / (RRF_K + 1))
+    mock_supabase.rpc.assert_not_called()
+
+
+@patch("routers.search.supabase")
+@patch("routers.search.embed_query")
+def test_hybrid_search_still_goes_to_postgres(mock_embed, mock_supabase):
+    index = _index(_row("v1", [1, 0, 0, 0]))
+    mock_embed.return_value = [1, 0, 0, 0]
+    mock_supabase.rpc.return_value.execute.return_value.data = []
+
+    with patch("routers.search.vector_index", index):
+        client.post("/search", json={"query": "capivara", "mode": "hybrid"})
+
+    mock_supabase.rpc.assert_called_once()